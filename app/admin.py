@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse, path
 from django.shortcuts import render
-from django.db.models import Sum, Count, Q, Avg
+from django.db import transaction
+from django.db.models import Sum, F, DecimalField
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
@@ -10,8 +11,11 @@ from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 from .models import (
     Product, Customer, Order, OrderItem, PromoCode, Promoter,
-    Newsletter, Referral, LoyaltyPoint, OrderQRCode, HeroSlide
+    Newsletter, Referral, LoyaltyPoint, OrderQRCode, HeroSlide, TelegramMessage, TelegramUpdate,
+    DailySales, DailyProductSales
 )
+from .utils.dashboard_stats import invalidate_dashboard_counts
+from .utils.sales_rollup import ORDER_STATE_FIELDS, record_orders_status_change
 
 
 # ========== IMPORT/EXPORT RESOURCES ==========
@@ -256,13 +260,21 @@ class OrderAdmin(admin.ModelAdmin):
     def confirm_cod_payment(self, request, queryset):
         """Admin action to confirm COD payment received"""
         from django.utils import timezone
-        cod_orders = queryset.filter(payment_method='Cash on Delivery', payment_received=False)
-        count = cod_orders.update(
-            payment_received=True,
-            payment_received_at=timezone.now(),
-            payment_received_by=request.user.username,
-            status='confirmed'  # Move to confirmed when payment received
-        )
+        with transaction.atomic():
+            # Lock and load the rollup fields first - update() skips the rollup signals too
+            orders = list(queryset.filter(
+                payment_method='Cash on Delivery', payment_received=False
+            ).select_for_update().only(*ORDER_STATE_FIELDS))
+            count = Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+                payment_received=True,
+                payment_received_at=timezone.now(),
+                payment_received_by=request.user.username,
+                status='confirmed',  # Move to confirmed when payment received
+                updated_at=timezone.now()  # update() skips auto_now - dashboards sync on updated_at
+            )
+            record_orders_status_change(orders, 'confirmed')
+        # update() skips model signals - recount dashboard columns on next read
+        invalidate_dashboard_counts()
         self.message_user(request, f'{count} COD order(s) marked as payment received.')
     confirm_cod_payment.short_description = "Confirm COD Payment Received"
     
@@ -273,7 +285,8 @@ class OrderAdmin(admin.ModelAdmin):
         count = cod_orders.update(
             payment_received=True,
             payment_received_at=timezone.now(),
-            payment_received_by=request.user.username
+            payment_received_by=request.user.username,
+            updated_at=timezone.now()  # update() skips auto_now - dashboards sync on updated_at
         )
         self.message_user(request, f'{count} COD order(s) marked as paid.')
     mark_cod_paid.short_description = "Mark COD as Paid"
@@ -300,56 +313,68 @@ class OrderAdmin(admin.ModelAdmin):
             start = today - timedelta(days=30)
             end = today
         
-        # Filter orders by date range
-        orders = Order.objects.filter(created_at__date__gte=start, created_at__date__lte=end)
+        # Read the daily rollups (app/utils/sales_rollup.py) - cost depends on days, not orders
+        sales = DailySales.objects.filter(date__gte=start, date__lte=end)
         
-        # Calculate statistics
-        total_orders = orders.count()
-        total_revenue = orders.aggregate(Sum('total'))['total__sum'] or Decimal('0.00')
-        total_subtotal = orders.aggregate(Sum('subtotal'))['subtotal__sum'] or Decimal('0.00')
-        total_discount = orders.aggregate(Sum('discount_amount'))['discount_amount__sum'] or Decimal('0.00')
-        total_shipping = orders.aggregate(Sum('shipping_fee'))['shipping_fee__sum'] or Decimal('0.00')
-        average_order_value = orders.aggregate(Avg('total'))['total__avg'] or Decimal('0.00')
+        # Calculate statistics (one query)
+        totals = sales.aggregate(
+            total_orders=Sum('orders'),
+            total_revenue=Sum('total'),
+            total_subtotal=Sum('subtotal'),
+            total_discount=Sum('discount_amount'),
+            total_shipping=Sum('shipping_fee'),
+        )
+        total_orders = totals['total_orders'] or 0
+        total_revenue = totals['total_revenue'] or Decimal('0.00')
+        total_subtotal = totals['total_subtotal'] or Decimal('0.00')
+        total_discount = totals['total_discount'] or Decimal('0.00')
+        total_shipping = totals['total_shipping'] or Decimal('0.00')
+        average_order_value = total_revenue / total_orders if total_orders else Decimal('0.00')
         
         # Orders by status
-        orders_by_status = orders.values('status').annotate(
-            count=Count('id'),
+        orders_by_status = sales.values('status').annotate(
+            count=Sum('orders'),
             total=Sum('total')
         ).order_by('-count')
         
         # Orders by payment method
-        orders_by_payment = orders.values('payment_method').annotate(
-            count=Count('id'),
+        orders_by_payment = sales.values('payment_method').annotate(
+            count=Sum('orders'),
             total=Sum('total')
         ).order_by('-count')
         
         # Top products
-        top_products = OrderItem.objects.filter(
-            order__created_at__date__gte=start,
-            order__created_at__date__lte=end
+        top_products = DailyProductSales.objects.filter(
+            date__gte=start,
+            date__lte=end
         ).values('product_name').annotate(
             quantity=Sum('quantity'),
-            revenue=Sum('subtotal')
+            revenue=Sum('revenue')
         ).order_by('-revenue')[:10]
         
-        # Daily sales (last 30 days)
+        # Daily sales - one grouped query, days without orders filled in with zeros
+        sales_by_day = {
+            row['date']: row
+            for row in sales.values('date').annotate(
+                total=Sum('total'),
+                count=Sum('orders')
+            ).order_by('date')
+        }
         daily_sales = []
         current_date = start
         while current_date <= end:
-            day_orders = orders.filter(created_at__date=current_date)
-            day_total = day_orders.aggregate(Sum('total'))['total__sum'] or Decimal('0.00')
-            day_count = day_orders.count()
+            day = sales_by_day.get(current_date)
             daily_sales.append({
                 'date': current_date,
-                'total': day_total,
-                'count': day_count
+                'total': day['total'] if day else Decimal('0.00'),
+                'count': day['count'] if day else 0
             })
             current_date += timedelta(days=1)
         
         # All-time statistics
-        all_time_orders = Order.objects.all()
-        all_time_revenue = all_time_orders.aggregate(Sum('total'))['total__sum'] or Decimal('0.00')
-        all_time_count = all_time_orders.count()
+        all_time = DailySales.objects.aggregate(revenue=Sum('total'), count=Sum('orders'))
+        all_time_revenue = all_time['revenue'] or Decimal('0.00')
+        all_time_count = all_time['count'] or 0
         
         context = {
             'title': 'Sales Report',
@@ -388,45 +413,53 @@ class OrderAdmin(admin.ModelAdmin):
         
         # Get all promoters
         from .models import Promoter
-        promoters = Promoter.objects.all()
+        all_promoters = list(Promoter.objects.all())
+        promoters = [p for p in all_promoters if str(p.id) == promoter_id] if promoter_id else all_promoters
+        sales = DailySales.objects.filter(promo_code__promoter__isnull=False)
+        promo_codes = PromoCode.objects.filter(promoter__isnull=False)
         if promoter_id:
-            promoters = promoters.filter(id=promoter_id)
+            sales = sales.filter(promo_code__promoter__in=promoters)
+            promo_codes = promo_codes.filter(promoter__in=promoters)
+        
+        # Orders, revenue and commission per promo code in one grouped query over the
+        # daily rollups, with the commission computed in SQL
+        codes_stats = sales.filter(
+            date__gte=start,
+            date__lte=end,
+            status__in=['confirmed', 'processing', 'shipped', 'delivered']
+        ).values('promo_code__promoter', 'promo_code__code').annotate(
+            count=Sum('orders'),
+            revenue=Sum('total'),
+            commission=Sum(
+                F('total') * F('promo_code__promoter__commission_rate') / 100,
+                output_field=DecimalField(max_digits=14, decimal_places=2)
+            )
+        ).order_by('promo_code__code')
+        
+        # Every code of the selected promoters is listed, used or not
+        codes_used = {promoter.id: {} for promoter in promoters}
+        for promoter_pk, code in promo_codes.order_by('code').values_list('promoter', 'code'):
+            codes_used[promoter_pk][code] = {
+                'count': 0,
+                'revenue': Decimal('0.00'),
+                'commission': Decimal('0.00')
+            }
+        for row in codes_stats:
+            codes_used[row['promo_code__promoter']][row['promo_code__code']] = {
+                'count': row['count'],
+                'revenue': row['revenue'] or Decimal('0.00'),
+                'commission': row['commission'] or Decimal('0.00')
+            }
         
-        # Calculate commission for each promoter
         promoter_data = []
         for promoter in promoters:
-            orders = Order.objects.filter(
-                promo_code__promoter=promoter,
-                created_at__date__gte=start,
-                created_at__date__lte=end,
-                status__in=['confirmed', 'processing', 'shipped', 'delivered']
-            )
-            
-            total_orders = orders.count()
-            total_revenue = orders.aggregate(Sum('total'))['total__sum'] or Decimal('0.00')
-            total_commission = Decimal('0.00')
-            
-            for order in orders:
-                commission = (order.total * promoter.commission_rate) / 100
-                total_commission += commission
-            
-            # Get promo codes for this promoter
-            promo_codes = promoter.promo_codes.all()
-            codes_used = {}
-            for code in promo_codes:
-                code_orders = orders.filter(promo_code=code)
-                codes_used[code.code] = {
-                    'count': code_orders.count(),
-                    'revenue': code_orders.aggregate(Sum('total'))['total__sum'] or Decimal('0.00'),
-                    'commission': sum([(o.total * promoter.commission_rate) / 100 for o in code_orders])
-                }
-            
+            codes = codes_used[promoter.id]
             promoter_data.append({
                 'promoter': promoter,
-                'total_orders': total_orders,
-                'total_revenue': total_revenue,
-                'total_commission': total_commission,
-                'codes_used': codes_used
+                'total_orders': sum(stats['count'] for stats in codes.values()),
+                'total_revenue': sum((stats['revenue'] for stats in codes.values()), Decimal('0.00')),
+                'total_commission': sum((stats['commission'] for stats in codes.values()), Decimal('0.00')),
+                'codes_used': codes
             })
         
         # Total commission across all promoters
@@ -438,7 +471,7 @@ class OrderAdmin(admin.ModelAdmin):
             'start_date': start,
             'end_date': end,
             'promoter_id': promoter_id,
-            'promoters': Promoter.objects.all(),
+            'promoters': all_promoters,
             'promoter_data': promoter_data,
             'total_all_commission': total_all_commission,
             'total_all_revenue': total_all_revenue,
@@ -544,6 +577,22 @@ class OrderQRCodeAdmin(admin.ModelAdmin):
     is_valid.short_description = 'Valid'
 
 
+@admin.register(TelegramMessage)
+class TelegramMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'method', 'chat_id', 'status', 'attempts', 'created_at', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'method', 'created_at']
+    search_fields = ['chat_id', 'last_error']
+    readonly_fields = ['chat_id', 'method', 'payload', 'attempts', 'last_error', 'created_at', 'sent_at']
+
+
+@admin.register(TelegramUpdate)
+class TelegramUpdateAdmin(admin.ModelAdmin):
+    list_display = ['update_id', 'chat_id', 'status', 'created_at', 'processed_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['update_id', 'chat_id', 'last_error']
+    readonly_fields = ['update_id', 'chat_id', 'payload', 'last_error', 'created_at', 'processed_at']
+
+
 @admin.register(HeroSlide)
 class HeroSlideAdmin(admin.ModelAdmin):
     list_display = ['title', 'slide_type', 'order', 'is_active', 'media_preview', 'created_at']
@@ -560,6 +609,11 @@ class HeroSlideAdmin(admin.ModelAdmin):
             'fields': ('image', 'video', 'external_url', 'media_preview'),
             'description': 'Upload image/video OR provide external URL based on slide type'
         }),
+        ('Video Renditions', {
+            'fields': ('poster', 'video_mp4', 'video_webm'),
+            'description': 'Generated from the uploaded video by running: python manage.py process_hero_videos',
+            'classes': ('collapse',)
+        }),
     )
     
     def media_preview(self, obj):
@@ -1,52 +1,127 @@
 """
 WebSocket Consumers for Real-Time Order Updates
 Optimized for 1000+ concurrent connections
+
+Clients choose what they receive with subscription topics (see app/utils/ws_topics.py):
+- initial topics in the query string: /ws/orders/?topics=status:ready,order:MD00042
+  (default: 'all', which is what the employee dashboard uses)
+- {"type": "subscribe", "topics": [...]} / {"type": "unsubscribe", "topics": [...]}
+  answered with {"type": "subscribed", "topics": [current topics], "invalid": [...]}
+
+Order events carry a seq from the event log (app/utils/event_log.py). A client
+that reconnects with ?last_seq=<seq> first gets the events it missed (for its
+topics), or {"type": "resync", "seq": <current seq>} when they are no longer
+retained.
+
+Clients that connect with ?format=compact get each order in full only the first
+time; after that an order is sent as {"order_id": ..., "changes": {changed fields}}
+against the last snapshot sent on that connection. It is meant for clients that
+apply the changes themselves; the employee dashboard re-fetches changed orders
+from the delta API instead and uses the default format.
+
+Events are held for COALESCE_WINDOW per connection: events for the same order are
+merged and everything pending goes out as one frame - the event itself when there
+is only one, otherwise {"type": "batch", "events": [...]}.
 """
+import asyncio
 import json
+import logging
+from collections import OrderedDict
+from urllib.parse import parse_qs
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from .models import Order, OrderItem
+from .utils.event_log import event_for_groups, event_log
+from .utils.order_snapshot import STATUS_DISPLAY, diff_snapshot, dumps, encode_order_event
+from .utils.order_tracking import TRACKING_FIELDS, read_tracking_token, tracking_update
+from .utils.ws_connections import connection_tracker, tracking_connection_tracker, LEASE_RENEW_INTERVAL
+from .utils.ws_topics import ALL_TOPIC, topic_group
+
+logger = logging.getLogger(__name__)
 
 
 class OrderConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for order updates - with connection limits for scalability"""
     
-    # Maximum concurrent WebSocket connections (prevents resource exhaustion)
-    MAX_CONNECTIONS = 100
+    # Maximum concurrent WebSocket connections across all workers (prevents resource exhaustion)
+    MAX_CONNECTIONS = getattr(settings, 'WEBSOCKET_MAX_CONNECTIONS', 100)
     
-    # Track connections (in production, use Redis for distributed tracking)
-    _connection_count = 0
+    # Subscription topics per connection
+    MAX_TOPICS = 50
+    
+    # Recent event ids remembered to drop copies delivered via overlapping topics
+    SEEN_EVENTS_SIZE = 128
+    
+    # Outbound buffer: seconds to hold events, and pending orders that force an early flush
+    COALESCE_WINDOW = getattr(settings, 'WEBSOCKET_COALESCE_WINDOW', 0.075)
+    COALESCE_MAX_ORDERS = 500
+    
+    # Missed events replayed on reconnect; beyond this the client resyncs
+    REPLAY_LIMIT = 1000
+    
+    # Compact mode: orders whose last snapshot is remembered per connection
+    COMPACT_KNOWN_ORDERS = 500
     
     async def connect(self):
         """Called when WebSocket connection is established"""
-        # Check connection limit to prevent resource exhaustion
-        if OrderConsumer._connection_count >= self.MAX_CONNECTIONS:
+        self.accepted = False
+        self.topics = {}  # topic -> channel layer group
+        self._seen_events = OrderedDict()  # event_id -> order ids already sent
+        self._pending = OrderedDict()  # order id -> coalesced event waiting for the flush
+        self._flush_task = None
+        self._lease_task = None
+        self._replayed_seq = None  # live events up to this seq were already replayed
+        self._known = None  # compact mode: order id -> last snapshot sent
+        
+        # Check connection limit to prevent resource exhaustion (leases shared via Redis)
+        if not await connection_tracker.acquire(self.channel_name, self.MAX_CONNECTIONS):
             # Reject connection if limit reached
             await self.close(code=4001)  # Custom close code: Too Many Connections
-            print(f"WebSocket connection rejected: limit reached ({OrderConsumer._connection_count}/{self.MAX_CONNECTIONS})")
+            logger.warning(f"WebSocket connection rejected: limit of {self.MAX_CONNECTIONS} reached")
             return
         
-        # Join the 'orders_updates' group
-        self.group_name = 'orders_updates'
+        # Join the groups of the requested topics ('all' by default)
+        query = parse_qs(self.scope.get('query_string', b'').decode('utf-8', 'ignore'))
+        requested = [topic for value in query.get('topics', []) for topic in value.split(',') if topic]
+        await self._subscribe(requested or [ALL_TOPIC])
+        if query.get('format', [''])[0] == 'compact':
+            self._known = OrderedDict()
         
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
-        
-        OrderConsumer._connection_count += 1
+        self.accepted = True
         await self.accept()
-        print(f"WebSocket connected: {self.channel_name} (Total: {OrderConsumer._connection_count}/{self.MAX_CONNECTIONS})")
+        self._lease_task = asyncio.create_task(self._renew_lease())
+        
+        # Live events queue up behind connect(), so replaying here can't interleave with them
+        last_seq = query.get('last_seq', [''])[0]
+        if last_seq.isdigit():
+            await self._replay(int(last_seq))
+        logger.info(f"WebSocket connected: {self.channel_name}")
     
     async def disconnect(self, close_code):
         """Called when WebSocket connection is closed"""
-        # Leave the 'orders_updates' group
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
-        OrderConsumer._connection_count = max(0, OrderConsumer._connection_count - 1)
-        print(f"WebSocket disconnected: {self.channel_name} (Total: {OrderConsumer._connection_count}/{self.MAX_CONNECTIONS})")
+        # Rejected connections never took a lease or joined the group
+        if not getattr(self, 'accepted', False):
+            return
+        self.accepted = False
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        
+        # Leave every subscribed group
+        await self._unsubscribe(list(self.topics))
+        await connection_tracker.release(self.channel_name)
+        logger.info(f"WebSocket disconnected: {self.channel_name} (code {close_code})")
+    
+    async def _renew_lease(self):
+        """Keep this connection's lease alive; it expires on its own if the worker dies"""
+        try:
+            while True:
+                await asyncio.sleep(LEASE_RENEW_INTERVAL)
+                await connection_tracker.renew(self.channel_name)
+        except asyncio.CancelledError:
+            pass
     
     async def receive(self, text_data):
         """Called when message is received from WebSocket"""
@@ -59,32 +134,286 @@ class OrderConsumer(AsyncWebsocketConsumer):
                 await self.send(text_data=json.dumps({
                     'type': 'pong'
                 }))
+            elif message_type in ('subscribe', 'unsubscribe'):
+                topics = data.get('topics')
+                if not isinstance(topics, list):
+                    topics = []
+                if message_type == 'subscribe':
+                    invalid = await self._subscribe(topics)
+                else:
+                    invalid = await self._unsubscribe(topics)
+                await self.send(text_data=json.dumps({
+                    'type': 'subscribed',
+                    'topics': sorted(self.topics),
+                    'invalid': invalid,
+                }))
         except json.JSONDecodeError:
             pass
     
+    async def _subscribe(self, topics):
+        """Join the groups of valid topics; returns the rejected topics"""
+        invalid = []
+        for topic in topics:
+            group = topic_group(topic) if isinstance(topic, str) else None
+            if group is None or (topic not in self.topics and len(self.topics) >= self.MAX_TOPICS):
+                invalid.append(topic)
+                continue
+            if topic not in self.topics:
+                await self.channel_layer.group_add(group, self.channel_name)
+                self.topics[topic] = group
+        return invalid
+    
+    async def _unsubscribe(self, topics):
+        """Leave the groups of subscribed topics; returns topics that weren't subscribed"""
+        invalid = []
+        for topic in topics:
+            group = self.topics.pop(topic, None) if isinstance(topic, str) else None
+            if group is None:
+                invalid.append(topic)
+                continue
+            await self.channel_layer.group_discard(group, self.channel_name)
+        return invalid
+    
+    async def _replay(self, last_seq):
+        """Queue the events after last_seq for this connection's topics, or ask for a resync"""
+        current, records = await event_log.read_since(last_seq, self.REPLAY_LIMIT)
+        if records is None:
+            await self.send(text_data=json.dumps({'type': 'resync', 'seq': current}))
+            return
+        
+        groups = set(self.topics.values())
+        for seq, record in records:
+            event = event_for_groups(record, groups)
+            if event is not None:
+                await self._send_event({**event, 'seq': seq})
+        self._replayed_seq = current
+    
+    async def _send_event(self, event):
+        """
+        Queue an order event once per connection
+
+        The same event arrives once per subscribed group it was published to; bulk
+        events can carry different orders per group, so only unsent orders are queued.
+        """
+        seq = event.get('seq')
+        if seq is not None and self._replayed_seq is not None and seq <= self._replayed_seq:
+            return
+        
+        event_id = event.get('event_id')
+        if event_id is not None:
+            sent = self._seen_events.get(event_id)
+            if sent is None:
+                sent = self._seen_events[event_id] = set()
+                if len(self._seen_events) > self.SEEN_EVENTS_SIZE:
+                    self._seen_events.popitem(last=False)
+            
+            if 'orders' in event:
+                orders = [order for order in event['orders'] if order['order_id'] not in sent]
+                if not orders:
+                    return
+                event = {**event, 'orders': orders}
+                sent.update(order['order_id'] for order in orders)
+            else:
+                if sent:
+                    return
+                sent.add(event['order']['order_id'])
+            event = {key: value for key, value in event.items() if key != 'event_id'}
+        
+        self._enqueue(event)
+        if not self.COALESCE_WINDOW or len(self._pending) >= self.COALESCE_MAX_ORDERS:
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                self._flush_task = None
+            await self._flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+    
+    def _enqueue(self, event):
+        """Add an event to the outbound buffer, merging it with pending events for the same order"""
+        if 'orders' in event:
+            # Bulk events are split per order and regrouped on flush
+            shared = {key: value for key, value in event.items() if key != 'orders'}
+            entries = [{**shared, 'order': order} for order in event['orders']]
+        else:
+            entries = [event]
+        
+        for entry in entries:
+            order_id = entry['order']['order_id']
+            pending = self._pending.get(order_id)
+            if pending is not None:
+                # Latest snapshot and new status win; the first event's type and old status stay
+                merged = {**pending, **entry, 'type': pending['type']}
+                if 'old_status' in pending:
+                    merged['old_status'] = pending['old_status']
+                entry = merged
+            self._pending[order_id] = entry
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.COALESCE_WINDOW)
+        self._flush_task = None
+        await self._flush()
+    
+    async def _flush(self):
+        """Send everything pending as one frame"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, OrderedDict()
+        
+        events = []
+        bulk = {}  # new_status -> regrouped bulk event
+        for entry in pending.values():
+            if entry['type'] == 'orders_status_changed':
+                event = bulk.get(entry['new_status'])
+                if event is None:
+                    event = bulk[entry['new_status']] = {
+                        'type': 'orders_status_changed', 'orders': [], 'new_status': entry['new_status'],
+                    }
+                    events.append(event)
+                event['orders'].append(entry['order'])
+            else:
+                events.append(entry)
+        
+        if self._known is not None:
+            # Diffs depend on what this connection has seen, so compact frames aren't shared
+            events = [self._compact(event) for event in events]
+            frame = dumps(events[0] if len(events) == 1 else {'type': 'batch', 'events': events})
+        elif len(events) == 1:
+            frame = encode_order_event(events[0])
+        else:
+            # Reuse the per-event frames shared with other connections
+            frame = '{"type": "batch", "events": [' + ', '.join(map(encode_order_event, events)) + ']}'
+        await self.send(text_data=frame)
+    
+    def _compact(self, event):
+        """Replace orders this connection already has with their changed fields"""
+        compact = {key: value for key, value in event.items() if key != 'event_id'}
+        if 'order' in event:
+            compact['order'] = self._compact_order(event['order'])
+        if 'orders' in event:
+            compact['orders'] = [self._compact_order(order) for order in event['orders']]
+        return compact
+    
+    def _compact_order(self, snapshot):
+        order_id = snapshot['order_id']
+        previous = self._known.pop(order_id, None)
+        self._known[order_id] = snapshot
+        if len(self._known) > self.COMPACT_KNOWN_ORDERS:
+            self._known.popitem(last=False)
+        if previous is None:
+            return snapshot
+        return {'order_id': order_id, 'changes': diff_snapshot(previous, snapshot)}
+    
     # Handler for 'new_order' message type
     async def new_order(self, event):
         """Send new order notification to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'new_order',
-            'order': event['order']
-        }))
+        await self._send_event(event)
     
     # Handler for 'status_changed' message type
     async def status_changed(self, event):
         """Send status change notification to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'status_changed',
-            'order': event['order'],
-            'old_status': event.get('old_status'),
-            'new_status': event.get('new_status')
-        }))
+        await self._send_event(event)
     
     # Handler for 'payment_confirmed' message type
     async def payment_confirmed(self, event):
         """Send payment confirmation notification to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'payment_confirmed',
-            'order': event['order']
-        }))
+        await self._send_event(event)
+    
+    # Handler for 'orders_status_changed' message type (bulk status change)
+    async def orders_status_changed(self, event):
+        """Send one batched frame for a bulk status change to WebSocket"""
+        await self._send_event(event)
+
+
+class OrderTrackingConsumer(AsyncWebsocketConsumer):
+    """
+    Live status of one order for the customer tracking page (read-only)
 
+    Connect with ?token=<tracking token from track_order_api>. The current status
+    is sent once on connect, then every change to the order as
+    {"type": "status_changed", "order": {...TRACKING_FIELDS}}.
+    """
+    
+    MAX_CONNECTIONS = getattr(settings, 'WEBSOCKET_MAX_TRACKING_CONNECTIONS', 1000)
+    
+    async def connect(self):
+        """Called when WebSocket connection is established"""
+        self.accepted = False
+        query = parse_qs(self.scope.get('query_string', b'').decode('utf-8', 'ignore'))
+        self.order_number = read_tracking_token(query.get('token', [''])[0])
+        self.group_name = topic_group(f'order:{self.order_number}') if self.order_number else None
+        if self.group_name is None:
+            await self.close(code=4003)  # Invalid or expired tracking token
+            return
+        
+        if not await tracking_connection_tracker.acquire(self.channel_name, self.MAX_CONNECTIONS):
+            await self.close(code=4001)  # Too Many Connections
+            logger.warning(f"Tracking connection rejected: limit of {self.MAX_CONNECTIONS} reached")
+            return
+        
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self.accepted = True
+        await self.accept()
+        self._lease_task = asyncio.create_task(self._renew_lease())
+        
+        # Current status (also covers changes missed while reconnecting)
+        order = await self._get_order()
+        if order is None:
+            await self.close(code=4004)  # Order no longer exists
+            return
+        await self._send_update(order)
+    
+    async def disconnect(self, close_code):
+        """Called when WebSocket connection is closed"""
+        if not getattr(self, 'accepted', False):
+            return
+        self.accepted = False
+        self._lease_task.cancel()
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        await tracking_connection_tracker.release(self.channel_name)
+    
+    async def _renew_lease(self):
+        """Keep this connection's lease alive; it expires on its own if the worker dies"""
+        try:
+            while True:
+                await asyncio.sleep(LEASE_RENEW_INTERVAL)
+                await tracking_connection_tracker.renew(self.channel_name)
+        except asyncio.CancelledError:
+            pass
+    
+    @database_sync_to_async
+    def _get_order(self):
+        fields = [field for field in TRACKING_FIELDS if field != 'status_display']
+        order = Order.objects.filter(order_number=self.order_number).values(*fields).first()
+        if order is None:
+            return None
+        order['status_display'] = STATUS_DISPLAY.get(order['status'], order['status'])
+        for field in ('payment_received_at', 'customer_received_at', 'updated_at'):
+            order[field] = order[field].isoformat() if order[field] else None
+        return order
+    
+    async def _send_update(self, snapshot):
+        await self.send(text_data=json.dumps({'type': 'status_changed', 'order': tracking_update(snapshot)}))
+    
+    async def receive(self, text_data):
+        """Only keepalive pings are accepted from customers"""
+        try:
+            if json.loads(text_data).get('type') == 'ping':
+                await self.send(text_data=json.dumps({'type': 'pong'}))
+        except (json.JSONDecodeError, AttributeError):
+            pass
+    
+    # Handlers for order events published to this order's topic group
+    async def status_changed(self, event):
+        await self._send_update(event['order'])
+    
+    async def payment_confirmed(self, event):
+        await self._send_update(event['order'])
+    
+    async def orders_status_changed(self, event):
+        for order in event['orders']:
+            if order['order_number'] == self.order_number:
+                await self._send_update(order)
+    
+    async def new_order(self, event):
+        # Tracking starts after the order exists
+        pass
@@ -10,21 +10,89 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
-from django.db.models import Q, Prefetch
+from django.db import transaction
+from django.db.models import Q, Count, Case, When, Value, F
 from django.core.exceptions import ValidationError
 from django.contrib import messages
-from .models import Order, OrderItem
+from django.core.cache import cache
+from .models import Order, OrderItem, DeletedOrder
+from .utils.event_log import event_log
+from .utils.dashboard_stats import DASHBOARD_COLUMNS, DELIVERED_WINDOW, get_dashboard_stats, invalidate_dashboard_counts
+from .utils.order_snapshot import ITEM_FIELDS, format_item, format_order, send_order_event, send_orders_status_event
+from .utils.sales_rollup import ORDER_STATE_FIELDS, record_orders_status_change
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Delta sync: orders changed shortly before the cursor are sent again, because updated_at
+# is set before the transaction commits and a slow commit could otherwise be skipped.
+# Clients apply changes as idempotent upserts, so repeats are harmless.
+DELTA_SYNC_OVERLAP = timedelta(seconds=5)
+# Bigger deltas are answered with a full snapshot instead
+DELTA_SYNC_MAX_CHANGES = 200
+
+# Statuses employees can set from the dashboard
+EMPLOYEE_STATUSES = ['preparing', 'ready_for_delivery', 'out_for_delivery', 'delivered']
+MAX_BULK_ORDERS = 200
+
+# Orders per column page (initial load and each "Load more")
+DASHBOARD_PAGE_SIZE = 20
+DASHBOARD_MAX_PAGE_SIZE = 100
+DASHBOARD_COLUMN_ORDER = ['to_prepare', 'preparing', 'ready', 'out', 'delivered']
+
 
 # ========== AUTHENTICATION HELPERS ==========
 
+EMPLOYEE_GROUP = 'Employee'
+# Group membership is invalidated on change (see app/signals.py); the timeout is a safety net
+EMPLOYEE_CACHE_TIMEOUT = 600  # seconds
+
+
+def employee_cache_key(user_id):
+    return f'is_employee_{user_id}'
+
+
+def _in_employee_group(user):
+    """Employee group membership, cached per user (the hot polling paths stay query-free)"""
+    # Memoize on the user object for the rest of the request
+    if hasattr(user, '_in_employee_group'):
+        return user._in_employee_group
+    
+    key = employee_cache_key(user.pk)
+    try:
+        member = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Employee cache read failed: {e}")
+        member = None
+    
+    if member is None:
+        member = user.groups.filter(name=EMPLOYEE_GROUP).exists()
+        try:
+            cache.set(key, member, EMPLOYEE_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Employee cache write failed: {e}")
+    
+    user._in_employee_group = member
+    return member
+
+
 def is_employee(user):
     """Check if user is staff or in Employee group"""
-    return user.is_authenticated and (user.is_staff or user.groups.filter(name='Employee').exists())
+    return user.is_authenticated and (user.is_staff or _in_employee_group(user))
+
+
+def invalidate_employee_cache(user_ids):
+    """Drop cached group membership (call when a user's groups change)"""
+    keys = [employee_cache_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f"Employee cache invalidation failed: {e}")
 
 
 def employee_required(view_func):
@@ -82,70 +150,29 @@ def employee_logout(request):
 def employee_dashboard(request):
     """Main employee dashboard - shows orders that need action"""
     
-    # Maximum orders to load per status (prevents memory issues with 1000+ orders)
-    MAX_ORDERS_PER_STATUS = 100
+    # Taken before the queries so nothing changed while rendering is missed by the next delta sync
+    sync_cursor = encode_sync_cursor(timezone.now())
+    # The WebSocket replays order events after this seq when the dashboard connects
+    event_seq = event_log.current_seq()
     
-    # Get orders that need preparation (confirmed or pending)
-    # Exclude orders that are already received by customer
-    # Optimized with select_related and prefetch_related for better performance
-    # LIMITED to prevent loading too many orders at once
-    orders_to_prepare = Order.objects.filter(
-        status__in=['pending', 'confirmed']
-    ).exclude(status='cancelled').exclude(customer_received=True).select_related(
-        'customer', 'promo_code'
-    ).prefetch_related(
-        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
-    ).order_by('-created_at')[:MAX_ORDERS_PER_STATUS]
-    
-    # Get orders being prepared
-    # Exclude orders that are already received by customer
-    orders_preparing = Order.objects.filter(
-        status='preparing'
-    ).exclude(customer_received=True).select_related(
-        'customer', 'promo_code'
-    ).prefetch_related(
-        Prefetch('items', queryset=OrderItem.objects.select_related('product'))
-    ).order_by('-created_at')[:MAX_ORDERS_PER_STATUS]
-    
-    # Get orders ready for delivery
-    # Exclude orders that are already received by customer
-    orders_ready = Order.objects.filter(
-        status='ready_for_delivery'
-    ).exclude(customer_received=True).select_related(
-        'customer', 'promo_code'
-    ).prefetch_related('items').order_by('-created_at')[:MAX_ORDERS_PER_STATUS]
-    
-    # Get orders out for delivery
-    # Exclude orders that are already received by customer
-    orders_out = Order.objects.filter(
-        status='out_for_delivery'
-    ).exclude(customer_received=True).select_related(
-        'customer', 'promo_code'
-    ).prefetch_related('items').order_by('-created_at')[:MAX_ORDERS_PER_STATUS]
-    
-    # Get delivered orders (show ALL delivered orders from last 7 days, not just today)
-    # This ensures delivered orders persist even after page refresh
-    from datetime import timedelta
-    seven_days_ago = timezone.now() - timedelta(days=7)
-    orders_delivered_today = Order.objects.filter(
-        status='delivered',
-        updated_at__gte=seven_days_ago  # Show orders delivered in last 7 days
-    ).select_related(
-        'customer', 'promo_code'
-    ).prefetch_related('items').order_by('-updated_at')[:50]  # Order by updated_at (when delivered)
+    # First page of every column (older orders are loaded with "Load more")
+    columns = {}
+    next_cursors = {}
+    for column in DASHBOARD_COLUMN_ORDER:
+        columns[column], next_cursors[column] = get_column_page(column)
     
     context = {
-        'orders_to_prepare': orders_to_prepare,
-        'orders_preparing': orders_preparing,
-        'orders_ready': orders_ready,
-        'orders_out': orders_out,
-        'orders_delivered_today': orders_delivered_today,
-        'orders_completed': orders_delivered_today,  # Alias for template
-        'total_to_prepare': orders_to_prepare.count(),
-        'total_preparing': orders_preparing.count(),
-        'total_ready': orders_ready.count(),
-        'total_out': orders_out.count(),
-        'total_completed': orders_delivered_today.count(),
+        'sync_cursor': sync_cursor,
+        'event_seq': event_seq,
+        'next_cursors': next_cursors,
+        'orders_to_prepare': columns['to_prepare'],
+        'orders_preparing': columns['preparing'],
+        'orders_ready': columns['ready'],
+        'orders_out': columns['out'],
+        'orders_delivered_today': columns['delivered'],
+        'orders_completed': columns['delivered'],  # Alias for template
+        # Active column counts from one grouped query (or the cached counters) plus the delivered count
+        **get_dashboard_stats(),
     }
     
     return render(request, 'app/employee/dashboard.html', context)
@@ -183,7 +210,7 @@ def employee_update_status(request, order_number):
         data = json.loads(request.body)
         new_status = data.get('status', '').strip()
         
-        if new_status not in ['preparing', 'ready_for_delivery', 'out_for_delivery', 'delivered']:
+        if new_status not in EMPLOYEE_STATUSES:
             return JsonResponse({
                 'success': False,
                 'message': 'Invalid status'
@@ -220,53 +247,7 @@ def employee_update_status(request, order_number):
             }, status=500)
         
         # Send WebSocket message to all connected dashboards
-        from channels.layers import get_channel_layer
-        from asgiref.sync import async_to_sync
-        
-        channel_layer = get_channel_layer()
-        if channel_layer:
-            # Get order items for the message
-            items = OrderItem.objects.filter(order=order)
-            items_data = [{
-                'product_name': item.product_name,
-                'quantity': item.quantity,
-                'price': str(item.product_price),
-                'subtotal': str(item.subtotal)
-            } for item in items]
-            
-            # Refresh order from database to get updated customer_received status
-            order.refresh_from_db()
-            
-            order_data = {
-                'order_id': order.id,
-                'order_number': order.order_number,
-                'status': order.status,
-                'status_display': order.get_status_display(),
-                'customer_name': order.customer_name,
-                'customer_phone': order.customer_phone,
-                'customer_address': order.customer_address,
-                'customer_province': order.customer_province,
-                'total_amount': str(order.total),
-                'payment_method': order.payment_method,
-                'created_at': order.created_at.isoformat(),
-                'items': items_data,
-                'notes': order.notes or '',  # Include delivery notes for real-time updates
-                'customer_received': order.customer_received,
-                'customer_received_at': order.customer_received_at.isoformat() if order.customer_received_at else None,
-                'customer_received_by': order.customer_received_by,
-                'payment_received': order.payment_received,
-                'payment_received_at': order.payment_received_at.isoformat() if order.payment_received_at else None,
-            }
-            
-            async_to_sync(channel_layer.group_send)(
-                'orders_updates',
-                {
-                    'type': 'status_changed',
-                    'order': order_data,
-                    'old_status': old_status,
-                    'new_status': new_status
-                }
-            )
+        send_order_event('status_changed', order, old_status=old_status, new_status=new_status)
         
         return JsonResponse({
             'success': True,
@@ -287,6 +268,116 @@ def employee_update_status(request, order_number):
         }, status=500)
 
 
+@employee_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def employee_bulk_update_status(request):
+    """
+    API endpoint to move many orders to one status
+    
+    Expects {"order_numbers": [...], "status": "..."}. Every order is checked with
+    validate_status_transition; valid ones are updated with one UPDATE per source
+    status and announced in a single WebSocket event. Orders that can't be moved
+    are reported in 'failed' without affecting the rest.
+    """
+    try:
+        data = json.loads(request.body)
+        new_status = str(data.get('status', '')).strip()
+        order_numbers = data.get('order_numbers')
+        
+        if new_status not in EMPLOYEE_STATUSES:
+            return JsonResponse({
+                'success': False,
+                'message': 'Invalid status'
+            }, status=400)
+        
+        if not isinstance(order_numbers, list) or not order_numbers:
+            return JsonResponse({
+                'success': False,
+                'message': 'order_numbers must be a non-empty list'
+            }, status=400)
+        
+        order_numbers = list(dict.fromkeys(str(number).strip() for number in order_numbers))
+        if len(order_numbers) > MAX_BULK_ORDERS:
+            return JsonResponse({
+                'success': False,
+                'message': f'At most {MAX_BULK_ORDERS} orders can be updated at once'
+            }, status=400)
+        
+        failed = []
+        updated = []
+        now = timezone.now()
+        
+        with transaction.atomic():
+            # Lock the rows so the transitions validated here are the ones applied
+            orders = {
+                order.order_number: order
+                for order in Order.objects.select_for_update().filter(
+                    order_number__in=order_numbers
+                ).only('id', 'order_number', 'customer_received', *ORDER_STATE_FIELDS)
+            }
+            
+            by_status = defaultdict(list)
+            for number in order_numbers:
+                order = orders.get(number)
+                if order is None:
+                    failed.append({'order_number': number, 'message': 'Order not found'})
+                    continue
+                try:
+                    order.validate_status_transition(new_status)
+                except ValidationError as e:
+                    failed.append({'order_number': number, 'message': e.messages[0]})
+                    continue
+                by_status[order.status].append(order)
+            
+            changes = {'status': new_status, 'updated_at': now}
+            if new_status == 'delivered':
+                # "Delivered" means the customer received the order (same as employee_update_status)
+                changes.update(
+                    customer_received=True,
+                    customer_received_at=Case(
+                        When(customer_received=False, then=Value(now)),
+                        default=F('customer_received_at'),
+                    ),
+                    customer_received_by=Case(
+                        When(customer_received=False, then=Value('Employee Dashboard (Auto)')),
+                        default=F('customer_received_by'),
+                    ),
+                )
+            
+            for old_status, group in by_status.items():
+                Order.objects.filter(id__in=[order.id for order in group], status=old_status).update(**changes)
+                for order in group:
+                    order.updated_at = now
+                    updated.append(order)
+            
+            if updated:
+                # update() skips model signals - recount dashboard columns on next read
+                transaction.on_commit(invalidate_dashboard_counts)
+                record_orders_status_change(updated, new_status)
+                send_orders_status_event(updated, new_status)
+        
+        return JsonResponse({
+            'success': not failed,
+            'status': new_status,
+            'updated': [order.order_number for order in updated],
+            'failed': failed,
+            'message': f'{len(updated)} order(s) updated, {len(failed)} failed',
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid JSON data'
+        }, status=400)
+    except Exception as e:
+        logger.error(f"Error in employee_bulk_update_status: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=500)
+
+
 @employee_required
 @require_http_methods(["GET"])
 def employee_print_qr(request, order_number):
@@ -312,103 +403,178 @@ def employee_print_qr(request, order_number):
     return render(request, 'app/cod/print.html', context)
 
 
-def serialize_order(order):
-    """Helper function to serialize order data for API responses"""
-    items = [{
-        'product_name': item.product_name,
-        'quantity': item.quantity,
-        'price': str(item.product_price),
-        'subtotal': str(item.subtotal)
-    } for item in order.items.all()]
+def serialize_order(order, include_items=True):
+    """
+    Helper function to serialize order data for API responses
+    
+    Dashboard columns pass include_items=False with an items_count annotation;
+    the items are fetched on demand when a card is expanded.
+    """
+    if include_items:
+        return format_order(order, items=[format_item(item) for item in order.items.all()])
+    return format_order(order, items_count=order.items_count)
+
+
+def get_dashboard_column(order):
+    """Dashboard column for an order, or None if the order is no longer on the board"""
+    if order.status == 'delivered':
+        return 'delivered' if order.updated_at >= timezone.now() - DELIVERED_WINDOW else None
+    if order.customer_received:
+        return None
+    return DASHBOARD_COLUMNS.get(order.status)
+
+
+def get_column_queryset(column):
+    """Orders in a dashboard column, newest first, with an item count instead of prefetched items"""
+    orders = Order.objects.annotate(items_count=Count('items'))
+    if column == 'delivered':
+        # Show orders delivered in the last 7 days, by delivery time
+        return orders.filter(
+            status='delivered',
+            updated_at__gte=timezone.now() - DELIVERED_WINDOW,
+        ).order_by('-updated_at', '-id')
+    statuses = [status for status, status_column in DASHBOARD_COLUMNS.items() if status_column == column]
+    # Exclude orders that are already received by customer
+    return orders.filter(status__in=statuses, customer_received=False).order_by('-created_at', '-id')
+
+
+def get_column_page(column, after=None, limit=DASHBOARD_PAGE_SIZE):
+    """
+    One page of a dashboard column using keyset pagination
+    
+    Args:
+        column: dashboard column key (see DASHBOARD_COLUMN_ORDER)
+        after: page cursor returned with the previous page
+        limit: page size
+    
+    Returns:
+        (orders, next_cursor) - next_cursor is None on the last page
+    """
+    sort_field = 'updated_at' if column == 'delivered' else 'created_at'
+    orders = get_column_queryset(column)
+    if after:
+        moment, order_id = decode_page_cursor(after)
+        orders = orders.filter(
+            Q(**{f'{sort_field}__lt': moment}) | Q(**{sort_field: moment, 'id__lt': order_id})
+        )
+    
+    orders = list(orders[:limit + 1])
+    if len(orders) <= limit:
+        return orders, None
+    orders = orders[:limit]
+    last = orders[-1]
+    return orders, f'{encode_sync_cursor(getattr(last, sort_field))}_{last.id}'
+
+
+def decode_page_cursor(cursor):
+    """Parse a column page cursor into (timestamp, order id) (raises ValueError if malformed)"""
+    moment, order_id = cursor.split('_', 1)
+    return decode_sync_cursor(moment), int(order_id)
+
+
+def encode_sync_cursor(moment):
+    """Delta sync cursor: microseconds since epoch of the moment the snapshot was taken"""
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_sync_cursor(cursor):
+    """Parse a delta sync cursor (raises ValueError if it is malformed)"""
+    return datetime.fromtimestamp(int(cursor) / 1_000_000, tz=dt_timezone.utc)
+
+
+def get_dashboard_delta(since):
+    """
+    Orders created, changed or deleted since a delta sync cursor
+    
+    Returns:
+        dict with 'changed' (serialized orders with their 'column') and 'removed'
+        (order numbers to drop from the board), or None if the client needs a full
+        snapshot (bad or expired cursor, or too many changes).
+    """
+    try:
+        since_at = decode_sync_cursor(since)
+    except (ValueError, OverflowError, OSError):
+        return None
+    
+    # Deletions are only remembered for DeletedOrder.RETENTION
+    if since_at < timezone.now() - DeletedOrder.RETENTION:
+        return None
+    
+    window_start = since_at - DELTA_SYNC_OVERLAP
+    orders = list(
+        Order.objects.filter(updated_at__gte=window_start).annotate(
+            items_count=Count('items')
+        ).order_by('updated_at', 'id')[:DELTA_SYNC_MAX_CHANGES + 1]
+    )
+    if len(orders) > DELTA_SYNC_MAX_CHANGES:
+        return None
+    
+    changed = []
+    removed = []
+    for order in orders:
+        column = get_dashboard_column(order)
+        if column is None:
+            # Cancelled, received by the customer, or delivered long ago - moved off the board
+            removed.append(order.order_number)
+        else:
+            changed.append({**serialize_order(order, include_items=False), 'column': column})
+    
+    removed.extend(
+        DeletedOrder.objects.filter(deleted_at__gte=window_start).values_list('order_number', flat=True)
+    )
     
     return {
-        'order_number': order.order_number,
-        'customer_name': order.customer_name,
-        'customer_phone': order.customer_phone,
-        'customer_address': order.customer_address,
-        'customer_province': order.customer_province,
-        'total': str(order.total),
-        'total_amount': str(order.total),  # For compatibility
-        'payment_method': order.payment_method,
-        'status': order.status,
-        'status_display': order.get_status_display(),
-        'created_at': order.created_at.isoformat(),
-        'items': items,
-        'notes': order.notes or '',  # Include delivery notes for employee dashboard
-        'customer_received': order.customer_received,
-        'customer_received_at': order.customer_received_at.isoformat() if order.customer_received_at else None,
-        'customer_received_by': order.customer_received_by,
-        'payment_received': order.payment_received,
-        'payment_received_at': order.payment_received_at.isoformat() if order.payment_received_at else None,
+        'changed': changed,
+        'removed': list(dict.fromkeys(removed)),
     }
 
 
 @employee_required
 @require_http_methods(["GET"])
 def employee_dashboard_api(request):
-    """API endpoint for real-time order updates"""
+    """
+    API endpoint for real-time order updates
+    
+    Without parameters returns a full snapshot of every column. With ?since=<cursor>
+    (the 'cursor' of a previous response) returns only orders created, changed or
+    deleted since then; 'reset': true means the delta was unavailable and a full
+    snapshot is returned instead.
+    """
     try:
-        # Get orders that need preparation
-        # Exclude orders that are already received by customer
-        # Optimized with select_related and prefetch_related for better performance
-        orders_to_prepare = Order.objects.filter(
-            status__in=['pending', 'confirmed']
-        ).exclude(status='cancelled').exclude(customer_received=True).select_related(
-            'customer', 'promo_code'
-        ).prefetch_related(
-            Prefetch('items', queryset=OrderItem.objects.select_related('product'))
-        ).order_by('-created_at')
+        # Taken before the queries so nothing committed meanwhile is missed by the next sync
+        cursor = encode_sync_cursor(timezone.now())
+        since = request.GET.get('since')
         
-        # Get orders being prepared
-        # Exclude orders that are already received by customer
-        orders_preparing = Order.objects.filter(
-            status='preparing'
-        ).exclude(customer_received=True).select_related(
-            'customer', 'promo_code'
-        ).prefetch_related(
-            Prefetch('items', queryset=OrderItem.objects.select_related('product'))
-        ).order_by('-created_at')
+        if since:
+            delta = get_dashboard_delta(since)
+            if delta is not None:
+                return JsonResponse({
+                    'success': True,
+                    'mode': 'delta',
+                    'cursor': cursor,
+                    'stats': get_dashboard_stats(),
+                    **delta,
+                })
         
-        # Get orders ready for delivery
-        # Exclude orders that are already received by customer
-        orders_ready = Order.objects.filter(
-            status='ready_for_delivery'
-        ).exclude(customer_received=True).select_related(
-            'customer', 'promo_code'
-        ).prefetch_related('items').order_by('-created_at')
-        
-        # Get orders out for delivery
-        # Exclude orders that are already received by customer
-        orders_out = Order.objects.filter(
-            status='out_for_delivery'
-        ).exclude(customer_received=True).select_related(
-            'customer', 'promo_code'
-        ).prefetch_related('items').order_by('-created_at')
-        
-        # Get delivered orders (show ALL delivered orders from last 7 days)
-        # This ensures delivered orders persist even after page refresh
-        from datetime import timedelta
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        orders_delivered = Order.objects.filter(
-            status='delivered',
-            updated_at__gte=seven_days_ago  # Show orders delivered in last 7 days
-        ).select_related(
-            'customer', 'promo_code'
-        ).prefetch_related('items').order_by('-updated_at')[:50]  # Order by updated_at (when delivered)
+        # First page of every column - clients page further with employee_dashboard_column_api
+        columns = {}
+        next_cursors = {}
+        for column in DASHBOARD_COLUMN_ORDER:
+            orders, next_cursors[column] = get_column_page(column)
+            columns[column] = [serialize_order(o, include_items=False) for o in orders]
         
         return JsonResponse({
             'success': True,
-            'stats': {
-                'total_to_prepare': orders_to_prepare.count(),
-                'total_preparing': orders_preparing.count(),
-                'total_ready': orders_ready.count(),
-                'total_out': orders_out.count(),
-            },
-            'orders_to_prepare': [serialize_order(o) for o in orders_to_prepare],
-            'orders_preparing': [serialize_order(o) for o in orders_preparing],
-            'orders_ready': [serialize_order(o) for o in orders_ready],
-            'orders_out': [serialize_order(o) for o in orders_out],
-            'orders_delivered': [serialize_order(o) for o in orders_delivered],
+            'mode': 'full',
+            'reset': bool(since),
+            'cursor': cursor,
+            'stats': get_dashboard_stats(),
+            'next_cursors': next_cursors,
+            'orders_to_prepare': columns['to_prepare'],
+            'orders_preparing': columns['preparing'],
+            'orders_ready': columns['ready'],
+            'orders_out': columns['out'],
+            'orders_delivered': columns['delivered'],
         })
     except Exception as e:
         logger.error(f"Error in employee_dashboard_api: {str(e)}", exc_info=True)
@@ -419,6 +585,53 @@ def employee_dashboard_api(request):
         }, status=500)
 
 
+@employee_required
+@require_http_methods(["GET"])
+def employee_dashboard_column_api(request, column):
+    """API endpoint for "Load more" - the next page of one dashboard column (?after=<cursor>&limit=)"""
+    if column not in DASHBOARD_COLUMN_ORDER:
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid column'
+        }, status=400)
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', DASHBOARD_PAGE_SIZE)), 1), DASHBOARD_MAX_PAGE_SIZE)
+        orders, next_cursor = get_column_page(column, after=request.GET.get('after'), limit=limit)
+    except (ValueError, OverflowError, OSError):
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid cursor or limit'
+        }, status=400)
+    except Exception as e:
+        logger.error(f"Error in employee_dashboard_column_api: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'message': 'Error fetching orders. Please try again.',
+            'error': str(e) if settings.DEBUG else None
+        }, status=500)
+    
+    return JsonResponse({
+        'success': True,
+        'column': column,
+        'orders': [serialize_order(o, include_items=False) for o in orders],
+        'next_cursor': next_cursor,
+    })
+
+
+@employee_required
+@require_http_methods(["GET"])
+def employee_order_items_api(request, order_number):
+    """API endpoint for the items of one order (loaded when a dashboard card is expanded)"""
+    order = get_object_or_404(Order.objects.only('id', 'order_number'), order_number=order_number)
+    items = OrderItem.objects.filter(order=order).values(*ITEM_FIELDS)
+    return JsonResponse({
+        'success': True,
+        'order_number': order.order_number,
+        'items': [format_item(item) for item in items],
+    })
+
+
 @employee_required
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -461,46 +674,7 @@ def employee_confirm_payment(request, order_number):
         order.save()
         
         # Send WebSocket message for payment confirmation
-        from channels.layers import get_channel_layer
-        from asgiref.sync import async_to_sync
-        
-        channel_layer = get_channel_layer()
-        if channel_layer:
-            # Get order items for the message
-            items = OrderItem.objects.filter(order=order)
-            items_data = [{
-                'product_name': item.product_name,
-                'quantity': item.quantity,
-                'price': str(item.product_price),
-                'subtotal': str(item.subtotal)
-            } for item in items]
-            
-            order_data = {
-                'order_id': order.id,
-                'order_number': order.order_number,
-                'status': order.status,
-                'status_display': order.get_status_display(),
-                'customer_name': order.customer_name,
-                'customer_phone': order.customer_phone,
-                'customer_address': order.customer_address,
-                'customer_province': order.customer_province,
-                'total_amount': str(order.total),
-                'payment_method': order.payment_method,
-                'created_at': order.created_at.isoformat(),
-                'items': items_data,
-                'payment_received': order.payment_received,
-                'payment_received_at': order.payment_received_at.isoformat() if order.payment_received_at else None,
-                'customer_received': order.customer_received,
-                'customer_received_at': order.customer_received_at.isoformat() if order.customer_received_at else None,
-            }
-            
-            async_to_sync(channel_layer.group_send)(
-                'orders_updates',
-                {
-                    'type': 'payment_confirmed',
-                    'order': order_data
-                }
-            )
+        send_order_event('payment_confirmed', order)
         
         return JsonResponse({
             'success': True,
@@ -0,0 +1,245 @@
+"""
+Django management command to load test WebSocket fan-out.
+
+Usage:
+    python manage.py bench_websockets [--connections=200] [--rate=50] [--duration=10]
+                                      [--layer=memory|redis] [--redis-url=redis://127.0.0.1:6379/0]
+                                      [--topic=all] [--coalesce-window=0.075] [--json]
+
+Opens N OrderConsumer connections in this process (ASGI communicators, no
+network), publishes M synthetic order events per second with group_send and
+reports:
+- delivery latency percentiles (publish -> frame received by the socket)
+- memory per connection (Python allocations while connecting, via tracemalloc)
+- CPU per event (process CPU time during the publish phase / events published)
+
+Use the numbers to size Daphne workers: CPU per event x events per second is
+the share of one core a process needs at that load and connection count. The
+CPU figures include the harness parsing every frame on the receiving side, so
+treat them as an upper bound.
+Connection leases are kept in-process during the run, so it never touches the
+production connection count.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import tracemalloc
+import uuid
+
+from channels.layers import channel_layers, DEFAULT_CHANNEL_LAYER
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+
+from app.consumers import OrderConsumer
+from app.utils.ws_topics import topic_group
+
+
+class Command(BaseCommand):
+    help = 'Load test WebSocket fan-out (latency, memory per connection, CPU per event)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=200, help='Number of sockets (default: 200)')
+        parser.add_argument('--rate', type=float, default=50, help='Events published per second (default: 50)')
+        parser.add_argument('--duration', type=float, default=10, help='Publish phase in seconds (default: 10)')
+        parser.add_argument(
+            '--layer', choices=['memory', 'redis'], default='memory',
+            help='Channel layer: in-memory or channels_redis (default: memory)'
+        )
+        parser.add_argument(
+            '--redis-url', default='redis://127.0.0.1:6379/0',
+            help='Redis for --layer=redis (default: redis://127.0.0.1:6379/0)'
+        )
+        parser.add_argument('--topic', default='all', help='Topic every socket subscribes to (default: all)')
+        parser.add_argument(
+            '--coalesce-window', type=float, default=None,
+            help='Override WEBSOCKET_COALESCE_WINDOW in seconds (0 = send every event immediately)'
+        )
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['connections'] < 1 or options['rate'] <= 0 or options['duration'] <= 0:
+            raise CommandError('--connections, --rate and --duration must be positive')
+        group = topic_group(options['topic'])
+        if group is None:
+            raise CommandError(f"Invalid topic: {options['topic']}")
+
+        channel_layer = self._make_channel_layer(options)
+        window = options['coalesce_window']
+        if window is None:
+            window = getattr(settings, 'WEBSOCKET_COALESCE_WINDOW', 0)
+
+        # Local connection leases, no connection cap, requested coalescing window
+        previous = (OrderConsumer.MAX_CONNECTIONS, OrderConsumer.COALESCE_WINDOW)
+        OrderConsumer.MAX_CONNECTIONS = options['connections']
+        OrderConsumer.COALESCE_WINDOW = window
+        # Per-connection connect/disconnect logging would drown the report
+        consumer_logger = logging.getLogger('app.consumers')
+        previous_level = consumer_logger.level
+        consumer_logger.setLevel(logging.WARNING)
+        # Consumers look the layer up by alias
+        previous_layer = channel_layers.backends.get(DEFAULT_CHANNEL_LAYER)
+        channel_layers.backends[DEFAULT_CHANNEL_LAYER] = channel_layer
+        try:
+            with override_settings(WEBSOCKET_REDIS_URL=''):
+                report = asyncio.run(self._run(channel_layer, group, options))
+        finally:
+            OrderConsumer.MAX_CONNECTIONS, OrderConsumer.COALESCE_WINDOW = previous
+            consumer_logger.setLevel(previous_level)
+            if previous_layer is None:
+                channel_layers.backends.pop(DEFAULT_CHANNEL_LAYER, None)
+            else:
+                channel_layers.backends[DEFAULT_CHANNEL_LAYER] = previous_layer
+
+        report.update(layer=options['layer'], topic=options['topic'], coalesce_window=window)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_report(report)
+
+    def _make_channel_layer(self, options):
+        if options['layer'] == 'redis':
+            from channels_redis.core import RedisChannelLayer
+            return RedisChannelLayer(hosts=[options['redis_url']], capacity=10000)
+        from channels.layers import InMemoryChannelLayer
+        return InMemoryChannelLayer(capacity=10000)
+
+    async def _run(self, channel_layer, group, options):
+        from channels.testing import WebsocketCommunicator
+
+        n = options['connections']
+        topic = options['topic']
+
+        # ----- Connect (memory measured while sockets are opened) -----
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        communicators = []
+        for _ in range(n):
+            communicator = WebsocketCommunicator(OrderConsumer.as_asgi(), f'/ws/orders/?topics={topic}')
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError('Connection rejected - check WEBSOCKET_MAX_CONNECTIONS / layer settings')
+            communicators.append(communicator)
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - baseline) / n
+        tracemalloc.stop()
+
+        # ----- Receive -----
+        sent_at = {}
+        latencies = []
+        frames = [0]
+
+        async def receive(communicator):
+            # Read the output queue directly - receive_from() cancels the consumer on timeout
+            while True:
+                message = await communicator.output_queue.get()
+                received = time.perf_counter()
+                if message['type'] != 'websocket.send':
+                    continue
+                frames[0] += 1
+                data = json.loads(message['text'])
+                for event in (data['events'] if data.get('type') == 'batch' else [data]):
+                    order = event.get('order')
+                    if order and order['order_id'] in sent_at:
+                        latencies.append(received - sent_at[order['order_id']])
+
+        receivers = [asyncio.create_task(receive(communicator)) for communicator in communicators]
+
+        # ----- Publish at a fixed rate -----
+        total = max(1, int(options['rate'] * options['duration']))
+        interval = 1 / options['rate']
+        now = timezone.now().isoformat()
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            order_id = i + 1
+            sent_at[order_id] = time.perf_counter()
+            await channel_layer.group_send(group, {
+                'type': 'status_changed',
+                'event_id': uuid.uuid4().hex,
+                'order': self._order(order_id, now),
+                'old_status': 'preparing',
+                'new_status': 'ready_for_delivery',
+            })
+        publish_elapsed = time.perf_counter() - start
+
+        # ----- Drain -----
+        expected = total * n
+        deadline = time.perf_counter() + 5 + 2 * OrderConsumer.COALESCE_WINDOW
+        while len(latencies) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        cpu_used = time.process_time() - cpu_start
+        elapsed = time.perf_counter() - start
+
+        for receiver in receivers:
+            receiver.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+        for communicator in communicators:
+            await communicator.disconnect()
+
+        return {
+            'connections': n,
+            'events_published': total,
+            'publish_rate': round(total / publish_elapsed, 1) if publish_elapsed else None,
+            'deliveries_expected': expected,
+            'deliveries': len(latencies),
+            'frames': frames[0],
+            'latency_ms': self._percentiles(latencies),
+            'memory_per_connection_kb': round(memory_per_connection / 1024, 1),
+            'cpu_per_event_ms': round(cpu_used / total * 1000, 3),
+            'cpu_per_delivery_us': round(cpu_used / max(1, len(latencies)) * 1_000_000, 1),
+            'cpu_share_of_core': round(cpu_used / elapsed, 3),
+        }
+
+    @staticmethod
+    def _order(order_id, timestamp):
+        """Synthetic order snapshot with the fields a real event carries"""
+        return {
+            'order_id': order_id, 'order_number': f'MD{order_id:05d}', 'status': 'ready_for_delivery',
+            'status_display': 'Ready for Delivery', 'customer_name': 'Benchmark Customer',
+            'customer_phone': '012345678', 'customer_address': '123 Benchmark St',
+            'customer_province': 'Phnom Penh', 'total': '19.99', 'total_amount': '19.99',
+            'payment_method': 'KHQR', 'created_at': timestamp, 'updated_at': timestamp, 'notes': '',
+            'customer_received': False, 'customer_received_at': None, 'customer_received_by': None,
+            'payment_received': True, 'payment_received_at': timestamp, 'items_count': 1,
+        }
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return {}
+        samples = sorted(samples)
+
+        def at(fraction):
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))] * 1000, 2)
+
+        return {'p50': at(0.50), 'p90': at(0.90), 'p99': at(0.99), 'max': round(samples[-1] * 1000, 2)}
+
+    def _print_report(self, report):
+        self.stdout.write(self.style.SUCCESS('\n📡 WEBSOCKET FAN-OUT BENCHMARK'))
+        self.stdout.write('=' * 70)
+        self.stdout.write(f"Layer:              {report['layer']} (topic '{report['topic']}')")
+        self.stdout.write(f"Connections:        {report['connections']}")
+        self.stdout.write(f"Coalesce window:    {report['coalesce_window'] * 1000:.0f} ms")
+        self.stdout.write(f"Events published:   {report['events_published']} ({report['publish_rate']}/s achieved)")
+        self.stdout.write(f"Frames sent:        {report['frames']}")
+
+        lost = report['deliveries_expected'] - report['deliveries']
+        line = f"Deliveries:         {report['deliveries']} / {report['deliveries_expected']}"
+        self.stdout.write(self.style.WARNING(f'{line} ({lost} lost)') if lost else line)
+
+        latency = report['latency_ms']
+        if latency:
+            self.stdout.write(
+                f"Latency (ms):       p50 {latency['p50']}  p90 {latency['p90']}  "
+                f"p99 {latency['p99']}  max {latency['max']}"
+            )
+        self.stdout.write(f"Memory/connection:  {report['memory_per_connection_kb']} KB (Python allocations)")
+        self.stdout.write(f"CPU/event:          {report['cpu_per_event_ms']} ms ({report['cpu_per_delivery_us']} µs per delivery)")
+        self.stdout.write(f"CPU at this rate:   {report['cpu_share_of_core'] * 100:.1f}% of one core")
+        self.stdout.write('')
@@ -0,0 +1,228 @@
+"""
+Django management command to transcode hero slide videos for the web.
+
+Usage:
+    python manage.py process_hero_videos [--slide=ID] [--force] [--dry-run]
+
+For every video hero slide without up-to-date renditions this creates:
+- A size-capped H.264 MP4 rendition (muted, faststart, max 720p)
+- A size-capped WebM (VP9) rendition
+- A WebP poster frame (unless a poster was uploaded manually)
+
+Renditions and generated posters from an earlier run are deleted once the new
+ones are saved.
+
+The homepage preloads only the poster and lazy-loads the video.
+Requires ffmpeg on PATH. Run after uploading a new hero video (or from cron).
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.files import File
+from django.core.files.base import ContentFile
+from pathlib import Path
+from io import BytesIO
+import os
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image
+
+from app.models import HeroSlide
+
+
+class Command(BaseCommand):
+    help = 'Transcode hero slide videos to web renditions and extract poster frames'
+
+    # Hero videos loop muted in the background, so they can be small
+    DEFAULT_MAX_HEIGHT = 720
+    DEFAULT_MAX_SIZE_MB = 4
+    # Each retry raises CRF (lower quality) until the rendition fits the size cap
+    MP4_CRF_STEPS = [28, 32, 36]
+    WEBM_CRF_STEPS = [36, 40, 44]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--slide',
+            type=int,
+            help='Only process the hero slide with this ID'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-process slides even if renditions are up to date'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show which slides would be processed without transcoding'
+        )
+        parser.add_argument(
+            '--max-height',
+            type=int,
+            default=self.DEFAULT_MAX_HEIGHT,
+            help=f'Maximum rendition height in pixels (default: {self.DEFAULT_MAX_HEIGHT})'
+        )
+        parser.add_argument(
+            '--max-size',
+            type=float,
+            default=self.DEFAULT_MAX_SIZE_MB,
+            help=f'Target maximum size per rendition in MB (default: {self.DEFAULT_MAX_SIZE_MB})'
+        )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        dry_run = options['dry_run']
+        max_height = options['max_height']
+        max_size = int(options['max_size'] * 1024 * 1024)
+
+        ffmpeg = shutil.which('ffmpeg')
+        if not ffmpeg and not dry_run:
+            raise CommandError('ffmpeg is not installed or not on PATH. Install ffmpeg to process hero videos.')
+
+        slides = HeroSlide.objects.filter(slide_type='video').exclude(video='').exclude(video__isnull=True)
+        if options['slide']:
+            slides = slides.filter(id=options['slide'])
+
+        self.stdout.write(self.style.SUCCESS('\n🎬 Processing Hero Slide Videos...'))
+        if dry_run:
+            self.stdout.write(self.style.WARNING('🔍 DRY RUN MODE - No files will be created'))
+        self.stdout.write('')
+
+        processed = 0
+        failed = 0
+        for slide in slides:
+            if not force and not slide.needs_video_processing():
+                self.stdout.write(f'  ⏭️  Up to date: {slide}')
+                continue
+
+            if dry_run:
+                self.stdout.write(f'  🔍 Would process: {slide} ({slide.video.name})')
+                continue
+
+            try:
+                self._process_slide(ffmpeg, slide, max_height, max_size)
+                processed += 1
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'  ❌ Error processing {slide}: {str(e)}'))
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f'✅ Processed: {processed}'))
+        if failed:
+            self.stdout.write(self.style.ERROR(f'❌ Failed: {failed}'))
+        self.stdout.write('')
+
+    def _process_slide(self, ffmpeg, slide, max_height, max_size):
+        """Transcode one slide's video and save renditions + poster on the model"""
+        self.stdout.write(f'  🎞️  Processing: {slide} ({slide.video.name}, {self._format_size(slide.video.size)})')
+
+        # Files replaced by this run - deleted once the new ones are saved on the slide
+        old_files = [slide.video_mp4, slide.video_webm]
+        regenerate_poster = not slide.poster or self._is_generated_poster(slide)
+        if regenerate_poster and slide.poster:
+            old_files.append(slide.poster)
+        old_files = [(field.storage, field.name) for field in old_files if field]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            source = tmp_dir / f'source{Path(slide.video.name).suffix.lower()}'
+            # Copy through storage so this works with local and remote media storage
+            with slide.video.open('rb') as src, open(source, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+
+            base_name = Path(slide.video.name).stem
+            # Never upscale; keep width even for H.264
+            scale = f"scale=-2:'min({max_height},ih)'"
+
+            mp4_path = tmp_dir / f'{base_name}.mp4'
+            self._encode_capped(ffmpeg, source, mp4_path, max_size, self.MP4_CRF_STEPS, lambda crf: [
+                '-c:v', 'libx264', '-preset', 'slow', '-crf', str(crf),
+                '-profile:v', 'high', '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            ], scale)
+
+            webm_path = tmp_dir / f'{base_name}.webm'
+            self._encode_capped(ffmpeg, source, webm_path, max_size, self.WEBM_CRF_STEPS, lambda crf: [
+                '-c:v', 'libvpx-vp9', '-crf', str(crf), '-b:v', '0',
+                '-deadline', 'good', '-row-mt', '1',
+            ], scale)
+
+            with open(mp4_path, 'rb') as f:
+                slide.video_mp4.save(mp4_path.name, File(f), save=False)
+            with open(webm_path, 'rb') as f:
+                slide.video_webm.save(webm_path.name, File(f), save=False)
+
+            if regenerate_poster:
+                poster_bytes = self._extract_poster(ffmpeg, source, tmp_dir, scale)
+                slide.poster.save(f'{base_name}_poster.webp', poster_bytes, save=False)
+
+        slide.renditions_source = slide.video.name
+        slide.save(update_fields=['video_mp4', 'video_webm', 'poster', 'renditions_source', 'updated_at'])
+
+        current = {slide.video_mp4.name, slide.video_webm.name, slide.poster.name}
+        for storage, name in old_files:
+            if name in current:
+                continue
+            try:
+                storage.delete(name)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'     ⚠️  Could not delete old file {name}: {str(e)}'))
+
+        self.stdout.write(
+            f'     ✅ MP4 {self._format_size(slide.video_mp4.size)}, '
+            f'WebM {self._format_size(slide.video_webm.size)}, poster saved'
+        )
+
+    def _is_generated_poster(self, slide):
+        """True if the poster was extracted by this command (named after the previous source video)"""
+        if not slide.renditions_source:
+            return False
+        return Path(slide.poster.name).name.startswith(f'{Path(slide.renditions_source).stem}_poster')
+
+    def _encode_capped(self, ffmpeg, source, output, max_size, crf_steps, codec_args, scale):
+        """Encode with increasing CRF until the output fits max_size (keeps the last attempt otherwise)"""
+        for crf in crf_steps:
+            self._run([
+                ffmpeg, '-y', '-i', str(source),
+                '-an',  # Hero videos play muted - drop the audio track
+                '-vf', scale,
+                *codec_args(crf),
+                str(output),
+            ])
+            size = os.path.getsize(output)
+            if size <= max_size:
+                return size
+            self.stdout.write(self.style.WARNING(
+                f'     ⚠️  {output.suffix} is {self._format_size(size)} at CRF {crf}, retrying smaller'
+            ))
+        return os.path.getsize(output)
+
+    def _extract_poster(self, ffmpeg, source, tmp_dir, scale):
+        """Grab a frame 1s in (first frame is often black) and convert it to WebP"""
+        frame_path = tmp_dir / 'poster.jpg'
+        try:
+            self._run([ffmpeg, '-y', '-ss', '1', '-i', str(source), '-frames:v', '1', '-vf', scale, '-q:v', '3', str(frame_path)])
+        except CommandError:
+            frame_path.unlink(missing_ok=True)
+        if not frame_path.exists() or os.path.getsize(frame_path) == 0:
+            # Video shorter than 1s
+            self._run([ffmpeg, '-y', '-i', str(source), '-frames:v', '1', '-vf', scale, '-q:v', '3', str(frame_path)])
+
+        buffer = BytesIO()
+        with Image.open(frame_path) as img:
+            img.convert('RGB').save(buffer, format='WEBP', quality=80, method=6)
+        return ContentFile(buffer.getvalue())
+
+    def _run(self, command):
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            error_lines = result.stderr.decode('utf-8', errors='replace').strip().splitlines()
+            raise CommandError(f'ffmpeg failed: {error_lines[-1] if error_lines else "unknown error"}')
+
+    def _format_size(self, size_bytes):
+        """Format file size in human-readable format"""
+        for unit in ['B', 'KB', 'MB', 'GB']:
+            if size_bytes < 1024.0:
+                return f"{size_bytes:.2f} {unit}"
+            size_bytes /= 1024.0
+        return f"{size_bytes:.2f} TB"
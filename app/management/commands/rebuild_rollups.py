@@ -0,0 +1,80 @@
+"""
+Django management command to rebuild the sales rollup tables.
+
+Usage:
+    python manage.py rebuild_rollups [--start=2024-01-01] [--end=2024-12-31] [--days=N]
+
+Rebuilds DailySales and DailyProductSales from the orders (see
+app/utils/sales_rollup.py). Without options the whole order history is
+rebuilt; migration 0017 already does that once on deploy. Order changes
+keep the tables up to date afterwards by adjusting their rows; --days=2 from cron also repairs days changed by code that
+bypasses model signals.
+
+Each chunk locks its orders like the fallback rebuilds after order changes,
+so the two never insert the same day twice. A chunk that collides with a
+row inserted by a new order meanwhile is retried.
+"""
+
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from app.models import Order
+from app.utils.sales_rollup import order_day, rebuild_sales_rollups
+
+CHUNK_DAYS = 31  # days rebuilt per transaction
+CHUNK_ATTEMPTS = 3  # a new order's rollup row can race a chunk's inserts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups from orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD, default: first order)')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD, default: last order)')
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Rebuild only the last N days up to today'
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] is not None:
+            if options['days'] < 1:
+                raise CommandError('--days must be positive')
+            end = timezone.localdate()
+            start = end - timedelta(days=options['days'] - 1)
+        else:
+            bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+            if bounds['first'] is None and not (options['start'] and options['end']):
+                self.stdout.write('No orders - nothing to rebuild')
+                return
+            start = self._date(options['start']) if options['start'] else order_day(bounds['first'])
+            end = self._date(options['end']) if options['end'] else order_day(bounds['last'])
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        self.stdout.write(self.style.SUCCESS(f'\n📊 Rebuilding sales rollups {start} → {end}'))
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + timedelta(days=CHUNK_DAYS - 1))
+            for attempt in range(1, CHUNK_ATTEMPTS + 1):
+                try:
+                    rebuild_sales_rollups(chunk_start, chunk_end, lock=True)
+                    break
+                except IntegrityError:
+                    if attempt == CHUNK_ATTEMPTS:
+                        raise
+            self.stdout.write(f'   ✓ {chunk_start} → {chunk_end}')
+            chunk_start = chunk_end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS('✅ Sales rollups rebuilt'))
+
+    @staticmethod
+    def _date(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date: {value} (expected YYYY-MM-DD)')
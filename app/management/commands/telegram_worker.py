@@ -0,0 +1,95 @@
+"""
+Django management command to deliver queued Telegram messages and process
+incoming bot updates.
+
+Usage:
+    python manage.py telegram_worker [--interval=1] [--batch-size=100]
+                                     [--update-threads=4] [--once]
+
+Sends TelegramMessage rows queued by the site (new order notifications, ...)
+within Telegram's rate limits - see app/telegram_delivery.py - and handles the
+commands and button presses the webhook queued as TelegramUpdate rows - see
+app/telegram_updates.py. Run exactly one worker next to the web processes
+(e.g. as a systemd service or Procfile entry).
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.telegram_delivery import TelegramRateLimiter, deliver_due_messages, prune_delivered_messages
+from app.telegram_updates import process_pending_updates, prune_processed_updates
+
+logger = logging.getLogger(__name__)
+
+PRUNE_INTERVAL = 60 * 60  # seconds
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued Telegram messages with rate limiting and process bot updates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help='Seconds to wait when there was nothing to do (default: 1)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Due messages / pending updates loaded per round (default: 100)'
+        )
+        parser.add_argument(
+            '--update-threads',
+            type=int,
+            default=4,
+            help='Chats whose updates are processed concurrently (default: 4)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process pending updates, deliver what is due now and exit'
+        )
+
+    def handle(self, *args, **options):
+        limiter = TelegramRateLimiter()
+        batch_size = options['batch_size']
+
+        if options['once']:
+            processed = process_pending_updates(batch_size=batch_size)
+            sent = deliver_due_messages(limiter, batch_size)
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Processed {processed} update(s), sent {sent} Telegram message(s)'
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS('📨 Telegram worker started'))
+        last_prune = 0
+        executor = ThreadPoolExecutor(max_workers=max(1, options['update_threads']))
+        try:
+            while True:
+                # Long-running process - drop connections the database closed meanwhile
+                close_old_connections()
+                try:
+                    if time.monotonic() - last_prune > PRUNE_INTERVAL:
+                        prune_delivered_messages()
+                        prune_processed_updates()
+                        last_prune = time.monotonic()
+
+                    processed = process_pending_updates(executor, batch_size)
+                    sent = deliver_due_messages(limiter, batch_size)
+                except Exception as e:
+                    # e.g. the database went away - keep the worker alive and retry next round
+                    logger.error(f"Telegram worker round failed: {str(e)}", exc_info=True)
+                    processed = sent = 0
+                if not processed and not sent:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Telegram worker stopped')
+        finally:
+            executor.shutdown(wait=True)
@@ -53,6 +53,8 @@ class CompressionMiddleware(MiddlewareMixin):
 class CacheControlMiddleware(MiddlewareMixin):
     """
     Adds cache control headers for static assets.
+    HTML pages default to no-store unless the view sets its own Cache-Control
+    (e.g. pages that support conditional GET with ETags).
     """
     
     def process_response(self, request, response):
@@ -62,6 +64,9 @@ class CacheControlMiddleware(MiddlewareMixin):
         # Cache media files for 1 month
         elif request.path.startswith('/media/'):
             response['Cache-Control'] = 'public, max-age=2592000'
+        # Views that opted into caching/revalidation set Cache-Control themselves
+        elif response.has_header('Cache-Control'):
+            pass
         # Don't cache HTML pages
         elif response.get('Content-Type', '').startswith('text/html'):
             response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:19
+
+import app.models
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_remove_order_order_status_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='heroslide',
+            name='poster',
+            field=models.ImageField(blank=True, help_text='Poster frame shown until the video loads (generated automatically, or upload your own)', null=True, upload_to='hero_slides/posters/', validators=[app.models.validate_image_file, django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])]),
+        ),
+        migrations.AddField(
+            model_name='heroslide',
+            name='renditions_source',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Name of the uploaded video the renditions were generated from', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='heroslide',
+            name='video_mp4',
+            field=models.FileField(blank=True, help_text='Size-capped H.264 rendition of the uploaded video (generated automatically)', null=True, upload_to='hero_slides/renditions/'),
+        ),
+        migrations.AddField(
+            model_name='heroslide',
+            name='video_webm',
+            field=models.FileField(blank=True, help_text='Size-capped WebM (VP9) rendition of the uploaded video (generated automatically)', null=True, upload_to='hero_slides/renditions/'),
+        ),
+    ]
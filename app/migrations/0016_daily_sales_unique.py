@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:01
+
+from django.db import migrations, models
+
+
+def clear_rollups(apps, schema_editor):
+    """Concurrent rebuilds may have left duplicate rows - the tables are rebuilt from orders anyway"""
+    apps.get_model('app', 'DailySales').objects.all().delete()
+    apps.get_model('app', 'DailyProductSales').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_dailyproductsales_dailysales'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_rollups, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('date', 'status', 'product_name'), name='daily_product_sales_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(condition=models.Q(('promo_code__isnull', False)), fields=('date', 'status', 'payment_method', 'promo_code'), name='daily_sales_unique_with_code'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(condition=models.Q(('promo_code__isnull', True)), fields=('date', 'status', 'payment_method'), name='daily_sales_unique_without_code'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:10
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Fill the rollups from the existing orders (same aggregation as rebuild_sales_rollups)"""
+    Order = apps.get_model('app', 'Order')
+    OrderItem = apps.get_model('app', 'OrderItem')
+    DailySales = apps.get_model('app', 'DailySales')
+    DailyProductSales = apps.get_model('app', 'DailyProductSales')
+
+    DailySales.objects.all().delete()
+    DailyProductSales.objects.all().delete()
+
+    DailySales.objects.bulk_create([
+        DailySales(
+            date=row['day'], status=row['status'], payment_method=row['payment_method'],
+            promo_code_id=row['promo_code'], orders=row['orders'], subtotal=row['subtotal'],
+            discount_amount=row['discount_amount'], shipping_fee=row['shipping_fee'], total=row['total'],
+        )
+        for row in Order.objects.annotate(day=TruncDate('created_at')).values(
+            'day', 'status', 'payment_method', 'promo_code'
+        ).annotate(
+            orders=Count('id'),
+            subtotal=Sum('subtotal'),
+            discount_amount=Sum('discount_amount'),
+            shipping_fee=Sum('shipping_fee'),
+            total=Sum('total'),
+        ).order_by()
+    ], batch_size=500)
+
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(
+            date=row['day'], status=row['order__status'], product_name=row['product_name'],
+            quantity=row['quantity'], revenue=row['revenue'],
+        )
+        for row in OrderItem.objects.annotate(day=TruncDate('order__created_at')).values(
+            'day', 'order__status', 'product_name'
+        ).annotate(
+            quantity=Sum('quantity'),
+            revenue=Sum('subtotal'),
+        ).order_by()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_daily_sales_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
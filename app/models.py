@@ -188,6 +188,7 @@ class Order(models.Model):
             models.Index(fields=['order_number']),  # Already unique, but index for lookups
             models.Index(fields=['created_at']),  # For date-based queries
             models.Index(fields=['status', 'customer_received']),  # Composite for dashboard filtering
+            models.Index(fields=['updated_at']),  # For dashboard delta sync (?since=)
         ]
     
     def __str__(self):
@@ -504,6 +505,151 @@ class OrderQRCode(models.Model):
         super().save(*args, **kwargs)
 
 
+class DeletedOrder(models.Model):
+    """Tombstone for a deleted order so dashboard delta sync can remove its card"""
+    # Tombstones older than this are pruned; clients with an older cursor get a full resync
+    RETENTION = timedelta(days=7)
+    
+    order_id = models.BigIntegerField()
+    order_number = models.CharField(max_length=20)
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['-deleted_at']
+        verbose_name = "Deleted Order"
+        verbose_name_plural = "Deleted Orders"
+    
+    def __str__(self):
+        return f"Deleted order #{self.order_number}"
+    
+    @classmethod
+    def record(cls, order):
+        """Create a tombstone for an order and prune expired ones"""
+        cls.objects.filter(deleted_at__lt=timezone.now() - cls.RETENTION).delete()
+        return cls.objects.create(order_id=order.pk, order_number=order.order_number)
+
+
+class TelegramMessage(models.Model):
+    """Outgoing Telegram Bot API call, delivered by the telegram_worker command (see app/telegram_delivery.py)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    chat_id = models.CharField(max_length=64)
+    method = models.CharField(max_length=50, default='sendMessage')
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Telegram Message"
+        verbose_name_plural = "Telegram Messages"
+        indexes = [
+            # Worker poll: pending messages that are due, oldest first
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.method} to {self.chat_id} ({self.status})"
+
+
+class TelegramUpdate(models.Model):
+    """Incoming Telegram update, queued by the webhook and processed by the telegram_worker command (see app/telegram_updates.py)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    # Telegram redelivers an update until the webhook answers - the unique id drops the copies
+    update_id = models.BigIntegerField(unique=True)
+    chat_id = models.CharField(max_length=64)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['update_id']
+        verbose_name = "Telegram Update"
+        verbose_name_plural = "Telegram Updates"
+        indexes = [
+            # Worker poll: pending updates in arrival order
+            models.Index(fields=['status', 'update_id']),
+        ]
+    
+    def __str__(self):
+        return f"Update {self.update_id} from {self.chat_id} ({self.status})"
+
+
+class DailySales(models.Model):
+    """Orders rolled up per day, status, payment method and promo code (see app/utils/sales_rollup.py)"""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    payment_method = models.CharField(max_length=50, choices=Order.PAYMENT_METHOD_CHOICES)
+    promo_code = models.ForeignKey('PromoCode', on_delete=models.SET_NULL, null=True, blank=True)
+    orders = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    shipping_fee = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['date']
+        verbose_name = "Daily Sales"
+        verbose_name_plural = "Daily Sales"
+        indexes = [
+            models.Index(fields=['date']),  # Report date ranges
+        ]
+        constraints = [
+            # One row per rollup key (NULLs never collide, hence two partial constraints)
+            models.UniqueConstraint(
+                fields=['date', 'status', 'payment_method', 'promo_code'],
+                condition=models.Q(promo_code__isnull=False),
+                name='daily_sales_unique_with_code',
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'status', 'payment_method'],
+                condition=models.Q(promo_code__isnull=True),
+                name='daily_sales_unique_without_code',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.status} {self.payment_method}: {self.orders} order(s)"
+
+
+class DailyProductSales(models.Model):
+    """Order items rolled up per day, order status and product (see app/utils/sales_rollup.py)"""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    product_name = models.CharField(max_length=200)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['date']
+        verbose_name = "Daily Product Sales"
+        verbose_name_plural = "Daily Product Sales"
+        indexes = [
+            models.Index(fields=['date']),  # Report date ranges
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'status', 'product_name'], name='daily_product_sales_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.product_name}: {self.quantity}"
+
+
 class HeroSlide(models.Model):
     """Hero carousel slide for homepage"""
     SLIDE_TYPE_CHOICES = [
@@ -541,6 +687,34 @@ class HeroSlide(models.Model):
         help_text="External URL for image or video (if slide type is 'URL')"
     )
     
+    # Web-optimized renditions and poster frame (generated by `manage.py process_hero_videos`)
+    video_mp4 = models.FileField(
+        upload_to='hero_slides/renditions/',
+        blank=True,
+        null=True,
+        help_text="Size-capped H.264 rendition of the uploaded video (generated automatically)"
+    )
+    video_webm = models.FileField(
+        upload_to='hero_slides/renditions/',
+        blank=True,
+        null=True,
+        help_text="Size-capped WebM (VP9) rendition of the uploaded video (generated automatically)"
+    )
+    poster = models.ImageField(
+        upload_to='hero_slides/posters/',
+        blank=True,
+        null=True,
+        help_text="Poster frame shown until the video loads (generated automatically, or upload your own)",
+        validators=[validate_image_file, FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'webp'])]
+    )
+    renditions_source = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Name of the uploaded video the renditions were generated from"
+    )
+    
     order = models.IntegerField(default=0, help_text="Display order (lower numbers appear first)")
     is_active = models.BooleanField(default=True, help_text="Show this slide in the carousel")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -557,6 +731,34 @@ class HeroSlide(models.Model):
             return f"{self.title} ({media_type})"
         return f"Hero Slide #{self.id} ({media_type})"
     
+    def needs_video_processing(self):
+        """Check if the uploaded video has no up-to-date renditions yet"""
+        if self.slide_type != 'video' or not self.video:
+            return False
+        return (
+            self.renditions_source != self.video.name
+            or not self.video_mp4
+            or not self.poster
+        )
+    
+    def get_video_sources(self):
+        """Get (url, mime type) video sources in order of preference for the <video> tag"""
+        if self.slide_type != 'video' or not self.video:
+            return []
+        
+        # Renditions are only used if they were generated from the current upload
+        sources = []
+        if self.renditions_source == self.video.name:
+            if self.video_webm:
+                sources.append((self.video_webm.url, 'video/webm'))
+            if self.video_mp4:
+                sources.append((self.video_mp4.url, 'video/mp4'))
+        if not sources:
+            mime_types = {'.mp4': 'video/mp4', '.webm': 'video/webm', '.mov': 'video/quicktime'}
+            ext = os.path.splitext(self.video.name)[1].lower()
+            sources.append((self.video.url, mime_types.get(ext, 'video/mp4')))
+        return sources
+    
     def get_media_url(self):
         """Get the URL for the slide media"""
         if self.slide_type == 'image' and self.image:
@@ -6,5 +6,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/orders/$', consumers.OrderConsumer.as_asgi()),
+    re_path(r'ws/track/$', consumers.OrderTrackingConsumer.as_asgi()),
 ]
 
@@ -0,0 +1,183 @@
+"""
+Model signals for MADAM DA E-Commerce
+Keeps cached data in sync with admin edits
+"""
+import logging
+from django.db import transaction
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import HeroSlide, Product, PromoCode, Order, OrderItem, DeletedOrder
+from .utils.cache_bus import invalidate
+from .utils.dashboard_stats import counted_column, apply_column_transition, invalidate_dashboard_counts
+from .utils.sales_rollup import (
+    clear_promo_code_rollups, item_state, order_state, record_item_change, record_order_change,
+)
+from .utils.stock_cache import invalidate_product_stock
+
+logger = logging.getLogger(__name__)
+
+# Marker for orders loaded without status/customer_received
+UNKNOWN_COLUMN = object()
+
+
+def _invalidate_on_commit(*namespaces):
+    """Publish invalidations after the transaction commits (readers must not reload old rows)"""
+    def publish():
+        for namespace in namespaces:
+            try:
+                invalidate(namespace)
+            except Exception as e:
+                logger.warning(f"Could not invalidate cache namespace {namespace}: {e}")
+    transaction.on_commit(publish)
+
+
+@receiver([post_save, post_delete], sender=HeroSlide)
+def invalidate_hero_slides_cache(sender, **kwargs):
+    """Drop cached hero slides so the shop page (and its ETag) reflect admin edits immediately"""
+    _invalidate_on_commit('hero_slides', 'catalog')
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Product edits (including stock changes) change the shop page version"""
+    _invalidate_on_commit('catalog')
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_stock_cache(sender, instance, **kwargs):
+    """Admin edits to price, stock or the active flag must reach cart revalidation right away"""
+    product_ids = [instance.pk]
+    transaction.on_commit(lambda: invalidate_product_stock(product_ids))
+
+
+@receiver([post_save, post_delete], sender=PromoCode)
+def invalidate_promo_code_cache(sender, **kwargs):
+    _invalidate_on_commit('promo_codes')
+
+
+@receiver(post_init, sender=Order)
+def remember_order_column(sender, instance, **kwargs):
+    """Remember the counted dashboard column as loaded, to detect transitions on save"""
+    if 'status' in instance.__dict__ and 'customer_received' in instance.__dict__:
+        instance._initial_dashboard_column = counted_column(instance.status, instance.customer_received)
+    else:
+        # Deferred fields (.only()/.defer()) - don't trigger a query per instance
+        instance._initial_dashboard_column = UNKNOWN_COLUMN
+
+
+@receiver(post_save, sender=Order)
+def update_dashboard_counters(sender, instance, created, **kwargs):
+    """Keep the cached dashboard column counters in step with status transitions"""
+    old_column = None if created else instance._initial_dashboard_column
+    new_column = counted_column(instance.status, instance.customer_received)
+    instance._initial_dashboard_column = new_column
+    if old_column is UNKNOWN_COLUMN:
+        transaction.on_commit(invalidate_dashboard_counts)
+    elif old_column != new_column:
+        transaction.on_commit(lambda: apply_column_transition(old_column, new_column))
+
+
+@receiver(post_delete, sender=Order)
+def record_deleted_order(sender, instance, **kwargs):
+    """Leave a tombstone so employee dashboards in delta-sync mode drop the card"""
+    try:
+        # Savepoint so a failure here doesn't break the surrounding delete transaction
+        with transaction.atomic():
+            DeletedOrder.record(instance)
+    except Exception as e:
+        logger.warning(f"Could not record deleted order {instance.order_number}: {e}")
+
+    column = instance._initial_dashboard_column
+    if column is UNKNOWN_COLUMN:
+        transaction.on_commit(invalidate_dashboard_counts)
+    elif column:
+        transaction.on_commit(lambda: apply_column_transition(column, None))
+
+
+@receiver(post_init, sender=Order)
+def remember_order_rollup_state(sender, instance, **kwargs):
+    """Remember the rollup values as loaded, so a save only moves what changed"""
+    instance._rollup_state = order_state(instance)
+
+
+@receiver(post_save, sender=Order)
+def update_order_sales_rollup(sender, instance, created, **kwargs):
+    """Apply the order's change to the sales rollups (nothing to do if no rollup field changed)"""
+    record_order_change(instance, None if created else instance._rollup_state)
+    instance._rollup_state = order_state(instance)
+
+
+@receiver(post_delete, sender=Order)
+def remove_order_sales_rollup(sender, instance, **kwargs):
+    record_order_change(instance, instance._rollup_state, deleted=True)
+
+
+@receiver(pre_delete, sender=PromoCode)
+def clear_deleted_promo_code_rollups(sender, instance, **kwargs):
+    """Its rollup rows can't just lose the code - they would collide with the rows without one"""
+    clear_promo_code_rollups(instance)
+
+
+@receiver(post_init, sender=OrderItem)
+def remember_item_rollup_state(sender, instance, **kwargs):
+    instance._rollup_state = item_state(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+def update_item_sales_rollup(sender, instance, created, **kwargs):
+    """Item edits change the product rollup of the order's day"""
+    record_item_change(instance, None if created else instance._rollup_state)
+    instance._rollup_state = item_state(instance)
+
+
+@receiver(post_delete, sender=OrderItem)
+def remove_item_sales_rollup(sender, instance, **kwargs):
+    record_item_change(instance, instance._rollup_state, deleted=True)
+
+
+def _invalidate_employee_access_on_commit(user_ids):
+    """Drop cached is_employee results once the change is visible to the next lookup"""
+    from .employee_views import invalidate_employee_cache
+
+    user_ids = list(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: invalidate_employee_cache(user_ids))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_employee_access(sender, instance, action, reverse, pk_set, **kwargs):
+    """Group membership changed - drop cached is_employee results for the affected users"""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # user.groups.add/remove/clear(...)
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        # group.user_set.clear() - pk_set is not provided, so collect the members first
+        user_ids = instance.user_set.values_list('pk', flat=True)
+    else:
+        # group.user_set.add/remove(...)
+        user_ids = pk_set or []
+    _invalidate_employee_access_on_commit(user_ids)
+
+
+@receiver([post_save, pre_delete], sender=Group)
+def invalidate_group_employee_access(sender, instance, created=False, **kwargs):
+    """A renamed or deleted group can add or remove Employee access for all its members"""
+    if created:
+        return
+    # pre_delete: the memberships are gone (without m2m_changed) by post_delete
+    _invalidate_employee_access_on_commit(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_employee_access(sender, instance, created=False, update_fields=None, **kwargs):
+    """Drop the user's cached access when the account is edited or deleted"""
+    if created:
+        return
+    if update_fields is not None and not {'is_active', 'is_staff', 'is_superuser'} & set(update_fields):
+        # e.g. last_login on every login
+        return
+    _invalidate_employee_access_on_commit([instance.pk])
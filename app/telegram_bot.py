@@ -2,102 +2,165 @@
 Telegram Bot for Employee Order Management
 Allows employees to manage orders directly from Telegram
 """
-import requests
-import json
+import logging
+from datetime import datetime
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Window
 from django.utils import timezone
 from .models import Order, OrderItem
 from django.urls import reverse
+from .telegram_delivery import call_telegram_api, queue_telegram_message
+from .utils.order_snapshot import format_item, format_order, get_order_snapshot, send_order_event
+
+logger = logging.getLogger(__name__)
+
+STATUS_EMOJI = {
+    'pending': '⏳',
+    'confirmed': '✅',
+    'preparing': '👷',
+    'ready_for_delivery': '📦',
+    'out_for_delivery': '🚚',
+    'delivered': '🎉',
+    'cancelled': '❌'
+}
+
+# Next step offered on an order's button: current status -> (new status, label)
+NEXT_ACTIONS = {
+    'pending': ('preparing', '👷 Start Preparing'),
+    'confirmed': ('preparing', '👷 Start Preparing'),
+    'preparing': ('ready_for_delivery', '📦 Mark Ready'),
+    'ready_for_delivery': ('out_for_delivery', '🚚 Out for Delivery'),
+    'out_for_delivery': ('delivered', '✅ Mark Delivered'),
+}
+
+# List commands: one message per page, LIST_PAGE_SIZE orders each
+LIST_PAGE_SIZE = 10
+LIST_VIEWS = {
+    'orders': {
+        'statuses': ['pending', 'confirmed'],
+        'title': '📋 <b>Orders to Prepare</b>',
+        'empty': "✅ No orders to prepare. All caught up!",
+    },
+    'preparing': {
+        'statuses': ['preparing'],
+        'title': '👷 <b>Currently Preparing</b>',
+        'empty': "📦 No orders currently being prepared.",
+    },
+    'ready': {
+        'statuses': ['ready_for_delivery'],
+        'title': '📦 <b>Ready for Delivery</b>',
+        'empty': "✅ No orders ready for delivery.",
+    },
+    'out': {
+        'statuses': ['out_for_delivery'],
+        'title': '🚚 <b>Out for Delivery</b>',
+        'empty': "🚚 No orders out for delivery.",
+    },
+}
+LIST_COMMANDS = {f'/{view}': view for view in LIST_VIEWS}
+LIST_FIELDS = (
+    'order_number', 'status', 'customer_name', 'customer_phone', 'customer_province',
+    'total', 'payment_method', 'payment_received', 'created_at',
+)
 
 
 def send_telegram_message(chat_id, text, reply_markup=None, parse_mode='HTML'):
-    """Send message to Telegram with proper error handling"""
-    import logging
+    """Send message to Telegram right away (bot replies); notifications use queue_telegram_message"""
+    if not settings.TELEGRAM_BOT_TOKEN:
+        logger.warning("Telegram bot token not configured")
+        return False
     
-    logger = logging.getLogger(__name__)
+    data = {
+        'chat_id': chat_id,
+        'text': text,
+        'parse_mode': parse_mode
+    }
     
-    try:
-        bot_token = settings.TELEGRAM_BOT_TOKEN
-        if not bot_token:
-            logger.warning("Telegram bot token not configured")
-            return False
-        
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        
-        data = {
-            'chat_id': chat_id,
-            'text': text,
-            'parse_mode': parse_mode
-        }
-        
-        if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
-        
-        response = requests.post(url, json=data, timeout=10)
-        response.raise_for_status()  # Raise exception for bad status codes
-        
-        result = response.json()
-        if result.get('ok'):
-            return True
-        else:
-            error_desc = result.get('description', 'Unknown error')
-            logger.error(f"Telegram API error: {error_desc}")
-            return False
-            
-    except requests.exceptions.Timeout:
-        logger.error("Telegram API timeout")
-        return False
-    except requests.exceptions.ConnectionError:
-        logger.error("Telegram API connection error")
-        return False
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"Telegram API HTTP error {e.response.status_code}: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"Error sending Telegram message: {e}", exc_info=True)
+    if reply_markup:
+        data['reply_markup'] = reply_markup
+    
+    result = call_telegram_api('sendMessage', data)
+    if result.get('ok'):
+        return True
+    logger.error(f"Telegram API error: {result.get('description', 'Unknown error')}")
+    return False
+
+
+def edit_telegram_message(chat_id, message_id, text, reply_markup=None, parse_mode='HTML'):
+    """Replace the text (and keyboard) of a message the bot sent earlier"""
+    if not settings.TELEGRAM_BOT_TOKEN:
+        logger.warning("Telegram bot token not configured")
         return False
+    
+    data = {
+        'chat_id': chat_id,
+        'message_id': message_id,
+        'text': text,
+        'parse_mode': parse_mode
+    }
+    
+    if reply_markup:
+        data['reply_markup'] = reply_markup
+    
+    result = call_telegram_api('editMessageText', data)
+    # Pressing the button of the page already shown leaves the message unchanged
+    if result.get('ok') or 'message is not modified' in result.get('description', ''):
+        return True
+    logger.error(f"Telegram API error: {result.get('description', 'Unknown error')}")
+    return False
+
+
+def answer_callback_query(callback_query_id, text=None, show_alert=False):
+    """Stop the button's loading state, optionally showing a notice"""
+    data = {'callback_query_id': callback_query_id}
+    if text:
+        data['text'] = text
+        data['show_alert'] = show_alert
+    
+    result = call_telegram_api('answerCallbackQuery', data, timeout=5)
+    if not result.get('ok'):
+        logger.warning(f"Telegram answerCallbackQuery failed: {result.get('description', 'Unknown error')}")
+    return result.get('ok', False)
 
 
 def format_order_message(order, include_items=True):
-    """Format order details for Telegram message"""
+    """Format order details (Order instance or order snapshot) for Telegram message"""
     try:
+        if not isinstance(order, dict):
+            items = None
+            if include_items:
+                items = [format_item(item) for item in OrderItem.objects.filter(order=order)]
+            order = format_order(order, items=items)
+        
         items_text = ""
         if include_items:
-            items = OrderItem.objects.filter(order=order)
-            for item in items:
-                items_text += f"  • {item.product_name} x{item.quantity} = ${item.subtotal}\n"
-        
-        status_emoji = {
-            'pending': '⏳',
-            'confirmed': '✅',
-            'preparing': '👷',
-            'ready_for_delivery': '📦',
-            'out_for_delivery': '🚚',
-            'delivered': '🎉',
-            'cancelled': '❌'
-        }
+            for item in order.get('items', []):
+                items_text += f"  • {item['product_name']} x{item['quantity']} = ${item['subtotal']}\n"
         
-        payment_emoji = '💰' if order.payment_method == 'Cash on Delivery' else '💳'
+        payment_emoji = '💰' if order['payment_method'] == 'Cash on Delivery' else '💳'
+        created_at = datetime.fromisoformat(order['created_at'])
         
-        message = f"""📦 <b>Order #{order.order_number}</b>
+        message = f"""📦 <b>Order #{order['order_number']}</b>
 
-{status_emoji.get(order.status, '📋')} Status: <b>{order.get_status_display()}</b>
-{payment_emoji} Payment: <b>{order.payment_method}</b>
+{STATUS_EMOJI.get(order['status'], '📋')} Status: <b>{order['status_display']}</b>
+{payment_emoji} Payment: <b>{order['payment_method']}</b>
 
 👤 <b>Customer:</b>
-   Name: {order.customer_name}
-   Phone: {order.customer_phone}
-   Address: {order.customer_address}
-   Province: {order.customer_province}
+   Name: {order['customer_name']}
+   Phone: {order['customer_phone']}
+   Address: {order['customer_address']}
+   Province: {order['customer_province']}
 
 {items_text if items_text else ''}
-💰 Total: <b>${order.total}</b>
-⏰ Time: {order.created_at.strftime('%Y-%m-%d %H:%M')}
+💰 Total: <b>${order['total']}</b>
+⏰ Time: {created_at.strftime('%Y-%m-%d %H:%M')}
 """
         
         # Add COD payment status if applicable
-        if order.payment_method == 'Cash on Delivery':
-            if order.payment_received:
+        if order['payment_method'] == 'Cash on Delivery':
+            if order['payment_received']:
                 message += "\n✅ Payment: <b>Received</b>"
             else:
                 message += "\n⏳ Payment: <b>Pending</b>"
@@ -107,40 +170,37 @@ def format_order_message(order, include_items=True):
         return f"Error formatting order: {str(e)}"
 
 
+def order_action_button(order, label=None, prefix='status'):
+    """
+    Inline button moving an order to its next status, or None
+    
+    Order cards use status_ORDERNUMBER_NEWSTATUS; list pages pass
+    prefix='ls_VIEW_PAGE' so the page can be re-rendered after the change.
+    """
+    action = NEXT_ACTIONS.get(order.status)
+    if not action:
+        return None
+    new_status, text = action
+    return {
+        'text': f'{label}: {text}' if label else text,
+        'callback_data': f'{prefix}_{order.order_number}_{new_status}'
+    }
+
+
 def create_order_keyboard(order):
     """Create inline keyboard for order actions"""
     keyboard = []
     
-    # Status update buttons based on current status
-    if order.status in ['pending', 'confirmed']:
-        keyboard.append([{
-            'text': '👷 Start Preparing',
-            'callback_data': f'status_{order.order_number}_preparing'
-        }])
-    
-    elif order.status == 'preparing':
-        keyboard.append([{
-            'text': '📦 Mark Ready',
-            'callback_data': f'status_{order.order_number}_ready_for_delivery'
-        }])
-        
-        # QR code button for COD orders
-        if order.payment_method == 'Cash on Delivery' and not order.payment_received:
-            keyboard.append([{
-                'text': '🖨️ Get QR Code Link',
-                'callback_data': f'qr_{order.order_number}'
-            }])
-    
-    elif order.status == 'ready_for_delivery':
-        keyboard.append([{
-            'text': '🚚 Out for Delivery',
-            'callback_data': f'status_{order.order_number}_out_for_delivery'
-        }])
+    # Status update button based on current status
+    button = order_action_button(order)
+    if button:
+        keyboard.append([button])
     
-    elif order.status == 'out_for_delivery':
+    # QR code button for COD orders
+    if order.status == 'preparing' and order.payment_method == 'Cash on Delivery' and not order.payment_received:
         keyboard.append([{
-            'text': '✅ Mark Delivered',
-            'callback_data': f'status_{order.order_number}_delivered'
+            'text': '🖨️ Get QR Code Link',
+            'callback_data': f'qr_{order.order_number}'
         }])
     
     # Always show view details button
@@ -152,8 +212,70 @@ def create_order_keyboard(order):
     return {'inline_keyboard': keyboard}
 
 
+def format_order_line(order):
+    """One-entry summary of an order for list messages"""
+    payment_emoji = '💰' if order.payment_method == 'Cash on Delivery' else '💳'
+    line = (
+        f"{STATUS_EMOJI.get(order.status, '📋')} <b>#{order.order_number}</b> · ${order.total} {payment_emoji}"
+        f"\n   {order.customer_name} · {order.customer_phone} · {order.customer_province}"
+        f"\n   ⏰ {order.created_at.strftime('%m-%d %H:%M')}"
+    )
+    if order.payment_method == 'Cash on Delivery' and not order.payment_received:
+        line += " · ⏳ COD unpaid"
+    return line
+
+
+def render_order_list(view, page=0):
+    """
+    Text and keyboard for one page of a list command
+    
+    A single query fetches the page and, through a window count, the total.
+    
+    Returns:
+        (text, reply_markup or None)
+    """
+    config = LIST_VIEWS[view]
+    page = max(0, page)
+    offset = page * LIST_PAGE_SIZE
+    orders = list(
+        Order.objects.filter(status__in=config['statuses'])
+        .only(*LIST_FIELDS)
+        .annotate(total_count=Window(Count('id')))
+        .order_by('-created_at', '-id')[offset:offset + LIST_PAGE_SIZE]
+    )
+    
+    if not orders and page == 0:
+        return config['empty'], None
+    
+    total = orders[0].total_count if orders else 0
+    keyboard = []
+    if orders:
+        lines = [format_order_line(order) for order in orders]
+        text = (
+            f"{config['title']} ({total})\n"
+            f"Showing {offset + 1}–{offset + len(orders)}\n\n" + '\n\n'.join(lines)
+        )
+        for order in orders:
+            button = order_action_button(order, label=order.order_number, prefix=f'ls_{view}_{page}')
+            if button:
+                keyboard.append([button])
+    else:
+        # Page emptied since it was shown (orders moved on)
+        text = f"{config['title']}\n\nNo more orders on this page."
+    
+    navigation = []
+    if page > 0:
+        navigation.append({'text': '⬅️ Previous', 'callback_data': f'list_{view}_{page - 1}'})
+    if offset + len(orders) < total:
+        navigation.append({'text': f'Next {LIST_PAGE_SIZE} ➡️', 'callback_data': f'list_{view}_{page + 1}'})
+    navigation.append({'text': '🔄 Refresh', 'callback_data': f'list_{view}_{page}'})
+    keyboard.append(navigation)
+    
+    return text, {'inline_keyboard': keyboard}
+
+
 def send_new_order_notification(order, employee_chat_ids=None):
-    """Send new order notification to employees"""
+    """Queue new order notification to employees (sent by the telegram_worker command)"""
     if not employee_chat_ids:
         # Default to admin chat if no employee IDs specified
         employee_chat_ids = [settings.TELEGRAM_CHAT_ID] if settings.TELEGRAM_CHAT_ID else []
@@ -165,7 +287,7 @@ def send_new_order_notification(order, employee_chat_ids=None):
     keyboard = create_order_keyboard(order)
     
     for chat_id in employee_chat_ids:
-        send_telegram_message(chat_id, message, reply_markup=keyboard)
+        queue_telegram_message(chat_id, message, reply_markup=keyboard)
 
 
 def handle_telegram_command(command, chat_id, message_text=None):
@@ -191,56 +313,9 @@ Use buttons on order messages to update status instantly!
         send_telegram_message(chat_id, help_text)
         return True
     
-    elif command == '/orders':
-        orders = Order.objects.filter(status__in=['pending', 'confirmed']).order_by('-created_at')[:10]
-        if not orders:
-            send_telegram_message(chat_id, "✅ No orders to prepare. All caught up!")
-            return True
-        
-        send_telegram_message(chat_id, f"📋 <b>Orders to Prepare ({orders.count()})</b>")
-        for order in orders:
-            message = format_order_message(order, include_items=False)
-            keyboard = create_order_keyboard(order)
-            send_telegram_message(chat_id, message, reply_markup=keyboard)
-        return True
-    
-    elif command == '/preparing':
-        orders = Order.objects.filter(status='preparing').order_by('-created_at')[:10]
-        if not orders:
-            send_telegram_message(chat_id, "📦 No orders currently being prepared.")
-            return True
-        
-        send_telegram_message(chat_id, f"👷 <b>Currently Preparing ({orders.count()})</b>")
-        for order in orders:
-            message = format_order_message(order, include_items=False)
-            keyboard = create_order_keyboard(order)
-            send_telegram_message(chat_id, message, reply_markup=keyboard)
-        return True
-    
-    elif command == '/ready':
-        orders = Order.objects.filter(status='ready_for_delivery').order_by('-created_at')[:10]
-        if not orders:
-            send_telegram_message(chat_id, "✅ No orders ready for delivery.")
-            return True
-        
-        send_telegram_message(chat_id, f"📦 <b>Ready for Delivery ({orders.count()})</b>")
-        for order in orders:
-            message = format_order_message(order, include_items=False)
-            keyboard = create_order_keyboard(order)
-            send_telegram_message(chat_id, message, reply_markup=keyboard)
-        return True
-    
-    elif command == '/out':
-        orders = Order.objects.filter(status='out_for_delivery').order_by('-created_at')[:10]
-        if not orders:
-            send_telegram_message(chat_id, "🚚 No orders out for delivery.")
-            return True
-        
-        send_telegram_message(chat_id, f"🚚 <b>Out for Delivery ({orders.count()})</b>")
-        for order in orders:
-            message = format_order_message(order, include_items=False)
-            keyboard = create_order_keyboard(order)
-            send_telegram_message(chat_id, message, reply_markup=keyboard)
+    elif command in LIST_COMMANDS:
+        text, keyboard = render_order_list(LIST_COMMANDS[command])
+        send_telegram_message(chat_id, text, reply_markup=keyboard)
         return True
     
     elif command.startswith('/order '):
@@ -258,55 +333,95 @@ Use buttons on order messages to update status instantly!
     return False
 
 
-def handle_callback_query(callback_data, chat_id, message_id):
-    """Handle inline button callbacks"""
+def update_order_status(order_number, new_status):
+    """
+    Move an order to new_status from a bot button
+    
+    Applies the same transition rules and WebSocket event as the employee
+    dashboard.
+    
+    Returns:
+        (order, notice, ok) - order is None if it doesn't exist
+    """
+    with transaction.atomic():
+        # Lock the row so the transition validated here is the one applied
+        try:
+            order = Order.objects.select_for_update().get(order_number=order_number)
+        except Order.DoesNotExist:
+            return None, f"❌ Order {order_number} not found.", False
+        
+        old_status = order.status
+        try:
+            order.validate_status_transition(new_status)
+        except ValidationError:
+            # Stale button - someone already moved the order on
+            return order, f"⚠️ Order #{order_number} is {order.get_status_display()}, it can't be changed to that.", False
+        
+        order.status = new_status
+        if new_status == 'delivered' and not order.customer_received:
+            order.customer_received = True
+            order.customer_received_at = timezone.now()
+            order.customer_received_by = 'Telegram Bot (Auto)'
+        order.save()
+        send_order_event('status_changed', order, old_status=old_status, new_status=new_status)
+    
+    return order, f"✅ Order #{order_number}: {order.get_status_display()}", True
+
+
+def handle_callback_query(callback_data, chat_id, message_id, callback_query_id=None):
+    """
+    Handle inline button callbacks
+    
+    Status buttons edit the message they belong to (order card or list page)
+    instead of sending new ones; the outcome is shown as the callback's notice.
+    """
+    notice, alert, handled = None, False, False
     try:
-        if callback_data.startswith('status_'):
-            # Format: status_ORDERNUMBER_NEWSTATUS
-            parts = callback_data.split('_', 2)
-            if len(parts) >= 3:
-                order_number = parts[1]
-                new_status = parts[2]
+        if callback_data.startswith('status_') or callback_data.startswith('ls_'):
+            # Formats: status_ORDERNUMBER_NEWSTATUS (order card)
+            #          ls_VIEW_PAGE_ORDERNUMBER_NEWSTATUS (list page)
+            parts = callback_data.split('_', 4) if callback_data.startswith('ls_') else callback_data.split('_', 2)
+            if len(parts) == 5 and parts[1] in LIST_VIEWS and parts[2].isdigit():
+                view, page, order_number, new_status = parts[1], int(parts[2]), parts[3], parts[4]
+            elif len(parts) == 3 and parts[0] == 'status':
+                view, page, order_number, new_status = None, 0, parts[1], parts[2]
+            else:
+                order_number = None
+            
+            if order_number:
+                order, notice, updated = update_order_status(order_number, new_status)
+                alert = not updated
                 
-                try:
-                    order = Order.objects.get(order_number=order_number)
-                    old_status = order.status
-                    order.status = new_status
-                    order.save()
-                    
-                    # Send confirmation
-                    status_names = {
-                        'preparing': 'Preparing',
-                        'ready_for_delivery': 'Ready for Delivery',
-                        'out_for_delivery': 'Out for Delivery',
-                        'delivered': 'Delivered'
-                    }
-                    
-                    confirm_message = f"✅ Order #{order_number} status updated to <b>{status_names.get(new_status, new_status)}</b>"
-                    send_telegram_message(chat_id, confirm_message)
-                    
-                    # Send updated order info
-                    message = format_order_message(order)
-                    keyboard = create_order_keyboard(order)
-                    send_telegram_message(chat_id, message, reply_markup=keyboard)
-                    
-                    return True
-                except Order.DoesNotExist:
-                    send_telegram_message(chat_id, f"❌ Order {order_number} not found.")
-                    return True
+                # Refresh the message in place so its buttons match the order again
+                if view:
+                    text, keyboard = render_order_list(view, page)
+                    edit_telegram_message(chat_id, message_id, text, reply_markup=keyboard)
+                elif order is not None:
+                    text = format_order_message(get_order_snapshot(order))
+                    edit_telegram_message(chat_id, message_id, text, reply_markup=create_order_keyboard(order))
+                handled = True
+        
+        elif callback_data.startswith('list_'):
+            # Format: list_VIEW_PAGE - page through a list command in place
+            parts = callback_data.split('_')
+            if len(parts) == 3 and parts[1] in LIST_VIEWS and parts[2].isdigit():
+                text, keyboard = render_order_list(parts[1], int(parts[2]))
+                edit_telegram_message(chat_id, message_id, text, reply_markup=keyboard)
+                handled = True
         
         elif callback_data.startswith('qr_'):
             # Format: qr_ORDERNUMBER
             order_number = callback_data.replace('qr_', '')
-            try:
-                order = Order.objects.get(order_number=order_number)
-                
-                if order.payment_method != 'Cash on Delivery':
-                    send_telegram_message(chat_id, "❌ This order is not Cash on Delivery.")
-                    return True
-                
+            order = Order.objects.filter(order_number=order_number).only(
+                'order_number', 'customer_name', 'total', 'payment_method'
+            ).first()
+            
+            if order is None:
+                notice, alert = f"❌ Order {order_number} not found.", True
+            elif order.payment_method != 'Cash on Delivery':
+                notice, alert = "❌ This order is not Cash on Delivery.", True
+            else:
                 # Generate QR code URL
-                qr_url = f"http://127.0.0.1:8000/cod/print/{order_number}/"
                 print_url = f"http://127.0.0.1:8000/cod/print/{order_number}/"
                 
                 message = f"""🖨️ <b>QR Code for Order #{order_number}</b>
@@ -325,15 +440,14 @@ http://127.0.0.1:8000/cod/qr/{order_number}/
 <b>Customer:</b> {order.customer_name}
 <b>Total:</b> ${order.total}
 """
+                # A separate message, so it can be forwarded to the driver
                 send_telegram_message(chat_id, message)
-                return True
-            except Order.DoesNotExist:
-                send_telegram_message(chat_id, f"❌ Order {order_number} not found.")
-                return True
+            handled = True
         
     except Exception as e:
-        send_telegram_message(chat_id, f"❌ Error: {str(e)}")
-        return False
+        logger.error(f"Error handling Telegram callback {callback_data}: {str(e)}", exc_info=True)
+        notice, alert, handled = f"❌ Error: {str(e)}", True, False
     
-    return False
-
+    if callback_query_id:
+        answer_callback_query(callback_query_id, notice, show_alert=alert)
+    return handled
@@ -0,0 +1,215 @@
+"""
+Telegram delivery for MADAM DA E-Commerce
+
+Requests never talk to Telegram while a customer waits: notifications are
+queued as TelegramMessage rows (committed together with the order) and sent by
+the telegram_worker management command.
+
+The worker respects Telegram's limits with token buckets - about 30 messages/s
+for the bot and 1 message/s per chat (TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE) -
+and honours 429 retry_after by pausing that chat. Messages to a chat are
+delivered in the order they were queued. Run one worker; the buckets live in
+its process.
+
+All Bot API calls share one pooled HTTP session (call_telegram_api).
+"""
+import logging
+import time
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import TelegramMessage
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 5  # seconds, doubled per failed attempt
+
+# Sent/failed messages are kept this long for troubleshooting
+DELIVERED_RETENTION = timedelta(days=7)
+
+_session = None
+
+
+def _get_session():
+    """Keep-alive session shared by every Bot API call in the process"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return _session
+
+
+def call_telegram_api(method, data, timeout=10):
+    """
+    Call a Bot API method
+
+    Returns:
+        Telegram's response ({'ok': True, 'result': ...} or {'ok': False,
+        'error_code': ..., 'description': ..., 'parameters': {...}}). Network
+        failures come back as {'ok': False, 'description': ...} without error_code.
+    """
+    bot_token = settings.TELEGRAM_BOT_TOKEN
+    if not bot_token:
+        return {'ok': False, 'description': 'Telegram bot token not configured'}
+
+    url = f"https://api.telegram.org/bot{bot_token}/{method}"
+    try:
+        response = _get_session().post(url, json=data, timeout=timeout)
+    except requests.exceptions.Timeout:
+        return {'ok': False, 'description': 'Telegram API timeout'}
+    except requests.exceptions.ConnectionError:
+        return {'ok': False, 'description': 'Telegram API connection error'}
+
+    try:
+        return response.json()
+    except ValueError:
+        return {
+            'ok': False,
+            'error_code': response.status_code,
+            'description': f'Invalid response (HTTP {response.status_code})',
+        }
+
+
+def queue_telegram_call(chat_id, method, payload):
+    """Queue a Bot API call for the worker (part of the current transaction)"""
+    return TelegramMessage.objects.create(chat_id=str(chat_id), method=method, payload=payload)
+
+
+def queue_telegram_message(chat_id, text, reply_markup=None, parse_mode='HTML'):
+    """Queue a sendMessage for the worker"""
+    payload = {'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode}
+    if reply_markup:
+        payload['reply_markup'] = reply_markup
+    return queue_telegram_call(chat_id, 'sendMessage', payload)
+
+
+class TokenBucket:
+    """rate tokens per second, bursts up to capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        now = time.monotonic() if now is None else now
+        # now may predate a bucket created after the caller read the clock
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(now, self.updated)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class TelegramRateLimiter:
+    """Global and per-chat token buckets plus 429 pauses"""
+
+    def __init__(self, global_rate=None, chat_rate=None):
+        self.chat_rate = chat_rate or getattr(settings, 'TELEGRAM_CHAT_RATE', 1)
+        self.global_bucket = TokenBucket(global_rate or getattr(settings, 'TELEGRAM_GLOBAL_RATE', 30))
+        self.chat_buckets = {}
+        self.paused_until = {}  # chat id -> monotonic time
+
+    def global_available(self, now=None):
+        """Whether a global token is left (doesn't take it)"""
+        bucket = self.global_bucket
+        now = time.monotonic() if now is None else now
+        return bucket.tokens + (now - bucket.updated) * bucket.rate >= 1
+
+    def acquire(self, chat_id, now=None):
+        """Take a chat token and a global token; False if either limit is reached"""
+        now = time.monotonic() if now is None else now
+        if self.paused_until.get(chat_id, 0) > now:
+            return False
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        if not self.global_available(now) or not bucket.take(now):
+            return False
+        return self.global_bucket.take(now)
+
+    def pause(self, chat_id, seconds):
+        self.paused_until[chat_id] = time.monotonic() + seconds
+
+
+def deliver_message(message, limiter):
+    """Send one queued message and record the outcome"""
+    result = call_telegram_api(message.method, message.payload)
+    now = timezone.now()
+
+    if result.get('ok'):
+        message.status = 'sent'
+        message.sent_at = now
+        message.last_error = ''
+        message.save(update_fields=['status', 'sent_at', 'last_error'])
+        return True
+
+    error = result.get('description', 'Unknown error')
+    error_code = result.get('error_code')
+    retry_after = (result.get('parameters') or {}).get('retry_after')
+
+    if error_code == 429 and retry_after:
+        # Throttled - not the message's fault, so it doesn't count as an attempt
+        limiter.pause(message.chat_id, retry_after)
+        message.next_attempt_at = now + timedelta(seconds=retry_after)
+    else:
+        message.attempts += 1
+        if (error_code and 400 <= error_code < 500) or message.attempts >= MAX_ATTEMPTS:
+            # Bad request / blocked by the user won't succeed on retry
+            message.status = 'failed'
+            logger.error(f"Telegram {message.method} to {message.chat_id} failed: {error}")
+        else:
+            message.next_attempt_at = now + timedelta(seconds=RETRY_BACKOFF * 2 ** (message.attempts - 1))
+    message.last_error = error
+    message.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error'])
+    return False
+
+
+def deliver_due_messages(limiter, batch_size=100):
+    """
+    Send due messages within the rate limits (oldest first, in order per chat)
+
+    Returns:
+        number of messages sent
+    """
+    now = timezone.now()
+    pending = TelegramMessage.objects.filter(status='pending')
+    due = pending.filter(next_attempt_at__lte=now).order_by('id')[:batch_size]
+    # Oldest message per chat that is waiting for a retry - nothing newer may overtake it
+    waiting = dict(
+        pending.filter(next_attempt_at__gt=now).values('chat_id').annotate(first_id=Min('id'))
+        .values_list('chat_id', 'first_id').order_by()
+    )
+
+    sent = 0
+    blocked = set()  # chats that must wait, so later messages can't overtake
+    for message in due:
+        if message.chat_id in blocked or message.id > waiting.get(message.chat_id, message.id):
+            continue
+        if not limiter.global_available():
+            break
+        if not limiter.acquire(message.chat_id):
+            blocked.add(message.chat_id)
+            continue
+        if deliver_message(message, limiter):
+            sent += 1
+        elif message.status == 'pending':
+            blocked.add(message.chat_id)
+    return sent
+
+
+def prune_delivered_messages():
+    """Delete sent and failed messages past DELIVERED_RETENTION"""
+    deleted, _ = TelegramMessage.objects.filter(
+        status__in=['sent', 'failed'], created_at__lt=timezone.now() - DELIVERED_RETENTION
+    ).delete()
+    return deleted
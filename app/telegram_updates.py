@@ -0,0 +1,132 @@
+"""
+Telegram updates for MADAM DA E-Commerce
+
+The webhook only validates and stores an update (queue_update) and answers
+Telegram right away, so slow Bot API calls never make Telegram redeliver it.
+Copies that Telegram sends anyway are dropped by the unique update_id.
+
+The telegram_worker management command processes the stored updates: each
+chat's updates in order on one thread, different chats concurrently.
+"""
+import logging
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import TelegramUpdate
+from .telegram_bot import handle_callback_query, handle_telegram_command
+from .telegram_delivery import DELIVERED_RETENTION
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(data):
+    """Chat an update needs a reply in, or None if the bot ignores the update"""
+    if 'message' in data:
+        message = data['message']
+        if str(message.get('text', '')).startswith('/'):
+            return message.get('chat', {}).get('id')
+    elif 'callback_query' in data:
+        return data['callback_query'].get('message', {}).get('chat', {}).get('id')
+    return None
+
+
+def queue_update(data):
+    """
+    Store an update for the worker
+
+    Returns:
+        True if it was queued, False if it is ignored or already queued
+    """
+    update_id = data.get('update_id')
+    chat_id = update_chat_id(data)
+    if not isinstance(update_id, int) or isinstance(update_id, bool) or chat_id is None:
+        return False
+
+    _, created = TelegramUpdate.objects.get_or_create(
+        update_id=update_id, defaults={'chat_id': str(chat_id), 'payload': data}
+    )
+    return created
+
+
+def dispatch_update(data):
+    """Run the bot handler for an update"""
+    if 'message' in data:
+        message = data['message']
+        chat_id = message.get('chat', {}).get('id')
+        text = message.get('text', '')
+
+        if text.startswith('/'):
+            # It's a command
+            handle_telegram_command(text, chat_id)
+
+    # Handle callback query (button clicks)
+    elif 'callback_query' in data:
+        callback = data['callback_query']
+        chat_id = callback.get('message', {}).get('chat', {}).get('id')
+        message_id = callback.get('message', {}).get('message_id')
+        callback_data = callback.get('data', '')
+
+        # Also answers the callback query, which removes the loading state
+        handle_callback_query(callback_data, chat_id, message_id, callback_query_id=callback.get('id'))
+
+
+def process_update(update):
+    """Process one queued update and record the outcome"""
+    try:
+        dispatch_update(update.payload)
+        update.status = 'done'
+        update.last_error = ''
+    except Exception as e:
+        # Not retried - a reply arriving much later would only confuse the chat
+        logger.error(f"Error processing Telegram update {update.update_id}: {str(e)}", exc_info=True)
+        update.status = 'failed'
+        update.last_error = str(e)
+    update.processed_at = timezone.now()
+    update.save(update_fields=['status', 'last_error', 'processed_at'])
+
+
+def _process_chat(updates):
+    for update in updates:
+        process_update(update)
+
+
+def _process_chat_in_thread(updates):
+    try:
+        _process_chat(updates)
+    finally:
+        # Pool threads outlive the round - don't keep their connections open
+        connection.close()
+
+
+def process_pending_updates(executor=None, batch_size=100):
+    """
+    Process queued updates, oldest first
+
+    Args:
+        executor: ThreadPoolExecutor for processing chats concurrently, or None
+                  to process them one after another in this thread
+
+    Returns:
+        number of updates processed
+    """
+    updates = list(TelegramUpdate.objects.filter(status='pending').order_by('update_id')[:batch_size])
+    by_chat = {}
+    for update in updates:
+        by_chat.setdefault(update.chat_id, []).append(update)
+
+    if executor is None or len(by_chat) == 1:
+        for chat_updates in by_chat.values():
+            _process_chat(chat_updates)
+    else:
+        # Wait for the whole round, so a chat's next updates can't overtake these
+        list(executor.map(_process_chat_in_thread, by_chat.values()))
+    return len(updates)
+
+
+def prune_processed_updates():
+    """Delete processed updates past DELIVERED_RETENTION (Telegram stops redelivering long before)"""
+    deleted, _ = TelegramUpdate.objects.filter(
+        status__in=['done', 'failed'], created_at__lt=timezone.now() - DELIVERED_RETENTION
+    ).delete()
+    return deleted
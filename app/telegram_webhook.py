@@ -1,57 +1,41 @@
 """
 Telegram Webhook Handler for Employee Bot
-Processes incoming messages and callbacks from Telegram
+Queues incoming messages and callbacks from Telegram (processed by the telegram_worker command)
 """
+import json
+import logging
 from django.http import JsonResponse, HttpResponse
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
-import json
-from .telegram_bot import handle_telegram_command, handle_callback_query
+from .telegram_updates import queue_update
+
+logger = logging.getLogger(__name__)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def telegram_webhook(request):
-    """Handle incoming Telegram webhook updates"""
+    """Acknowledge a Telegram update right away; see app/telegram_updates.py"""
+    secret = settings.TELEGRAM_WEBHOOK_SECRET
+    if secret and not constant_time_compare(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret):
+        return JsonResponse({'ok': False, 'error': 'Forbidden'}, status=403)
+    
     try:
         data = json.loads(request.body)
-        
-        # Handle message
-        if 'message' in data:
-            message = data['message']
-            chat_id = message.get('chat', {}).get('id')
-            text = message.get('text', '')
-            
-            if text.startswith('/'):
-                # It's a command
-                handle_telegram_command(text, chat_id)
-        
-        # Handle callback query (button clicks)
-        elif 'callback_query' in data:
-            callback = data['callback_query']
-            chat_id = callback.get('message', {}).get('chat', {}).get('id')
-            message_id = callback.get('message', {}).get('message_id')
-            callback_data = callback.get('data', '')
-            
-            handle_callback_query(callback_data, chat_id, message_id)
-            
-            # Answer callback query to remove loading state
-            try:
-                import requests
-                bot_token = settings.TELEGRAM_BOT_TOKEN
-                callback_id = callback.get('id')
-                url = f"https://api.telegram.org/bot{bot_token}/answerCallbackQuery"
-                requests.post(url, json={
-                    'callback_query_id': callback_id
-                }, timeout=5)
-            except:
-                pass
-        
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'ok': False, 'error': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'ok': False, 'error': 'Invalid update'}, status=400)
+    
+    try:
+        queue_update(data)
         return JsonResponse({'ok': True})
         
     except Exception as e:
-        print(f"Error processing webhook: {e}")
+        # Not acknowledged - Telegram delivers the update again later
+        logger.error(f"Error queueing Telegram update: {e}", exc_info=True)
         return JsonResponse({'ok': False, 'error': str(e)}, status=500)
 
 
@@ -75,9 +59,10 @@ def set_telegram_webhook(request):
             webhook_url = f"{scheme}://{host}/api/telegram/webhook/"
         
         url = f"https://api.telegram.org/bot{bot_token}/setWebhook"
-        response = requests.post(url, json={
-            'url': webhook_url
-        }, timeout=10)
+        payload = {'url': webhook_url}
+        if settings.TELEGRAM_WEBHOOK_SECRET:
+            payload['secret_token'] = settings.TELEGRAM_WEBHOOK_SECRET
+        response = requests.post(url, json=payload, timeout=10)
         
         result = response.json()
         
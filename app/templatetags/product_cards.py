@@ -0,0 +1,69 @@
+"""
+Product card fragment caching for the shop page
+
+Each card is cached per product and per language, keyed on Product.updated_at,
+so a page render is one cache.get_many() plus a string join. Only cards that
+changed since they were cached are rendered again.
+"""
+import logging
+import os
+from django import template
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+PRODUCT_CARD_TEMPLATE = 'app/shop/components/product_card.html'
+PRODUCT_CARD_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day (keys change whenever a product changes)
+
+
+def _card_cache_key(product, language, template_version):
+    updated = product.updated_at.timestamp() if product.updated_at else 0
+    return f'product_card:{language}:{template_version}:{product.pk}:{updated}'
+
+
+def render_product_cards(products):
+    """Render product cards for a list of products, using cached fragments where possible"""
+    card_template = get_template(PRODUCT_CARD_TEMPLATE)
+    try:
+        # Template edits (deploys) produce new keys instead of serving stale markup
+        template_version = int(os.path.getmtime(card_template.origin.name))
+    except (OSError, TypeError):
+        template_version = 0
+    language = get_language() or 'en'
+
+    products = list(products)
+    keys = [_card_cache_key(product, language, template_version) for product in products]
+
+    try:
+        cached = cache.get_many(keys)
+    except Exception as e:
+        logger.warning(f"Product card cache read failed: {e}")
+        cached = {}
+
+    cards = []
+    missing = {}
+    for product, key in zip(products, keys):
+        card = cached.get(key)
+        if card is None:
+            card = card_template.render({'product': product})
+            missing[key] = card
+        cards.append(card)
+
+    if missing:
+        try:
+            cache.set_many(missing, PRODUCT_CARD_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Product card cache write failed: {e}")
+
+    return mark_safe(''.join(cards))
+
+
+@register.simple_tag
+def product_cards(products):
+    """Usage: {% product_cards products %}"""
+    return render_product_cards(products)
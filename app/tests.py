@@ -1,7 +1,7 @@
 """
 Comprehensive Unit Tests for MADAM DA E-Commerce Platform
 """
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -51,6 +51,16 @@ class ProductModelTest(TestCase):
         """Test bilingual support"""
         self.assertEqual(self.product.name_kh, 'ផលិតផលសាកល្បង')
         self.assertEqual(self.product.badge_kh, 'ថ្មី')
+    
+    def test_save_invalidates_cached_stock(self):
+        """Test admin edits reach the cart revalidation stock cache after commit"""
+        from .utils.stock_cache import get_product_stock
+        self.assertEqual(get_product_stock(['TEST001'])['TEST001']['stock'], 100)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 0
+            self.product.save()
+        self.assertEqual(get_product_stock(['TEST001'])['TEST001']['stock'], 0)
 
 
 class CustomerModelTest(TestCase):
@@ -187,6 +197,40 @@ class PromoCodeModelTest(TestCase):
         self.assertEqual(discount, Decimal('0.00'))  # Below min_purchase
 
 
+class HeroSlideModelTest(TestCase):
+    """Test HeroSlide video renditions"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.slide = HeroSlide.objects.create(
+            slide_type='video',
+            video='hero_slides/videos/promo.mov',
+        )
+    
+    def test_unprocessed_video_uses_original(self):
+        """Test original upload is served until renditions exist"""
+        self.assertTrue(self.slide.needs_video_processing())
+        sources = self.slide.get_video_sources()
+        self.assertEqual(len(sources), 1)
+        self.assertEqual(sources[0][1], 'video/quicktime')
+    
+    def test_processed_video_uses_renditions(self):
+        """Test renditions are preferred once generated from the current upload"""
+        self.slide.video_mp4 = 'hero_slides/renditions/promo.mp4'
+        self.slide.video_webm = 'hero_slides/renditions/promo.webm'
+        self.slide.poster = 'hero_slides/posters/promo_poster.webp'
+        self.slide.renditions_source = self.slide.video.name
+        self.slide.save()
+        
+        self.assertFalse(self.slide.needs_video_processing())
+        self.assertEqual([mime for _, mime in self.slide.get_video_sources()], ['video/webm', 'video/mp4'])
+        
+        # A new upload makes the renditions stale
+        self.slide.video = 'hero_slides/videos/new_promo.mp4'
+        self.assertTrue(self.slide.needs_video_processing())
+        self.assertEqual(len(self.slide.get_video_sources()), 1)
+
+
 # ========== VIEW TESTS ==========
 
 class ShopViewTest(TestCase):
@@ -243,6 +287,207 @@ class ShopViewTest(TestCase):
         self.assertGreater(response.context['products'].paginator.num_pages, 1)
 
 
+class ConditionalGetTest(TestCase):
+    """Test ETag / 304 handling for static pages and the shop page"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from .utils.cache_bus import cache_bus
+        cache_bus.clear_local()
+        self.client = Client()
+        self.product = Product.objects.create(
+            id='PROD001',
+            name='Product 1',
+            price=Decimal('19.99'),
+            image='products/test.jpg',
+            stock=10,
+            is_active=True
+        )
+    
+    def test_static_page_not_modified(self):
+        """Test static page returns 304 for a matching ETag"""
+        response = self.client.get('/about-us/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertNotIn('no-store', response['Cache-Control'])
+        
+        response = self.client.get('/about-us/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_shop_etag_changes_with_catalog(self):
+        """Test shop ETag changes when a product is edited"""
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        # Signals invalidate the catalog version on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('17.99')
+            self.product.save()
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_shop_etag_changes_with_card_template(self):
+        """Test a deploy that only changes the product card template changes the shop ETag"""
+        from unittest.mock import patch
+        from django.test import RequestFactory
+        from .templatetags.product_cards import PRODUCT_CARD_TEMPLATE
+        from .utils import conditional
+        
+        request = RequestFactory().get('/')
+        etag = conditional.shop_etag(request)
+        mtime = conditional._template_mtime
+        with patch.object(conditional, '_template_mtime',
+                          lambda name: mtime(name) + 60 if name == PRODUCT_CARD_TEMPLATE else mtime(name)):
+            self.assertNotEqual(conditional.shop_etag(request), etag)
+    
+    def test_other_html_not_cached(self):
+        """Test pages without their own Cache-Control stay no-store"""
+        response = self.client.get('/checkout/')
+        self.assertIn('no-store', response['Cache-Control'])
+
+
+@override_settings(CACHE_BUS_REDIS_URL='')
+class CacheBusTest(TestCase):
+    """Test the two-level cache invalidation bus (local mode, no Redis)"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from .utils.cache_bus import CacheBus
+        self.bus = CacheBus()
+        self.calls = 0
+    
+    def _loader(self):
+        self.calls += 1
+        return f'value-{self.calls}'
+    
+    def test_value_cached_until_invalidated(self):
+        """Test loader runs once, then again after invalidate()"""
+        self.assertEqual(self.bus.get_or_set('catalog', 'key', self._loader), 'value-1')
+        self.assertEqual(self.bus.get_or_set('catalog', 'key', self._loader), 'value-1')
+        self.assertEqual(self.calls, 1)
+        
+        self.bus.invalidate('catalog')
+        self.assertEqual(self.bus.get_or_set('catalog', 'key', self._loader), 'value-2')
+        self.assertEqual(self.calls, 2)
+    
+    @override_settings(CACHE_BUS_L1_MAX_ENTRIES=2)
+    def test_l1_bounded_and_misses_not_cached(self):
+        """Test L1 evicts the least recently used keys and never stores misses"""
+        for key in ['a', 'b', 'a', 'c']:
+            self.bus.get_or_set('promo_codes', key, self._loader)
+        self.assertEqual(list(self.bus._l1['promo_codes']), ['a', 'c'])
+        
+        self.assertIsNone(self.bus.get_or_set('promo_codes', 'UNKNOWN', lambda: None))
+        self.assertNotIn('UNKNOWN', self.bus._l1['promo_codes'])
+    
+    def test_idle_subscriber_keeps_l1(self):
+        """Test waiting on a quiet channel doesn't count as a disconnect"""
+        from unittest.mock import MagicMock
+        polls = []
+        
+        def get_message(timeout):
+            polls.append(timeout)
+            if len(polls) == 1:
+                # Cached after the subscriber (re)connected
+                self.bus.get_or_set('catalog', 'key', self._loader)
+            if len(polls) == 3:
+                raise KeyboardInterrupt
+            return None
+        
+        self.bus._subscriber_redis = MagicMock()
+        self.bus._subscriber_redis.pubsub.return_value.get_message.side_effect = get_message
+        with self.assertRaises(KeyboardInterrupt):
+            self.bus._listen()
+        self.assertIn('key', self.bus._l1['catalog'])
+    
+    @override_settings(CACHE_BUS_REDIS_URL='redis://localhost:6379/0')
+    def test_unreadable_version_bypasses_caches(self):
+        """Test a failed Redis version read loads fresh values instead of guessing a version"""
+        import os
+        from unittest.mock import MagicMock
+        self.bus._pid = os.getpid()
+        self.bus._redis = MagicMock()
+        self.bus._redis.get.side_effect = ConnectionError('down')
+        
+        self.assertEqual(self.bus.get_or_set('catalog', 'key', self._loader), 'value-1')
+        self.assertEqual(self.bus.get_or_set('catalog', 'key', self._loader), 'value-2')
+        self.assertNotIn('catalog', self.bus._l1)
+    
+    def test_bus_message_drops_local_entries(self):
+        """Test a message from another process drops only that namespace"""
+        self.bus.get_or_set('catalog', 'key', self._loader)
+        self.bus.get_or_set('promo_codes', 'key', self._loader)
+        
+        self.bus.handle_message(b'{"namespace": "catalog", "version": 5}')
+        self.assertEqual(self.bus.get_version('catalog'), 5)
+        self.bus.get_or_set('catalog', 'key', self._loader)
+        self.bus.get_or_set('promo_codes', 'key', self._loader)
+        self.assertEqual(self.calls, 3)
+    
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        CACHE_BUS_L1_TIMEOUT=0,
+    )
+    def test_shared_cache_carries_versions(self):
+        """Test another process's invalidate() reaches this one through the shared cache"""
+        from django.core.cache import cache
+        from .utils.cache_bus import CacheBus
+        cache.clear()
+        other = CacheBus()
+        self.assertEqual(self.bus.get_or_set('catalog', 'key', self._loader), 'value-1')
+        
+        other.invalidate('catalog')
+        self.assertEqual(self.bus.get_or_set('catalog', 'key', self._loader), 'value-2')
+    
+    def test_hero_slide_save_invalidates(self):
+        """Test HeroSlide signals invalidate the hero_slides namespace on commit"""
+        from .utils.cache_bus import cache_bus
+        version = cache_bus.get_version('hero_slides')
+        with self.captureOnCommitCallbacks(execute=True):
+            HeroSlide.objects.create(title='Slide', slide_type='image', image='hero_slides/test.jpg')
+        self.assertEqual(cache_bus.get_version('hero_slides'), version + 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductCardCacheTest(TestCase):
+    """Test per-product fragment caching of shop product cards"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from django.core.cache import cache
+        cache.clear()
+        self.product = Product.objects.create(
+            id='PROD001',
+            name='Product 1',
+            price=Decimal('19.99'),
+            image='products/test.jpg',
+            stock=10,
+            is_active=True
+        )
+    
+    def test_card_cached_until_product_updated(self):
+        """Test cached card is reused until updated_at changes"""
+        from .templatetags.product_cards import render_product_cards
+        
+        html = render_product_cards(Product.objects.all())
+        self.assertIn('Product 1', html)
+        
+        # Bypass save() so updated_at is unchanged - cached fragment is served
+        Product.objects.filter(id='PROD001').update(name='Renamed')
+        self.assertIn('Product 1', render_product_cards(Product.objects.all()))
+        
+        # A normal save bumps updated_at and re-renders the card
+        product = Product.objects.get(id='PROD001')
+        product.save()
+        self.assertIn('Renamed', render_product_cards(Product.objects.all()))
+
+
 class CheckoutViewTest(TestCase):
     """Test checkout view"""
     
@@ -263,6 +508,205 @@ class CheckoutViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+
+class SalesReportViewTest(TestCase):
+    """Test the admin sales report"""
+    
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.client = Client()
+        self.client.force_login(User.objects.create_superuser(username='admin', password='testpass123'))
+        self.today = timezone.localdate()
+        for i, (days_ago, total) in enumerate([(0, '10.00'), (0, '5.00'), (2, '20.00'), (40, '99.00')]):
+            order = Order.objects.create(
+                order_number=f'MD{i + 1:05d}', customer_name='Test Customer', customer_phone='012345678',
+                customer_address='123 Test St', customer_province='Phnom Penh',
+                subtotal=Decimal(total), total=Decimal(total),
+                payment_method='KHQR', status='delivered'
+            )
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        # update() bypasses the rollup signals - backfill like after a deploy
+        from django.core.management import call_command
+        from io import StringIO
+        call_command('rebuild_rollups', stdout=StringIO())
+    
+    def _report(self, days):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:app_order_sales_report'), {
+                'start_date': (self.today - timedelta(days=days)).isoformat(),
+                'end_date': self.today.isoformat(),
+            })
+        self.assertEqual(response.status_code, 200)
+        return response.context, len(queries)
+    
+    def test_daily_sales_and_totals(self):
+        """Test totals and per-day rows for the range"""
+        context, _ = self._report(30)
+        self.assertEqual(context['total_orders'], 3)
+        self.assertEqual(context['total_revenue'], Decimal('35.00'))
+        self.assertEqual(context['all_time_count'], 4)
+        daily = {day['date']: day for day in context['daily_sales']}
+        self.assertEqual(len(daily), 31)
+        self.assertEqual((daily[self.today]['count'], daily[self.today]['total']), (2, Decimal('15.00')))
+        self.assertEqual(daily[self.today - timedelta(days=1)]['count'], 0)
+    
+    def test_query_count_independent_of_range(self):
+        """Test a year costs as many queries as a week"""
+        _, week = self._report(7)
+        _, year = self._report(365)
+        self.assertEqual(week, year)
+    
+    def test_order_changes_update_rollup(self):
+        """Test saving an order moves its amounts to the new key in the same transaction"""
+        from .models import DailySales
+        
+        order = Order.objects.get(order_number='MD00001')
+        order.status = 'cancelled'
+        order.save()
+        
+        today = DailySales.objects.filter(date=self.today)
+        self.assertEqual(
+            {(row.status, row.orders, row.total) for row in today},
+            {('cancelled', 1, Decimal('10.00')), ('delivered', 1, Decimal('5.00'))}
+        )
+    
+    def test_confirm_cod_payment_action_moves_rollup(self):
+        """Test the admin COD confirmation (a queryset.update()) moves the orders' rollup rows"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import DailySales
+        
+        Order.objects.filter(order_number='MD00001').update(payment_method='Cash on Delivery', status='pending')
+        call_command('rebuild_rollups', stdout=StringIO())
+        
+        response = self.client.post(reverse('admin:app_order_changelist'), {
+            'action': 'confirm_cod_payment',
+            '_selected_action': [Order.objects.get(order_number='MD00001').pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        
+        today = DailySales.objects.filter(date=self.today, payment_method='Cash on Delivery')
+        self.assertEqual(
+            {(row.status, row.orders, row.total) for row in today if row.orders},
+            {('confirmed', 1, Decimal('10.00'))}
+        )
+    
+    def test_unchanged_rollup_fields_cost_no_queries(self):
+        """Test a save that doesn't touch a rollup field runs only its own UPDATE"""
+        order = Order.objects.get(order_number='MD00001')
+        order.customer_received = True
+        with self.assertNumQueries(1):
+            order.save(update_fields=['customer_received'])
+    
+    def test_item_changes_follow_order_status(self):
+        """Test product rows move with the order's status and follow item edits"""
+        from .models import DailyProductSales
+        
+        order = Order.objects.get(order_number='MD00001')
+        item = OrderItem.objects.create(
+            order=order, product_name='Test Product', product_price=Decimal('5.00'),
+            quantity=2, subtotal=Decimal('10.00')
+        )
+        item.quantity = 3
+        item.subtotal = Decimal('15.00')
+        item.save()
+        order.status = 'cancelled'
+        order.save()
+        
+        rows = DailyProductSales.objects.filter(date=self.today)
+        self.assertEqual(
+            {(row.status, row.quantity, row.revenue) for row in rows},
+            {('cancelled', 3, Decimal('15.00')), ('delivered', 0, Decimal('0.00'))}
+        )
+        
+        order.delete()
+        self.assertEqual(DailyProductSales.objects.filter(date=self.today, quantity__gt=0).count(), 0)
+
+
+class CommissionReportViewTest(TestCase):
+    """Test the admin promoter commission report"""
+    
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.client = Client()
+        self.client.force_login(User.objects.create_superuser(username='admin', password='testpass123'))
+        self.promoter_count = 0
+    
+    def _add_promoter(self, rate, totals):
+        self.promoter_count += 1
+        n = self.promoter_count
+        promoter = Promoter.objects.create(name=f'Promoter {n}', commission_rate=Decimal(rate))
+        for c in range(2):
+            code = PromoCode.objects.create(
+                code=f'P{n}CODE{c}', promoter=promoter, discount_type='percentage', discount_value=Decimal('10'),
+                valid_from=timezone.now() - timedelta(days=1), valid_until=timezone.now() + timedelta(days=30)
+            )
+            for i, total in enumerate(totals if c == 0 else []):
+                Order.objects.create(
+                    order_number=f'MD{n}{c}{i:03d}', customer_name='Test Customer', customer_phone='012345678',
+                    customer_address='123 Test St', customer_province='Phnom Penh',
+                    subtotal=Decimal(total), total=Decimal(total), promo_code=code,
+                    payment_method='KHQR', status='delivered'
+                )
+        return promoter
+    
+    def _report(self):
+        from django.core.management import call_command
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from io import StringIO
+        
+        call_command('rebuild_rollups', stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:app_order_commission_report'))
+        self.assertEqual(response.status_code, 200)
+        return response.context, len(queries)
+    
+    def test_commission_per_promoter_and_code(self):
+        """Test totals, per-code stats and unused codes"""
+        promoter = self._add_promoter('10.00', ['100.00', '50.00'])
+        context, _ = self._report()
+        
+        data = context['promoter_data'][0]
+        self.assertEqual(data['promoter'], promoter)
+        self.assertEqual(data['total_orders'], 2)
+        self.assertEqual(data['total_revenue'], Decimal('150.00'))
+        self.assertEqual(data['total_commission'], Decimal('15.00'))
+        self.assertEqual(data['codes_used']['P1CODE0']['commission'], Decimal('15.00'))
+        self.assertEqual(data['codes_used']['P1CODE1']['count'], 0)
+        self.assertEqual(context['total_all_commission'], Decimal('15.00'))
+    
+    def test_query_count_independent_of_promoters(self):
+        """Test more promoters and codes don't add queries"""
+        self._add_promoter('10.00', ['100.00'])
+        _, one = self._report()
+        for _ in range(3):
+            self._add_promoter('5.00', ['20.00', '30.00'])
+        _, four = self._report()
+        self.assertEqual(one, four)
+    
+    def test_deleting_promo_code_merges_rollup_rows(self):
+        """Test a deleted code's rows are folded into the rows without a code"""
+        from .models import DailySales
+        
+        self._add_promoter('10.00', ['100.00'])
+        Order.objects.create(
+            order_number='MD99999', customer_name='Test Customer', customer_phone='012345678',
+            customer_address='123 Test St', customer_province='Phnom Penh',
+            subtotal=Decimal('20.00'), total=Decimal('20.00'), payment_method='KHQR', status='delivered'
+        )
+        self._report()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            PromoCode.objects.filter(code__startswith='P1').delete()
+        
+        row = DailySales.objects.get()
+        self.assertIsNone(row.promo_code)
+        self.assertEqual((row.orders, row.total), (2, Decimal('120.00')))
+
 # ========== API TESTS ==========
 
 class CustomerLookupAPITest(TestCase):
@@ -362,6 +806,365 @@ class PromoCodeValidationAPITest(TestCase):
         self.assertFalse(result['success'])
 
 
+class CartValidationAPITest(TestCase):
+    """Test cart revalidation API"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.client = Client()
+        Product.objects.create(id='PROD001', name='Product 1', price=Decimal('19.99'), stock=10, is_active=True)
+        Product.objects.create(id='PROD002', name='Product 2', price=Decimal('29.99'), stock=1, is_active=True)
+        Product.objects.create(id='PROD003', name='Product 3', price=Decimal('9.99'), stock=5, is_active=False)
+    
+    def _validate(self, items):
+        return self.client.post(
+            '/api/cart/validate/',
+            data=json.dumps({'items': items}),
+            content_type='application/json'
+        )
+    
+    def test_valid_cart(self):
+        """Test cart with current prices and enough stock"""
+        response = self._validate([{'id': 'PROD001', 'qty': 2, 'price': 19.99}])
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content)
+        self.assertTrue(result['valid'])
+        self.assertEqual(result['items'][0]['stock'], 10)
+    
+    def test_non_positive_quantity_invalid(self):
+        """Test zero and negative quantities are rejected even with enough stock"""
+        response = self._validate([
+            {'id': 'PROD001', 'qty': 0, 'price': 19.99},
+            {'id': 'PROD001', 'qty': -3, 'price': 19.99},
+        ])
+        result = json.loads(response.content)
+        self.assertFalse(result['valid'])
+        self.assertEqual([item['reason'] for item in result['items']], ['invalid_quantity'] * 2)
+    
+    def test_stale_cart(self):
+        """Test cart with changed price, low stock, inactive and missing products"""
+        response = self._validate([
+            {'id': 'PROD001', 'qty': 1, 'price': 15.00},
+            {'id': 'PROD002', 'qty': 3, 'price': 29.99},
+            {'id': 'PROD003', 'qty': 1, 'price': 9.99},
+            {'id': 'MISSING', 'qty': 1, 'price': 1.00},
+        ])
+        result = json.loads(response.content)
+        self.assertFalse(result['valid'])
+        reasons = {line['id']: line['reason'] for line in result['items']}
+        self.assertEqual(reasons, {
+            'PROD001': 'price_changed',
+            'PROD002': 'insufficient_stock',
+            'PROD003': 'inactive',
+            'MISSING': 'not_found',
+        })
+    
+    def test_single_query(self):
+        """Test whole cart is checked with one product query"""
+        with self.assertNumQueries(1):
+            self._validate([
+                {'id': 'PROD001', 'qty': 1, 'price': 19.99},
+                {'id': 'PROD002', 'qty': 1, 'price': 29.99},
+            ])
+    
+    def test_empty_cart(self):
+        """Test empty cart is rejected"""
+        response = self._validate([])
+        self.assertEqual(response.status_code, 400)
+
+
+class EmployeeDashboardAPITest(TestCase):
+    """Test employee dashboard API (full snapshot and ?since= delta sync)"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from django.contrib.auth.models import User
+        self.client = Client()
+        self.user = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.client.force_login(self.user)
+        self.order = self._create_order('MD00001', 'pending')
+    
+    def _create_order(self, order_number, status):
+        return Order.objects.create(
+            order_number=order_number,
+            customer_name='Jane Doe',
+            customer_phone='098765432',
+            customer_address='456 Test Ave',
+            customer_province='Siem Reap',
+            subtotal=Decimal('50.00'),
+            total=Decimal('50.00'),
+            payment_method='Cash on Delivery',
+            status=status
+        )
+    
+    def _get(self, **params):
+        response = self.client.get('/employee/api/', params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+    
+    def test_full_snapshot(self):
+        """Test full snapshot includes a cursor and the order columns"""
+        result = self._get()
+        self.assertEqual(result['mode'], 'full')
+        self.assertTrue(result['cursor'])
+        self.assertEqual([o['order_number'] for o in result['orders_to_prepare']], ['MD00001'])
+        self.assertEqual(result['stats']['total_to_prepare'], 1)
+    
+    def test_delta_returns_moves_and_deletions(self):
+        """Test delta sync returns changed orders with their column and removed orders"""
+        from .employee_views import encode_sync_cursor
+        # Cursor from before the overlap window, so untouched orders are not repeated
+        cursor = encode_sync_cursor(timezone.now())
+        Order.objects.filter(pk=self.order.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+        
+        moved = self._create_order('MD00002', 'pending')
+        moved.status = 'preparing'
+        moved.save()
+        deleted = self._create_order('MD00003', 'pending')
+        deleted.delete()
+        
+        result = self._get(since=cursor)
+        self.assertEqual(result['mode'], 'delta')
+        self.assertEqual([(o['order_number'], o['column']) for o in result['changed']], [('MD00002', 'preparing')])
+        self.assertEqual(result['removed'], ['MD00003'])
+        self.assertEqual(result['stats']['total_preparing'], 1)
+    
+    def test_column_pages_and_items_on_demand(self):
+        """Test "Load more" keyset pagination and lazily loaded order items"""
+        self._create_order('MD00002', 'confirmed')
+        self._create_order('MD00003', 'pending')
+        OrderItem.objects.create(
+            order=self.order, product_name='Product 1', product_price=Decimal('25.00'),
+            quantity=2, subtotal=Decimal('50.00')
+        )
+        
+        response = self.client.get('/employee/api/column/to_prepare/', {'limit': 2})
+        first = json.loads(response.content)
+        self.assertEqual(len(first['orders']), 2)
+        self.assertNotIn('items', first['orders'][0])
+        self.assertTrue(first['next_cursor'])
+        
+        response = self.client.get('/employee/api/column/to_prepare/', {'limit': 2, 'after': first['next_cursor']})
+        second = json.loads(response.content)
+        self.assertEqual([o['order_number'] for o in second['orders']], ['MD00001'])
+        self.assertEqual(second['orders'][0]['items_count'], 1)
+        self.assertIsNone(second['next_cursor'])
+        
+        response = self.client.get('/employee/api/order/MD00001/items/')
+        items = json.loads(response.content)['items']
+        self.assertEqual(items[0]['product_name'], 'Product 1')
+        self.assertEqual(self.client.get('/employee/api/column/bogus/').status_code, 400)
+    
+    def test_bulk_status_update_reports_partial_failures(self):
+        """Test bulk status change applies valid transitions and reports the rest"""
+        self._create_order('MD00002', 'preparing')
+        self._create_order('MD00003', 'preparing')
+        response = self.client.post(
+            '/api/employee/orders/status/',
+            data=json.dumps({'order_numbers': ['MD00002', 'MD00003', 'MD00001', 'MD99999'],
+                             'status': 'ready_for_delivery'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['updated'], ['MD00002', 'MD00003'])
+        self.assertEqual([f['order_number'] for f in result['failed']], ['MD00001', 'MD99999'])
+        self.assertEqual(Order.objects.filter(status='ready_for_delivery').count(), 2)
+        self.assertEqual(Order.objects.get(order_number='MD00001').status, 'pending')
+    
+    def test_dashboard_page_renders_sync_cursor(self):
+        """Test dashboard page renders cards with the delta sync cursor"""
+        response = self.client.get('/employee/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'data-order="MD00001"')
+        self.assertEqual(response.context['total_to_prepare'], 1)
+        self.assertTrue(response.context['sync_cursor'])
+    
+    def test_completed_count_covers_every_page(self):
+        """Test the delivered count is the column total, not the first page"""
+        from .employee_views import DASHBOARD_PAGE_SIZE
+        for i in range(DASHBOARD_PAGE_SIZE + 1):
+            self._create_order(f'MD1{i:04d}', 'delivered')
+        
+        response = self.client.get('/employee/')
+        self.assertEqual(len(response.context['orders_completed']), DASHBOARD_PAGE_SIZE)
+        self.assertEqual(response.context['total_completed'], DASHBOARD_PAGE_SIZE + 1)
+        self.assertEqual(self._get()['stats']['total_completed'], DASHBOARD_PAGE_SIZE + 1)
+    
+    def test_expired_cursor_returns_full_snapshot(self):
+        """Test a cursor older than tombstone retention forces a full resync"""
+        from .employee_views import encode_sync_cursor
+        result = self._get(since=encode_sync_cursor(timezone.now() - timedelta(days=30)))
+        self.assertEqual(result['mode'], 'full')
+        self.assertTrue(result['reset'])
+        
+        result = self._get(since='not-a-cursor')
+        self.assertEqual(result['mode'], 'full')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DashboardStatsTest(TestCase):
+    """Test single-query dashboard counters and incremental updates"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from django.core.cache import cache
+        cache.clear()
+        for number, status in [('MD00001', 'pending'), ('MD00002', 'confirmed'), ('MD00003', 'preparing')]:
+            Order.objects.create(
+                order_number=number,
+                customer_name='Jane Doe',
+                customer_phone='098765432',
+                customer_address='456 Test Ave',
+                customer_province='Siem Reap',
+                subtotal=Decimal('50.00'),
+                total=Decimal('50.00'),
+                payment_method='Cash on Delivery',
+                status=status
+            )
+    
+    def test_counts_in_one_query_then_cached(self):
+        """Test counts come from one grouped query, then from the cache"""
+        from .utils.dashboard_stats import get_dashboard_counts
+        with self.assertNumQueries(1):
+            counts = get_dashboard_counts()
+        self.assertEqual(counts, {'to_prepare': 2, 'preparing': 1, 'ready': 0, 'out': 0})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_counts(), counts)
+    
+    def test_counters_follow_status_transitions(self):
+        """Test saving a status change moves the order between cached counters"""
+        from .utils.dashboard_stats import get_dashboard_counts
+        get_dashboard_counts()
+        
+        order = Order.objects.get(order_number='MD00003')
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'ready_for_delivery'
+            order.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.get(order_number='MD00001').delete()
+        
+        with self.assertNumQueries(0):
+            counts = get_dashboard_counts()
+        self.assertEqual(counts, {'to_prepare': 1, 'preparing': 0, 'ready': 1, 'out': 0})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OrderSnapshotTest(TestCase):
+    """Test the shared, cached order snapshot"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from django.core.cache import cache
+        cache.clear()
+        self.order = Order.objects.create(
+            order_number='MD00001',
+            customer_name='Jane Doe',
+            customer_phone='098765432',
+            customer_address='456 Test Ave',
+            customer_province='Siem Reap',
+            subtotal=Decimal('50.00'),
+            total=Decimal('50.00'),
+            payment_method='Cash on Delivery',
+            status='pending'
+        )
+        OrderItem.objects.create(
+            order=self.order, product_name='Product 1', product_price=Decimal('25.00'),
+            quantity=2, subtotal=Decimal('50.00')
+        )
+    
+    def test_snapshot_cached_per_version(self):
+        """Test snapshot is built with two queries, cached, and rebuilt after a save"""
+        from .utils.order_snapshot import get_order_snapshot
+        with self.assertNumQueries(2):
+            snapshot = get_order_snapshot(self.order)
+        self.assertEqual(snapshot['items'][0]['product_name'], 'Product 1')
+        self.assertEqual(snapshot['status_display'], 'Pending')
+        with self.assertNumQueries(0):
+            get_order_snapshot(self.order)
+        
+        self.order.status = 'confirmed'
+        self.order.save()
+        self.assertEqual(get_order_snapshot(self.order)['status'], 'confirmed')
+    
+    def test_event_frame_encoded_once(self):
+        """Test every recipient of an event gets the same encoded frame"""
+        from .utils.order_snapshot import get_order_snapshot, encode_order_event
+        event = {'type': 'status_changed', 'order': get_order_snapshot(self.order),
+                 'old_status': 'pending', 'new_status': 'confirmed'}
+        frame = encode_order_event(event)
+        self.assertIs(encode_order_event(dict(event)), frame)
+        self.assertEqual(json.loads(frame)['new_status'], 'confirmed')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class EmployeeAccessCacheTest(TestCase):
+    """Test cached Employee group membership checks"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from django.contrib.auth.models import User, Group
+        from django.core.cache import cache
+        cache.clear()
+        self.group = Group.objects.create(name='Employee')
+        self.user = User.objects.create_user(username='employee', password='testpass123')
+    
+    def _fresh_user(self):
+        from django.contrib.auth.models import User
+        return User.objects.get(pk=self.user.pk)
+    
+    def test_membership_cached_and_invalidated(self):
+        """Test group check is cached and dropped when groups change"""
+        from .employee_views import is_employee
+        self.assertFalse(is_employee(self._fresh_user()))
+        
+        user = self._fresh_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(is_employee(user))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.group)
+        self.assertTrue(is_employee(self._fresh_user()))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.remove(self.user)
+        self.assertFalse(is_employee(self._fresh_user()))
+    
+    def test_group_rename_and_delete_invalidate(self):
+        """Test renaming or deleting the Employee group drops its members' cached access"""
+        from .employee_views import is_employee
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.group)
+        self.assertTrue(is_employee(self._fresh_user()))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.name = 'Former employees'
+            self.group.save()
+        self.assertFalse(is_employee(self._fresh_user()))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.name = 'Employee'
+            self.group.save()
+        self.assertTrue(is_employee(self._fresh_user()))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.delete()
+        self.assertFalse(is_employee(self._fresh_user()))
+    
+    def test_invalidation_waits_for_commit(self):
+        """Test the cached value survives until the membership change commits"""
+        from django.core.cache import cache
+        from .employee_views import employee_cache_key, is_employee
+        self.assertFalse(is_employee(self._fresh_user()))
+        
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.groups.add(self.group)
+            self.assertIsNotNone(cache.get(employee_cache_key(self.user.pk)))
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(cache.get(employee_cache_key(self.user.pk)))
+
+
 class TrackOrderAPITest(TestCase):
     """Test order tracking API"""
     
@@ -417,6 +1220,9 @@ class TrackOrderAPITest(TestCase):
         result = json.loads(response.content)
         self.assertTrue(result['success'])
         self.assertEqual(result['order']['order_number'], 'MD00001')
+        # Token for the live tracking socket
+        from .utils.order_tracking import read_tracking_token
+        self.assertEqual(read_tracking_token(result['tracking_token']), 'MD00001')
     
     def test_track_order_wrong_phone(self):
         """Test order tracking with wrong phone"""
@@ -507,6 +1313,613 @@ class HealthCheckAPITest(TestCase):
         self.assertEqual(data['database'], 'ok')
 
 
+# ========== WEBSOCKET TESTS ==========
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    WEBSOCKET_REDIS_URL='',
+)
+class OrderConsumerTest(TestCase):
+    """Test OrderConsumer connection limits and event frames"""
+    
+    def _communicator(self):
+        from channels.testing import WebsocketCommunicator
+        from .consumers import OrderConsumer
+        return WebsocketCommunicator(OrderConsumer.as_asgi(), '/ws/orders/')
+    
+    def test_connection_limit_and_release(self):
+        """Test rejected connections don't leak leases and closed ones free a slot"""
+        from asgiref.sync import async_to_sync
+        from unittest.mock import patch
+        from .consumers import OrderConsumer
+        from .utils.ws_connections import connection_tracker
+        
+        async def scenario():
+            first = self._communicator()
+            connected, _ = await first.connect()
+            self.assertTrue(connected)
+            
+            second = self._communicator()
+            connected, code = await second.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4001)
+            self.assertEqual(connection_tracker.count(), (1, 'process'))
+            
+            await first.disconnect()
+            third = self._communicator()
+            connected, _ = await third.connect()
+            self.assertTrue(connected)
+            await third.disconnect()
+        
+        with patch.object(OrderConsumer, 'MAX_CONNECTIONS', 1):
+            async_to_sync(scenario)()
+        self.assertEqual(connection_tracker.count(), (0, 'process'))
+    
+    def test_failed_replay_still_cleans_up(self):
+        """Test a replay error doesn't break disconnect (lease released, groups left)"""
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from unittest.mock import AsyncMock, patch
+        from .consumers import OrderConsumer
+        from .utils.ws_connections import connection_tracker
+        
+        consumer = OrderConsumer()
+        consumer.scope = {'type': 'websocket', 'query_string': b'last_seq=1'}
+        consumer.channel_layer = get_channel_layer()
+        consumer.channel_name = 'test.replay'
+        
+        async def scenario():
+            with patch.object(OrderConsumer, 'accept', AsyncMock()), \
+                    patch.object(OrderConsumer, '_replay', side_effect=RuntimeError('stream error')):
+                with self.assertRaises(RuntimeError):
+                    await consumer.connect()
+            self.assertEqual(connection_tracker.count(), (1, 'process'))
+            await consumer.disconnect(1011)
+        
+        async_to_sync(scenario)()
+        self.assertEqual(connection_tracker.count(), (0, 'process'))
+        self.assertEqual(consumer.topics, {})
+    
+    @override_settings(WEBSOCKET_REDIS_URL='redis://localhost:6379/0')
+    def test_count_reuses_redis_client(self):
+        """Test health checks don't build a Redis client per call"""
+        from unittest.mock import patch
+        from .utils.ws_connections import ConnectionTracker
+        
+        tracker = ConnectionTracker()
+        with patch('redis.Redis.from_url') as from_url:
+            from_url.return_value.zcount.return_value = 3
+            self.assertEqual(tracker.count(), (3, 'cluster'))
+            self.assertEqual(tracker.count(), (3, 'cluster'))
+        from_url.assert_called_once()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class OrderTopicSubscriptionTest(TestCase):
+    """Test per-topic WebSocket subscriptions"""
+    
+    def test_topic_groups(self):
+        """Test topics map to groups and orders fan out to their topics"""
+        from .utils.ws_topics import topic_group, order_event_groups
+        
+        self.assertEqual(topic_group('all'), 'orders_updates')
+        self.assertEqual(topic_group('status:ready'), 'orders.status.ready')
+        self.assertEqual(topic_group('order:md00042'), 'orders.order.MD00042')
+        self.assertIsNone(topic_group('status:unknown'))
+        self.assertIsNone(topic_group('order:bad number'))
+        
+        groups = order_event_groups(
+            {'order_number': 'MD00042', 'status': 'ready_for_delivery', 'payment_method': 'Cash on Delivery'},
+            old_status='preparing',
+        )
+        self.assertEqual(groups, {
+            'orders_updates', 'orders.order.MD00042', 'orders.payment.cod',
+            'orders.status.ready', 'orders.status.preparing',
+        })
+    
+    def test_subscribe_and_single_delivery(self):
+        """Test topic subscriptions and that overlapping topics deliver an event once"""
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from channels.testing import WebsocketCommunicator
+        from .consumers import OrderConsumer
+        from .utils.ws_topics import order_event_groups
+        
+        order = {
+            'order_id': 1, 'order_number': 'MD00042', 'status': 'ready_for_delivery',
+            'payment_method': 'KHQR', 'updated_at': '2024-01-01T00:00:00',
+        }
+        
+        async def publish(event_id, order):
+            channel_layer = get_channel_layer()
+            for group in order_event_groups(order):
+                await channel_layer.group_send(group, {
+                    'type': 'status_changed', 'event_id': event_id, 'order': order,
+                })
+        
+        async def scenario():
+            communicator = WebsocketCommunicator(OrderConsumer.as_asgi(), '/ws/orders/?topics=status:ready')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            
+            await communicator.send_json_to({'type': 'subscribe', 'topics': ['payment:khqr', 'status:nope']})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['topics'], ['payment:khqr', 'status:ready'])
+            self.assertEqual(reply['invalid'], ['status:nope'])
+            
+            # Published to both subscribed groups, delivered once
+            await publish('event-1', order)
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['order']['order_number'], 'MD00042')
+            self.assertNotIn('event_id', frame)
+            self.assertTrue(await communicator.receive_nothing())
+            
+            # Unsubscribed topics stop receiving
+            await communicator.send_json_to({'type': 'unsubscribe', 'topics': ['status:ready', 'payment:khqr']})
+            await communicator.receive_json_from()
+            await publish('event-2', {**order, 'updated_at': '2024-01-01T00:00:01'})
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+        
+        async_to_sync(scenario)()
+    
+    def test_events_coalesced_into_batch_frame(self):
+        """Test a burst of events is merged per order and sent as one batch frame"""
+        from asgiref.sync import async_to_sync
+        from unittest.mock import patch
+        from channels.layers import get_channel_layer
+        from channels.testing import WebsocketCommunicator
+        from .consumers import OrderConsumer
+        
+        def order(order_id, status, updated_at):
+            return {'order_id': order_id, 'order_number': f'MD{order_id:05d}', 'status': status,
+                    'payment_method': 'KHQR', 'updated_at': updated_at}
+        
+        async def scenario():
+            communicator = WebsocketCommunicator(OrderConsumer.as_asgi(), '/ws/orders/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            
+            channel_layer = get_channel_layer()
+            await channel_layer.group_send('orders_updates', {
+                'type': 'status_changed', 'event_id': 'e1', 'order': order(1, 'preparing', 't1'),
+                'old_status': 'confirmed', 'new_status': 'preparing',
+            })
+            await channel_layer.group_send('orders_updates', {
+                'type': 'new_order', 'event_id': 'e2', 'order': order(2, 'pending', 't1'),
+            })
+            await channel_layer.group_send('orders_updates', {
+                'type': 'orders_status_changed', 'event_id': 'e3',
+                'orders': [order(1, 'ready_for_delivery', 't2')], 'new_status': 'ready_for_delivery',
+            })
+            
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['type'], 'batch')
+            first, second = frame['events']
+            # Order 1: latest snapshot, transition from its first old status
+            self.assertEqual(first['order']['updated_at'], 't2')
+            self.assertEqual(first['old_status'], 'confirmed')
+            self.assertEqual(first['new_status'], 'ready_for_delivery')
+            self.assertEqual(second['type'], 'new_order')
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+        
+        with patch.object(OrderConsumer, 'COALESCE_WINDOW', 0.05):
+            async_to_sync(scenario)()
+    
+    def test_compact_mode_sends_changed_fields(self):
+        """Test compact connections get an order in full once, then only its changed fields"""
+        from asgiref.sync import async_to_sync
+        from unittest.mock import patch
+        from channels.layers import get_channel_layer
+        from channels.testing import WebsocketCommunicator
+        from .consumers import OrderConsumer
+        
+        order = {'order_id': 1, 'order_number': 'MD00001', 'status': 'preparing',
+                 'customer_address': '123 Test St', 'updated_at': 't1'}
+        
+        async def scenario():
+            communicator = WebsocketCommunicator(OrderConsumer.as_asgi(), '/ws/orders/?format=compact')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            
+            channel_layer = get_channel_layer()
+            await channel_layer.group_send('orders_updates', {
+                'type': 'status_changed', 'event_id': 'c1', 'order': order,
+            })
+            self.assertEqual((await communicator.receive_json_from())['order'], order)
+            
+            await channel_layer.group_send('orders_updates', {
+                'type': 'status_changed', 'event_id': 'c2',
+                'order': {**order, 'status': 'ready_for_delivery', 'updated_at': 't2'},
+            })
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['order'], {
+                'order_id': 1, 'changes': {'status': 'ready_for_delivery', 'updated_at': 't2'},
+            })
+            await communicator.disconnect()
+        
+        with patch.object(OrderConsumer, 'COALESCE_WINDOW', 0):
+            async_to_sync(scenario)()
+    
+    def test_replay_missed_events_on_reconnect(self):
+        """Test a reconnect with last_seq replays only missed events for its topics"""
+        from asgiref.sync import async_to_sync
+        from unittest.mock import patch
+        from channels.testing import WebsocketCommunicator
+        from .consumers import OrderConsumer
+        from .utils.event_log import build_record, event_log
+        from .utils.ws_topics import order_event_groups
+        
+        def log_event(event_id, order):
+            messages = [(group, {'order': order}) for group in order_event_groups(order)]
+            return event_log.append(build_record('status_changed', event_id, messages))
+        
+        base = event_log.current_seq()
+        ready = {'order_id': 1, 'order_number': 'MD00001', 'status': 'ready_for_delivery',
+                 'payment_method': 'KHQR', 'updated_at': 't1'}
+        preparing = {**ready, 'order_id': 2, 'order_number': 'MD00002', 'status': 'preparing'}
+        log_event('r1', ready)
+        seq = log_event('r2', preparing)
+        
+        async def connect(query):
+            communicator = WebsocketCommunicator(OrderConsumer.as_asgi(), f'/ws/orders/?{query}')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            return communicator
+        
+        async def scenario():
+            # Only the event for the subscribed column is replayed
+            communicator = await connect(f'topics=status:preparing&last_seq={base}')
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['order']['order_number'], 'MD00002')
+            self.assertEqual(frame['seq'], seq)
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+            
+            # Up to date - nothing to send
+            communicator = await connect(f'last_seq={seq}')
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+            
+            # Gap larger than the replay limit - resync
+            with patch.object(OrderConsumer, 'REPLAY_LIMIT', 1):
+                communicator = await connect(f'last_seq={base}')
+                self.assertEqual(await communicator.receive_json_from(), {'type': 'resync', 'seq': seq})
+                await communicator.disconnect()
+        
+        async_to_sync(scenario)()
+
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class OrderTrackingConsumerTest(TransactionTestCase):
+    """Test the customer order-tracking WebSocket"""
+    
+    def test_live_status_updates(self):
+        """Test tracking sends the current status, then pushed changes for that order only"""
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from channels.testing import WebsocketCommunicator
+        from .consumers import OrderTrackingConsumer
+        from .utils.order_tracking import make_tracking_token
+        
+        Order.objects.create(
+            order_number='MD00001', customer_name='Test Customer', customer_phone='012345678',
+            customer_address='123 Test St', customer_province='Phnom Penh',
+            subtotal=Decimal('19.99'), total=Decimal('19.99'),
+            payment_method='KHQR', status='preparing'
+        )
+        
+        async def scenario():
+            rejected = WebsocketCommunicator(OrderTrackingConsumer.as_asgi(), '/ws/track/?token=forged')
+            connected, _ = await rejected.connect()
+            self.assertFalse(connected)
+            
+            communicator = WebsocketCommunicator(
+                OrderTrackingConsumer.as_asgi(), f'/ws/track/?token={make_tracking_token("MD00001")}'
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['order']['status'], 'preparing')
+            self.assertNotIn('customer_phone', frame['order'])
+            
+            order = {'order_id': 1, 'order_number': 'MD00001', 'status': 'ready_for_delivery',
+                     'customer_phone': '012345678', 'updated_at': 't2'}
+            channel_layer = get_channel_layer()
+            await channel_layer.group_send('orders.order.MD00001', {
+                'type': 'orders_status_changed', 'new_status': 'ready_for_delivery',
+                'orders': [{**order, 'order_number': 'MD00002'}, order],
+            })
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['order']['status'], 'ready_for_delivery')
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+        
+        async_to_sync(scenario)()
+
+
+class BenchWebsocketsCommandTest(TestCase):
+    """Test the bench_websockets load test harness"""
+    
+    def test_small_run_reports_every_delivery(self):
+        """Test a short in-memory run delivers every event to every socket"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        out = StringIO()
+        call_command(
+            'bench_websockets', connections=3, rate=20, duration=0.2,
+            coalesce_window=0, json=True, stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['deliveries'], report['deliveries_expected'])
+        self.assertEqual(report['deliveries_expected'], 3 * report['events_published'])
+        self.assertIn('p99', report['latency_ms'])
+
+
+# ========== TELEGRAM TESTS ==========
+
+class TelegramDeliveryTest(TestCase):
+    """Test the queued, rate-limited Telegram delivery"""
+    
+    def setUp(self):
+        self.order = Order.objects.create(
+            order_number='MD00001', customer_name='Test Customer', customer_phone='012345678',
+            customer_address='123 Test St', customer_province='Phnom Penh',
+            subtotal=Decimal('19.99'), total=Decimal('19.99'),
+            payment_method='Cash on Delivery', status='pending'
+        )
+    
+    @override_settings(TELEGRAM_CHAT_ID='1001')
+    def test_checkout_notification_is_queued(self):
+        """Test new order notifications are queued instead of sent inline"""
+        from unittest.mock import patch
+        from .models import TelegramMessage
+        from .views import send_telegram_notification
+        
+        with patch('app.telegram_delivery.call_telegram_api') as api:
+            self.assertTrue(send_telegram_notification(self.order))
+            api.assert_not_called()
+        
+        message = TelegramMessage.objects.get()
+        self.assertEqual(message.chat_id, '1001')
+        self.assertEqual(message.status, 'pending')
+        self.assertIn('MD00001', message.payload['text'])
+    
+    def test_rate_limits_and_retry_after(self):
+        """Test per-chat limits keep order and 429 retry_after reschedules without counting an attempt"""
+        from unittest.mock import patch
+        from .models import TelegramMessage
+        from .telegram_delivery import TelegramRateLimiter, deliver_due_messages, queue_telegram_message
+        
+        first = queue_telegram_message('1001', 'first')
+        second = queue_telegram_message('1001', 'second')
+        throttled = queue_telegram_message('2002', 'other chat')
+        
+        def api(method, payload):
+            if payload['chat_id'] == '2002':
+                return {'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                        'parameters': {'retry_after': 30}}
+            return {'ok': True, 'result': {}}
+        
+        with patch('app.telegram_delivery.call_telegram_api', side_effect=api) as mocked:
+            sent = deliver_due_messages(TelegramRateLimiter(global_rate=30, chat_rate=1))
+        
+        self.assertEqual(sent, 1)
+        self.assertEqual(mocked.call_count, 2)  # second message to 1001 waits for the chat bucket
+        first.refresh_from_db()
+        second.refresh_from_db()
+        throttled.refresh_from_db()
+        self.assertEqual(first.status, 'sent')
+        self.assertEqual(second.status, 'pending')
+        self.assertEqual(throttled.status, 'pending')
+        self.assertEqual(throttled.attempts, 0)
+        self.assertGreater(throttled.next_attempt_at, timezone.now() + timedelta(seconds=20))
+        
+        # Client errors aren't retried
+        with patch('app.telegram_delivery.call_telegram_api',
+                   return_value={'ok': False, 'error_code': 400, 'description': 'chat not found'}):
+            deliver_due_messages(TelegramRateLimiter())
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'failed')
+        self.assertEqual(TelegramMessage.objects.filter(status='pending').count(), 1)
+
+
+
+@override_settings(TELEGRAM_BOT_TOKEN='test-token')
+class TelegramListCommandTest(TestCase):
+    """Test list commands reply with one paginated message"""
+    
+    def setUp(self):
+        for i in range(1, 13):
+            Order.objects.create(
+                order_number=f'MD{i:05d}', customer_name=f'Customer {i}', customer_phone='012345678',
+                customer_address='123 Test St', customer_province='Phnom Penh',
+                subtotal=Decimal('19.99'), total=Decimal('19.99'),
+                payment_method='Cash on Delivery', status='pending'
+            )
+    
+    def test_orders_command_sends_single_page(self):
+        """Test /orders is one query and one sendMessage with a next-page button"""
+        from unittest.mock import patch
+        from .telegram_bot import handle_telegram_command
+        
+        with patch('app.telegram_bot.call_telegram_api', return_value={'ok': True}) as api:
+            with self.assertNumQueries(1):
+                self.assertTrue(handle_telegram_command('/orders', 1001))
+        
+        api.assert_called_once()
+        method, data = api.call_args[0]
+        self.assertEqual(method, 'sendMessage')
+        self.assertIn('Orders to Prepare</b> (12)', data['text'])
+        self.assertIn('#MD00012', data['text'])
+        self.assertNotIn('#MD00002', data['text'])
+        keyboard = data['reply_markup']['inline_keyboard']
+        self.assertEqual(keyboard[0][0]['callback_data'], 'ls_orders_0_MD00012_preparing')
+        self.assertIn({'text': 'Next 10 ➡️', 'callback_data': 'list_orders_1'}, keyboard[-1])
+    
+    def test_next_page_edits_message(self):
+        """Test the navigation button edits the list in place"""
+        from unittest.mock import patch
+        from .telegram_bot import handle_callback_query
+        
+        with patch('app.telegram_bot.call_telegram_api', return_value={'ok': True}) as api:
+            self.assertTrue(handle_callback_query('list_orders_1', 1001, 55))
+        
+        method, data = api.call_args[0]
+        self.assertEqual(method, 'editMessageText')
+        self.assertEqual(data['message_id'], 55)
+        self.assertIn('Showing 11–12', data['text'])
+        self.assertIn('#MD00001', data['text'])
+        navigation = [button['callback_data'] for button in data['reply_markup']['inline_keyboard'][-1]]
+        self.assertEqual(navigation, ['list_orders_0', 'list_orders_1'])
+    
+    def test_empty_list(self):
+        """Test an empty list sends the caught-up message"""
+        from unittest.mock import patch
+        from .telegram_bot import handle_telegram_command
+        
+        with patch('app.telegram_bot.call_telegram_api', return_value={'ok': True}) as api:
+            handle_telegram_command('/out', 1001)
+        
+        self.assertEqual(api.call_args[0][1]['text'], "🚚 No orders out for delivery.")
+
+
+@override_settings(TELEGRAM_BOT_TOKEN='test-token')
+class TelegramCallbackTest(TestCase):
+    """Test status buttons edit the original message"""
+    
+    def setUp(self):
+        self.order = Order.objects.create(
+            order_number='MD00001', customer_name='Test Customer', customer_phone='012345678',
+            customer_address='123 Test St', customer_province='Phnom Penh',
+            subtotal=Decimal('19.99'), total=Decimal('19.99'),
+            payment_method='KHQR', status='preparing'
+        )
+    
+    def test_status_button_edits_order_card(self):
+        """Test a valid transition is saved and the card is edited, not resent"""
+        from unittest.mock import patch
+        from .telegram_bot import handle_callback_query
+        
+        with patch('app.telegram_bot.call_telegram_api', return_value={'ok': True}) as api:
+            handled = handle_callback_query('status_MD00001_ready_for_delivery', 1001, 55, callback_query_id='cb1')
+        
+        self.assertTrue(handled)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'ready_for_delivery')
+        self.assertEqual([call[0][0] for call in api.call_args_list], ['editMessageText', 'answerCallbackQuery'])
+        edit = api.call_args_list[0][0][1]
+        self.assertEqual(edit['message_id'], 55)
+        self.assertIn('Ready for Delivery', edit['text'])
+        self.assertEqual(
+            edit['reply_markup']['inline_keyboard'][0][0]['callback_data'], 'status_MD00001_out_for_delivery'
+        )
+        self.assertFalse(api.call_args_list[1][0][1]['show_alert'])
+    
+    def test_invalid_transition_is_rejected(self):
+        """Test a stale button doesn't skip states and refreshes the card"""
+        from unittest.mock import patch
+        from .telegram_bot import handle_callback_query
+        
+        with patch('app.telegram_bot.call_telegram_api', return_value={'ok': True}) as api:
+            handle_callback_query('status_MD00001_delivered', 1001, 55, callback_query_id='cb1')
+        
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'preparing')
+        self.assertEqual(api.call_args_list[0][0][0], 'editMessageText')
+        answer = api.call_args_list[1][0][1]
+        self.assertTrue(answer['show_alert'])
+        self.assertIn('Preparing', answer['text'])
+    
+    def test_list_status_button_rerenders_page(self):
+        """Test a status button on a list page edits that page"""
+        from unittest.mock import patch
+        from .telegram_bot import handle_callback_query
+        
+        with patch('app.telegram_bot.call_telegram_api', return_value={'ok': True}) as api:
+            handle_callback_query('ls_preparing_0_MD00001_ready_for_delivery', 1001, 55)
+        
+        api.assert_called_once()
+        method, data = api.call_args[0]
+        self.assertEqual(method, 'editMessageText')
+        self.assertEqual(data['text'], "📦 No orders currently being prepared.")
+
+
+class TelegramWebhookTest(TestCase):
+    """Test the webhook queues updates and the worker processes them"""
+    
+    def post_update(self, update, **extra):
+        return self.client.post(
+            reverse('telegram_webhook'), data=json.dumps(update), content_type='application/json', **extra
+        )
+    
+    def command(self, update_id, chat_id, text):
+        return {'update_id': update_id, 'message': {'chat': {'id': chat_id}, 'text': text}}
+    
+    def test_webhook_acknowledges_and_dedups(self):
+        """Test updates are stored once per update_id without calling Telegram"""
+        from unittest.mock import patch
+        from .models import TelegramUpdate
+        
+        with patch('app.telegram_bot.call_telegram_api') as api:
+            for _ in range(2):  # Telegram redelivery
+                response = self.post_update(self.command(500, 1001, '/orders'))
+                self.assertEqual(response.status_code, 200)
+            self.post_update({'update_id': 501, 'message': {'chat': {'id': 1001}, 'text': 'hello'}})
+            api.assert_not_called()
+        
+        update = TelegramUpdate.objects.get()
+        self.assertEqual((update.update_id, update.chat_id, update.status), (500, '1001', 'pending'))
+    
+    @override_settings(TELEGRAM_WEBHOOK_SECRET='s3cret')
+    def test_webhook_secret(self):
+        """Test updates without the registered secret token are rejected"""
+        from .models import TelegramUpdate
+        
+        self.assertEqual(self.post_update(self.command(500, 1001, '/orders')).status_code, 403)
+        response = self.post_update(
+            self.command(500, 1001, '/orders'), HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='s3cret'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(TelegramUpdate.objects.count(), 1)
+    
+    def test_worker_processes_in_order_per_chat(self):
+        """Test queued updates are handled oldest first and marked done"""
+        from unittest.mock import patch
+        from .models import TelegramUpdate
+        from .telegram_updates import process_pending_updates, queue_update
+        
+        queue_update(self.command(12, 1001, '/ready'))
+        queue_update(self.command(10, 1001, '/orders'))
+        queue_update(self.command(11, 2002, '/out'))
+        
+        with patch('app.telegram_updates.handle_telegram_command') as handler:
+            self.assertEqual(process_pending_updates(), 3)
+        
+        calls = [call[0] for call in handler.call_args_list]
+        self.assertEqual([text for text, chat_id in calls if chat_id == 1001], ['/orders', '/ready'])
+        self.assertIn(('/out', 2002), calls)
+        self.assertFalse(TelegramUpdate.objects.exclude(status='done').exists())
+    
+    def test_worker_survives_failed_round(self):
+        """Test an error in one round is logged and the worker keeps polling"""
+        from io import StringIO
+        from unittest.mock import patch
+        from django.core.management import call_command
+        
+        with patch('app.management.commands.telegram_worker.process_pending_updates',
+                   side_effect=[Exception('database went away'), KeyboardInterrupt]) as rounds, \
+                patch('app.management.commands.telegram_worker.time.sleep'), \
+                self.assertLogs('app.management.commands.telegram_worker', level='ERROR'):
+            out = StringIO()
+            call_command('telegram_worker', stdout=out)
+        
+        self.assertEqual(rounds.call_count, 2)
+        self.assertIn('Telegram worker stopped', out.getvalue())
+
 # ========== INTEGRATION TESTS ==========
 
 class OrderFlowIntegrationTest(TestCase):
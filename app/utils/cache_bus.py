@@ -0,0 +1,282 @@
+"""
+Cache invalidation bus for MADAM DA E-Commerce
+
+Two-level cache shared by every Gunicorn worker and Daphne process:
+- L1: in-process dict, near-zero latency for hot reads (hero slides, catalog, promo codes)
+- L2: Django cache (Redis in production), keyed by a per-namespace version
+
+Writers call invalidate(namespace) (model signals do this on commit). That bumps the
+namespace version in Redis and publishes it over Redis pub/sub; every process drops
+its L1 entries for that namespace when the message arrives, and the new version makes
+old L2 entries unreachable.
+
+Without CACHE_BUS_REDIS_URL the bus runs in local mode: there is no pub/sub, and
+versions are kept in the Django cache instead. When that cache is shared between
+processes, other processes pick up a bump once their cached version expires
+(CACHE_BUS_L1_TIMEOUT). When it isn't (DummyCache, LocMemCache), versions fall back
+to a per-process counter and only the invalidating process sees the change.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY_PREFIX = 'madamda:cache_version:'
+
+SUBSCRIBER_POLL_TIMEOUT = 5  # seconds per get_message() wait
+SUBSCRIBER_HEALTH_CHECK_INTERVAL = 30  # seconds
+
+
+def _redis_url():
+    return getattr(settings, 'CACHE_BUS_REDIS_URL', '')
+
+
+def _channel():
+    return getattr(settings, 'CACHE_BUS_CHANNEL', 'madamda:cache_invalidation')
+
+
+def _l1_timeout():
+    return getattr(settings, 'CACHE_BUS_L1_TIMEOUT', 60)
+
+
+def _l1_max_entries():
+    return getattr(settings, 'CACHE_BUS_L1_MAX_ENTRIES', 1000)
+
+
+class CacheBus:
+    """Versioned two-level cache with pub/sub invalidation (one instance per process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._l1 = {}  # namespace -> OrderedDict {key: (value, expires_at, version)}, least recently used first
+        self._versions = {}  # namespace -> (version, expires_at) known to this process
+        self._local_versions = {}  # namespace -> version (local mode only)
+        self._redis = None
+        self._subscriber_redis = None
+        self._pid = None
+        self._subscriber = None
+
+    # ----- Redis connection / subscriber -----
+
+    def _get_redis(self):
+        """Lazily connect (after fork) and start the subscriber thread for this process"""
+        url = _redis_url()
+        if not url:
+            return None
+
+        pid = os.getpid()
+        if self._pid != pid:
+            # New process (Gunicorn fork) - connections and threads don't survive fork
+            with self._lock:
+                if self._pid != pid:
+                    self._l1.clear()
+                    self._versions.clear()
+                    try:
+                        import redis
+                        self._redis = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+                        # The subscriber waits on an idle channel, so it must not share the 2s read timeout;
+                        # health checks (PING) still detect a dead connection
+                        self._subscriber_redis = redis.Redis.from_url(
+                            url, socket_connect_timeout=2, health_check_interval=SUBSCRIBER_HEALTH_CHECK_INTERVAL
+                        )
+                    except Exception as e:
+                        logger.warning(f"Cache bus could not connect to Redis, using local mode: {e}")
+                        self._redis = None
+                    self._pid = pid
+                    if self._redis is not None:
+                        self._subscriber = threading.Thread(
+                            target=self._listen, name='cache-bus-subscriber', daemon=True
+                        )
+                        self._subscriber.start()
+        return self._redis
+
+    def _listen(self):
+        """Subscriber loop - drops L1 entries when another process invalidates a namespace"""
+        backoff = 1
+        while True:
+            try:
+                pubsub = self._subscriber_redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(_channel())
+                # Messages may have been missed while disconnected
+                self.clear_local()
+                backoff = 1
+                while True:
+                    # None when the channel is idle - not an error
+                    message = pubsub.get_message(timeout=SUBSCRIBER_POLL_TIMEOUT)
+                    if message and message.get('type') == 'message':
+                        self.handle_message(message.get('data'))
+            except Exception as e:
+                logger.warning(f"Cache bus subscriber disconnected, retrying in {backoff}s: {e}")
+                self.clear_local()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def handle_message(self, data):
+        """Apply an invalidation message: {"namespace": ..., "version": ...}"""
+        try:
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            payload = json.loads(data)
+            namespace = payload['namespace']
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Invalid cache bus message {data!r}: {e}")
+            return
+        with self._lock:
+            self._l1.pop(namespace, None)
+            if payload.get('version') is not None:
+                self._versions[namespace] = (int(payload['version']), time.monotonic() + _l1_timeout())
+            else:
+                self._versions.pop(namespace, None)
+
+    def clear_local(self):
+        """Drop every L1 entry and cached version in this process"""
+        with self._lock:
+            self._l1.clear()
+            self._versions.clear()
+
+    # ----- Versions -----
+
+    def get_version(self, namespace):
+        """Current version of a namespace (cached per process, updated by bus messages), None if unreadable"""
+        with self._lock:
+            cached = self._versions.get(namespace)
+        # Re-read periodically too, in case a message was lost
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                version = int(client.get(VERSION_KEY_PREFIX + namespace) or 0)
+            except Exception as e:
+                logger.warning(f"Cache bus version read failed for {namespace}: {e}")
+                # Unknown - a guess could serve entries invalidated long ago; try again on the next read
+                return None
+        else:
+            version = self._shared_version(namespace)
+            if version is None:
+                return None
+
+        with self._lock:
+            self._versions[namespace] = (version, time.monotonic() + _l1_timeout())
+        return version
+
+    def _shared_version(self, namespace):
+        """Local mode: version from the Django cache, or this process's counter (None if unreadable)"""
+        try:
+            version = cache.get(VERSION_KEY_PREFIX + namespace)
+        except Exception as e:
+            logger.warning(f"Cache bus version read failed for {namespace}: {e}")
+            return None
+        if version is None:
+            return self._local_versions.get(namespace, 0)
+        return int(version)
+
+    def _bump_shared_version(self, namespace):
+        """Local mode: bump the version in the Django cache (and this process's counter)"""
+        with self._lock:
+            version = self._local_versions.get(namespace, 0) + 1
+            self._local_versions[namespace] = version
+        key = VERSION_KEY_PREFIX + namespace
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            # Not in the cache yet (or a DummyCache) - start from the local counter
+            try:
+                cache.add(key, version, timeout=None)
+            except Exception as e:
+                logger.warning(f"Cache bus version write failed for {namespace}: {e}")
+        except Exception as e:
+            logger.warning(f"Cache bus version write failed for {namespace}: {e}")
+        with self._lock:
+            self._local_versions[namespace] = max(version, self._local_versions[namespace])
+        return version
+
+    def invalidate(self, namespace):
+        """Bump a namespace version and tell every process to drop its L1 entries"""
+        version = None
+        client = self._get_redis()
+        if client is not None:
+            try:
+                version = client.incr(VERSION_KEY_PREFIX + namespace)
+                client.publish(_channel(), json.dumps({'namespace': namespace, 'version': version}))
+            except Exception as e:
+                logger.warning(f"Cache bus publish failed for {namespace}: {e}")
+                version = None
+
+        if version is None:
+            version = self._bump_shared_version(namespace)
+
+        # Apply locally right away (don't wait for our own message)
+        self.handle_message(json.dumps({'namespace': namespace, 'version': version}))
+        return version
+
+    # ----- Reads -----
+
+    def get_or_set(self, namespace, key, loader, timeout=300):
+        """
+        Get a value from L1, then L2, then loader()
+
+        L1 keeps at most CACHE_BUS_L1_MAX_ENTRIES keys per namespace (least recently
+        used go first). None is never cached, so keys that miss - often user input,
+        like unknown promo codes - can't fill the caches.
+
+        Args:
+            namespace: invalidation namespace (e.g. 'hero_slides')
+            key: key within the namespace
+            loader: callable returning the fresh value
+            timeout: L2 (shared cache) timeout in seconds
+        """
+        version = self.get_version(namespace)
+        if version is None:
+            # Version unknown (Redis unreachable) - neither cache level can be trusted
+            return loader()
+        now = time.monotonic()
+
+        with self._lock:
+            entries = self._l1.get(namespace)
+            entry = entries.get(key) if entries else None
+            if entry is not None:
+                if entry[1] > now and entry[2] == version:
+                    entries.move_to_end(key)
+                    return entry[0]
+                # Expired or from an old version - drop it instead of keeping it around
+                del entries[key]
+
+        shared_key = f'bus:{namespace}:v{version}:{key}'
+        try:
+            value = cache.get(shared_key)
+        except Exception as e:
+            logger.warning(f"Cache bus L2 read failed for {shared_key}: {e}")
+            value = None
+
+        if value is None:
+            value = loader()
+            if value is None:
+                return None
+            try:
+                cache.set(shared_key, value, timeout)
+            except Exception as e:
+                logger.warning(f"Cache bus L2 write failed for {shared_key}: {e}")
+
+        with self._lock:
+            # Only keep it if no invalidation arrived while loading
+            if self._versions.get(namespace, (version,))[0] == version:
+                entries = self._l1.setdefault(namespace, OrderedDict())
+                entries[key] = (value, now + min(_l1_timeout(), timeout), version)
+                entries.move_to_end(key)
+                while len(entries) > _l1_max_entries():
+                    entries.popitem(last=False)
+        return value
+
+
+cache_bus = CacheBus()
+
+get_or_set = cache_bus.get_or_set
+invalidate = cache_bus.invalidate
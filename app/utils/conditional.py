@@ -0,0 +1,108 @@
+"""
+Conditional GET helpers (ETag / Last-Modified) for MADAM DA E-Commerce
+
+ETags are computed from a content version instead of the rendered body, so a
+revisit can be answered with 304 Not Modified before any template is rendered:
+- Static content pages: template mtime + static manifest + language
+- Shop page: catalog version (products + hero slides) + page + template mtimes
+  (page and product card) + language
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Max, Count
+from django.template.loader import get_template
+from django.utils.translation import get_language
+
+from ..models import Product, HeroSlide
+from ..templatetags.product_cards import PRODUCT_CARD_TEMPLATE
+from .cache_bus import get_or_set
+
+logger = logging.getLogger(__name__)
+
+# Safety net for bulk updates that bypass model signals (queryset.update)
+CATALOG_VERSION_TIMEOUT = 60  # seconds
+
+
+def _make_etag(*parts):
+    """Build a weak ETag from version parts (weak because responses are gzipped by middleware)"""
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _static_manifest_mtime():
+    """Static manifest changes on every collectstatic, which changes hashed asset URLs in pages"""
+    manifest = os.path.join(settings.STATIC_ROOT, 'staticfiles.json')
+    try:
+        return os.path.getmtime(manifest)
+    except OSError:
+        return 0
+
+
+def _template_mtime(template_name):
+    try:
+        return os.path.getmtime(get_template(template_name).origin.name)
+    except Exception as e:
+        logger.warning(f"Could not read template mtime for {template_name}: {e}")
+        return None
+
+
+def catalog_version():
+    """
+    Version of everything shown on the shop page
+
+    Changes when any product or hero slide is added, edited, deactivated or deleted.
+    Cached through the cache bus ('catalog' namespace, invalidated by model signals).
+    """
+    return get_or_set('catalog', 'version', _load_catalog_version, CATALOG_VERSION_TIMEOUT)
+
+
+def _load_catalog_version():
+    products = Product.objects.aggregate(last_updated=Max('updated_at'), total=Count('id'))
+    slides = HeroSlide.objects.aggregate(last_updated=Max('updated_at'), total=Count('id'))
+    return (
+        f"{products['last_updated'].timestamp() if products['last_updated'] else 0}:{products['total']}:"
+        f"{slides['last_updated'].timestamp() if slides['last_updated'] else 0}:{slides['total']}"
+    )
+
+
+def template_etag(template_name):
+    """Return an etag_func for django.views.decorators.http.condition for a static template page"""
+    def etag_func(request, *args, **kwargs):
+        mtime = _template_mtime(template_name)
+        if mtime is None:
+            return None
+        return _make_etag(template_name, mtime, _static_manifest_mtime(), get_language())
+    return etag_func
+
+
+def template_last_modified(template_name):
+    """Return a last_modified_func for django.views.decorators.http.condition for a static template page"""
+    def last_modified_func(request, *args, **kwargs):
+        mtime = _template_mtime(template_name)
+        if mtime is None:
+            return None
+        return datetime.fromtimestamp(max(mtime, _static_manifest_mtime()), tz=dt_timezone.utc)
+    return last_modified_func
+
+
+def shop_etag(request, *args, **kwargs):
+    """ETag for the shop page (catalog version + requested page + language)"""
+    try:
+        version = catalog_version()
+    except Exception as e:
+        # Never block the page on the version query - just skip conditional handling
+        logger.warning(f"Could not compute catalog version: {e}")
+        return None
+    return _make_etag(
+        'shop',
+        version,
+        request.GET.get('page', 1),
+        _template_mtime('app/shop/index.html'),
+        # Cards are rendered from their own template - a deploy may change only that
+        _template_mtime(PRODUCT_CARD_TEMPLATE),
+        _static_manifest_mtime(),
+        get_language(),
+    )
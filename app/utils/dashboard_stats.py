@@ -0,0 +1,133 @@
+"""
+Employee dashboard column counters for MADAM DA E-Commerce
+
+Counts for every active column come from one grouped query
+(values('status').annotate(Count)). They are kept in the cache and adjusted
+incrementally on status transitions (see app/signals.py), so the count header
+costs a single cache read while the keys are warm. Counters expire after
+DASHBOARD_COUNTS_TIMEOUT, which also corrects drift from queryset.update().
+The delivered column is a rolling window, so it is counted on every read.
+"""
+import logging
+from datetime import timedelta
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from ..models import Order
+
+logger = logging.getLogger(__name__)
+
+# Delivered orders stay on the board for this long
+DELIVERED_WINDOW = timedelta(days=7)
+
+# Order status -> dashboard column
+DASHBOARD_COLUMNS = {
+    'pending': 'to_prepare',
+    'confirmed': 'to_prepare',
+    'preparing': 'preparing',
+    'ready_for_delivery': 'ready',
+    'out_for_delivery': 'out',
+    'delivered': 'delivered',
+}
+
+# Columns with counters (delivered is a rolling time window, so it can't be kept incrementally)
+COUNTED_COLUMNS = ['to_prepare', 'preparing', 'ready', 'out']
+COUNTED_STATUSES = [status for status, column in DASHBOARD_COLUMNS.items() if column in COUNTED_COLUMNS]
+
+DASHBOARD_COUNTS_TIMEOUT = 300  # seconds
+DASHBOARD_COUNT_PREFIX = 'dashboard_count_'
+
+
+def _count_key(column):
+    return f'{DASHBOARD_COUNT_PREFIX}{column}'
+
+
+def counted_column(status, customer_received):
+    """Counted column for an order state, or None if it isn't counted"""
+    if customer_received:
+        return None
+    column = DASHBOARD_COLUMNS.get(status)
+    return column if column in COUNTED_COLUMNS else None
+
+
+def count_dashboard_columns():
+    """Count every active column with a single grouped query"""
+    counts = {column: 0 for column in COUNTED_COLUMNS}
+    rows = Order.objects.filter(
+        status__in=COUNTED_STATUSES,
+        customer_received=False,
+    ).values('status').annotate(total=Count('id')).order_by()
+    for row in rows:
+        counts[DASHBOARD_COLUMNS[row['status']]] += row['total']
+    return counts
+
+
+def get_dashboard_counts():
+    """
+    Active column counts, from the cache when warm
+
+    Returns:
+        dict mapping column ('to_prepare', 'preparing', 'ready', 'out') -> count
+    """
+    keys = {_count_key(column): column for column in COUNTED_COLUMNS}
+    try:
+        cached = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"Dashboard counter read failed: {e}")
+        cached = {}
+
+    if len(cached) == len(keys):
+        return {keys[key]: value for key, value in cached.items()}
+
+    counts = count_dashboard_columns()
+    try:
+        cache.set_many({_count_key(column): value for column, value in counts.items()}, DASHBOARD_COUNTS_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Dashboard counter write failed: {e}")
+    return counts
+
+
+def count_delivered():
+    """Orders in the delivered column (delivered within DELIVERED_WINDOW)"""
+    return Order.objects.filter(
+        status='delivered',
+        updated_at__gte=timezone.now() - DELIVERED_WINDOW,
+    ).count()
+
+
+def get_dashboard_stats():
+    """Column counts in the format used by the dashboard template and API"""
+    counts = get_dashboard_counts()
+    return {
+        'total_to_prepare': counts['to_prepare'],
+        'total_preparing': counts['preparing'],
+        'total_ready': counts['ready'],
+        'total_out': counts['out'],
+        'total_completed': count_delivered(),
+    }
+
+
+def apply_column_transition(old_column, new_column):
+    """Move one order between counters (call after commit)"""
+    if old_column == new_column:
+        return
+    try:
+        if old_column:
+            cache.decr(_count_key(old_column))
+        if new_column:
+            cache.incr(_count_key(new_column))
+    except ValueError:
+        # Counter not cached - the next read recounts from the database
+        invalidate_dashboard_counts()
+    except Exception as e:
+        logger.warning(f"Dashboard counter update failed: {e}")
+        invalidate_dashboard_counts()
+
+
+def invalidate_dashboard_counts():
+    """Drop cached counters so the next read recounts"""
+    try:
+        cache.delete_many([_count_key(column) for column in COUNTED_COLUMNS])
+    except Exception as e:
+        logger.warning(f"Dashboard counter invalidation failed: {e}")
@@ -0,0 +1,189 @@
+"""
+Sequenced order event log for WebSocket replay
+
+Every order event published to the WebSocket groups is stamped with a
+monotonically increasing sequence number and appended to a bounded Redis
+stream (stream id "<seq>-0"). A client that reconnects with the last seq it saw
+gets only the events it missed; when they are no longer retained (or there are
+too many of them) it is told to resync instead.
+
+Sequence allocation and the append run as one Lua script, so stream order always
+matches sequence order across workers.
+
+Without WEBSOCKET_REDIS_URL (development) the log is kept per process. While
+Redis is unreachable, events go out without a seq and clients resync on their
+next reconnect.
+"""
+import json
+import logging
+import threading
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_KEY = 'madamda:order_events'
+EVENT_SEQ_KEY = 'madamda:order_events:seq'
+
+# KEYS[1] = stream, KEYS[2] = sequence counter, ARGV = record, max length
+APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[2])
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], seq .. '-0', 'record', ARGV[1])
+return seq
+"""
+
+
+def _redis_url():
+    return getattr(settings, 'WEBSOCKET_REDIS_URL', '')
+
+
+def _maxlen():
+    return getattr(settings, 'EVENT_LOG_MAXLEN', 10000)
+
+
+def build_record(event_type, event_id, messages):
+    """
+    Log record for an event published as (group, event) messages
+
+    The record keeps the full event (orders from every message) and, per order,
+    the groups it was sent to, so replay can filter by a client's subscriptions.
+    """
+    routes = {}
+    orders = {}
+    extra = {}
+    for group, event in messages:
+        for order in ([event['order']] if 'order' in event else event['orders']):
+            routes.setdefault(str(order['order_id']), []).append(group)
+            orders[order['order_id']] = order
+        extra.update({key: value for key, value in event.items() if key not in ('order', 'orders')})
+
+    full_event = dict(extra)
+    if any('orders' in event for _, event in messages):
+        full_event['orders'] = list(orders.values())
+    else:
+        full_event['order'] = next(iter(orders.values()))
+    return {'type': event_type, 'event_id': event_id, 'event': full_event, 'routes': routes}
+
+
+def event_for_groups(record, groups):
+    """
+    The part of a logged event a client subscribed to groups would have received
+
+    Returns:
+        channel layer message dict, or None if none of its orders match
+    """
+    def matches(order):
+        return not groups.isdisjoint(record['routes'].get(str(order['order_id']), ()))
+
+    event = record['event']
+    if 'orders' in event:
+        orders = [order for order in event['orders'] if matches(order)]
+        if not orders:
+            return None
+        event = {**event, 'orders': orders}
+    elif not matches(event['order']):
+        return None
+    return {'type': record['type'], 'event_id': record['event_id'], **event}
+
+
+class EventLog:
+    """Bounded, sequenced log of order events (one instance per process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._append_script = None
+        self._async_client = None
+        self._local = deque()  # fallback: (seq, record) appended by this process
+        self._local_seq = 0
+
+    def _get_client(self):
+        url = _redis_url()
+        if not url:
+            return None
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+            self._append_script = self._client.register_script(APPEND_SCRIPT)
+        return self._client
+
+    def _get_async_client(self):
+        url = _redis_url()
+        if not url:
+            return None
+        if self._async_client is None:
+            import redis.asyncio as aioredis
+            self._async_client = aioredis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        return self._async_client
+
+    def append(self, record):
+        """Log a record and return its sequence number (None if Redis is unreachable)"""
+        data = json.dumps(record)
+        client = self._get_client()
+        if client is not None:
+            try:
+                return int(self._append_script(keys=[EVENT_LOG_KEY, EVENT_SEQ_KEY], args=[data, _maxlen()]))
+            except Exception as e:
+                # Clients resync for events without a seq
+                logger.warning(f"Order event log append failed: {e}")
+                return None
+
+        with self._lock:
+            self._local_seq += 1
+            self._local.append((self._local_seq, data))
+            while len(self._local) > _maxlen():
+                self._local.popleft()
+            return self._local_seq
+
+    def current_seq(self):
+        """Sequence number of the latest event (0 before the first one, None if unknown)"""
+        client = self._get_client()
+        if client is not None:
+            try:
+                return int(client.get(EVENT_SEQ_KEY) or 0)
+            except Exception as e:
+                logger.warning(f"Order event log read failed: {e}")
+                return None
+        return self._local_seq
+
+    async def read_since(self, last_seq, limit):
+        """
+        Records after last_seq, oldest first
+
+        Returns:
+            (current_seq, records) - records is a list of (seq, record), or None if
+            the missed events aren't all retained or exceed limit (resync needed)
+        """
+        client = self._get_async_client()
+        if client is not None:
+            try:
+                current = int(await client.get(EVENT_SEQ_KEY) or 0)
+                if last_seq >= current:
+                    # Nothing missed (or the counter was reset - resync then)
+                    return current, ([] if last_seq == current else None)
+                if current - last_seq > limit:
+                    return current, None
+                entries = await client.xrange(EVENT_LOG_KEY, min=f'{last_seq + 1}-0', max=f'{current}-0', count=limit)
+                records = [
+                    (int(entry_id.split(b'-')[0]), json.loads(fields[b'record']))
+                    for entry_id, fields in entries
+                ]
+            except Exception as e:
+                logger.warning(f"Order event log replay failed: {e}")
+                return None, None
+        else:
+            with self._lock:
+                current = self._local_seq
+                records = [(seq, json.loads(data)) for seq, data in self._local if seq > last_seq]
+            if last_seq >= current:
+                return current, ([] if last_seq == current else None)
+            if current - last_seq > limit:
+                return current, None
+
+        # A trimmed log no longer starts right after last_seq
+        if not records or records[0][0] != last_seq + 1:
+            return current, None
+        return current, records
+
+
+event_log = EventLog()
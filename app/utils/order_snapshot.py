@@ -0,0 +1,312 @@
+"""
+Order snapshots for MADAM DA E-Commerce
+
+One representation of an order shared by the employee dashboard API, WebSocket
+events and notifications. A snapshot is built from a single .values() query plus
+one items query and cached per (order id, updated_at), so it changes whenever the
+order is saved and never needs explicit invalidation.
+
+Events are published to the subscription topic groups of each order (see
+app/utils/ws_topics.py). WebSocket frames are JSON-encoded once per event and
+process (see encode_order_event) and the same text is sent to every subscriber.
+"""
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from django.core.cache import cache
+from django.db import transaction
+
+from ..models import Order, OrderItem
+from .event_log import build_record, event_log
+from .ws_topics import ALL_GROUP, order_event_groups
+
+try:
+    import orjson
+except ImportError:
+    # orjson not installed - frames are encoded with the standard json module
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_CACHE_TIMEOUT = 600  # seconds
+SNAPSHOT_CACHE_PREFIX = 'order_snapshot_'
+
+SNAPSHOT_FIELDS = (
+    'id', 'order_number', 'status', 'customer_name', 'customer_phone',
+    'customer_address', 'customer_province', 'total', 'payment_method',
+    'created_at', 'updated_at', 'notes', 'customer_received', 'customer_received_at',
+    'customer_received_by', 'payment_received', 'payment_received_at',
+)
+
+ITEM_FIELDS = ('order_id', 'product_name', 'quantity', 'product_price', 'subtotal')
+
+STATUS_DISPLAY = dict(Order.ORDER_STATUS_CHOICES)
+
+# Orders WebSocket group (all employee dashboards, 'all' topic)
+ORDERS_GROUP = ALL_GROUP
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _snapshot_key(order_id, updated_at):
+    return f'{SNAPSHOT_CACHE_PREFIX}{order_id}_{int(updated_at.timestamp() * 1_000_000)}'
+
+
+def format_item(item):
+    """Format an order item (OrderItem or .values() row) for a snapshot"""
+    if not isinstance(item, dict):
+        item = {field: getattr(item, field) for field in ITEM_FIELDS}
+    return {
+        'product_name': item['product_name'],
+        'quantity': item['quantity'],
+        'price': str(item['product_price']),
+        'subtotal': str(item['subtotal']),
+    }
+
+
+def format_order(order, items=None, items_count=None):
+    """
+    Format an order (Order instance or .values() row) as a snapshot dict
+
+    Args:
+        order: Order instance or dict with SNAPSHOT_FIELDS
+        items: formatted items, or None to leave them out (dashboard cards)
+        items_count: number of items when items are left out
+    """
+    if not isinstance(order, dict):
+        order = {field: getattr(order, field) for field in SNAPSHOT_FIELDS}
+    snapshot = {
+        'order_id': order['id'],
+        'order_number': order['order_number'],
+        'status': order['status'],
+        'status_display': STATUS_DISPLAY.get(order['status'], order['status']),
+        'customer_name': order['customer_name'],
+        'customer_phone': order['customer_phone'],
+        'customer_address': order['customer_address'],
+        'customer_province': order['customer_province'],
+        'total': str(order['total']),
+        'total_amount': str(order['total']),  # For compatibility
+        'payment_method': order['payment_method'],
+        'created_at': _isoformat(order['created_at']),
+        'updated_at': _isoformat(order['updated_at']),
+        'notes': order['notes'] or '',  # Include delivery notes for real-time updates
+        'customer_received': order['customer_received'],
+        'customer_received_at': _isoformat(order['customer_received_at']),
+        'customer_received_by': order['customer_received_by'],
+        'payment_received': order['payment_received'],
+        'payment_received_at': _isoformat(order['payment_received_at']),
+    }
+    if items is not None:
+        snapshot['items'] = items
+        snapshot['items_count'] = len(items)
+    else:
+        snapshot['items_count'] = items_count
+    return snapshot
+
+
+def build_order_snapshot(order_id):
+    """Build a full snapshot (with items) from the database - two queries"""
+    row = Order.objects.filter(pk=order_id).values(*SNAPSHOT_FIELDS).first()
+    if row is None:
+        return None
+    items = [format_item(item) for item in OrderItem.objects.filter(order_id=order_id).values(*ITEM_FIELDS)]
+    return format_order(row, items=items)
+
+
+def build_order_snapshots(order_ids):
+    """Build full snapshots for many orders with two queries (missing orders are skipped)"""
+    items = {}
+    for item in OrderItem.objects.filter(order_id__in=order_ids).values(*ITEM_FIELDS).order_by('order_id', 'id'):
+        items.setdefault(item['order_id'], []).append(format_item(item))
+    return {
+        row['id']: format_order(row, items=items.get(row['id'], []))
+        for row in Order.objects.filter(pk__in=order_ids).values(*SNAPSHOT_FIELDS)
+    }
+
+
+def get_order_snapshots(orders):
+    """
+    Full snapshots for many saved orders (cached ones in one get_many, the rest in two queries)
+
+    Returns:
+        list of snapshots in the order given
+    """
+    keys = {_snapshot_key(order.pk, order.updated_at): order.pk for order in orders}
+    try:
+        cached = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"Order snapshot cache read failed: {e}")
+        cached = {}
+
+    snapshots = {keys[key]: snapshot for key, snapshot in cached.items()}
+    missing = [order_id for order_id in keys.values() if order_id not in snapshots]
+    if missing:
+        fresh = build_order_snapshots(missing)
+        snapshots.update(fresh)
+        try:
+            cache.set_many(
+                {key: fresh[order_id] for key, order_id in keys.items() if order_id in fresh},
+                SNAPSHOT_CACHE_TIMEOUT
+            )
+        except Exception as e:
+            logger.warning(f"Order snapshot cache write failed: {e}")
+
+    return [snapshots[order.pk] for order in orders if order.pk in snapshots]
+
+
+def get_order_snapshot(order):
+    """
+    Full snapshot of a saved order, cached per (order id, updated_at)
+
+    Args:
+        order: saved Order instance (only pk and updated_at are used)
+    """
+    key = _snapshot_key(order.pk, order.updated_at)
+    try:
+        snapshot = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Order snapshot cache read failed: {e}")
+        snapshot = None
+    if snapshot is not None:
+        return snapshot
+
+    snapshot = build_order_snapshot(order.pk)
+    if snapshot is not None:
+        try:
+            cache.set(key, snapshot, SNAPSHOT_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Order snapshot cache write failed: {e}")
+    return snapshot
+
+
+def _group_send_on_commit(event_type, build_messages):
+    """
+    Send an event to its topic groups once the current transaction commits
+
+    build_messages() returns a list of (group, event) pairs. Every message of one
+    event carries the same event_id, so sockets subscribed to several of the
+    groups can drop the copies, and the same seq from the event log (see
+    app/utils/event_log.py), so reconnecting clients can replay what they missed.
+    """
+    def send():
+        try:
+            from channels.layers import get_channel_layer
+            from asgiref.sync import async_to_sync
+
+            channel_layer = get_channel_layer()
+            if not channel_layer:
+                return
+            messages = build_messages()
+            if not messages:
+                return
+            event_id = uuid.uuid4().hex
+            seq = event_log.append(build_record(event_type, event_id, messages))
+
+            async def send_all():
+                for group, event in messages:
+                    await channel_layer.group_send(
+                        group, {'type': event_type, 'event_id': event_id, 'seq': seq, **event}
+                    )
+
+            async_to_sync(send_all)()
+        except Exception as e:
+            # WebSocket failure shouldn't break the request
+            logger.error(f"Error sending WebSocket {event_type} event: {e}", exc_info=True)
+
+    transaction.on_commit(send)
+
+
+def send_order_event(event_type, order, **extra):
+    """
+    Publish an order event ('new_order', 'status_changed', 'payment_confirmed')
+    to the order's topic groups once the current transaction commits
+    """
+    def build_messages():
+        snapshot = get_order_snapshot(order)
+        if snapshot is None:
+            return []
+        event = {'order': snapshot, **extra}
+        return [(group, event) for group in order_event_groups(snapshot, extra.get('old_status'))]
+
+    _group_send_on_commit(event_type, build_messages)
+
+
+def send_orders_status_event(orders, new_status):
+    """
+    Publish one 'orders_status_changed' event for a bulk status change
+
+    Each topic group gets the orders it is subscribed to; orders must still carry
+    their previous status so the columns they leave are notified too.
+    """
+    old_statuses = {order.pk: order.status for order in orders}
+
+    def build_messages():
+        by_group = {}
+        for snapshot in get_order_snapshots(orders):
+            for group in order_event_groups(snapshot, old_statuses.get(snapshot['order_id'])):
+                by_group.setdefault(group, []).append(snapshot)
+        return [
+            (group, {'orders': snapshots, 'new_status': new_status})
+            for group, snapshots in by_group.items()
+        ]
+
+    _group_send_on_commit('orders_status_changed', build_messages)
+
+
+# ----- Frame encoding (shared by every consumer in the process) -----
+
+def dumps(value):
+    """JSON text for a WebSocket frame (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value)
+
+
+def diff_snapshot(previous, snapshot):
+    """Fields of snapshot that differ from previous (compact WebSocket mode)"""
+    return {field: value for field, value in snapshot.items() if previous.get(field) != value}
+
+
+_FRAME_CACHE_SIZE = 256
+_frame_cache = OrderedDict()
+_frame_lock = threading.Lock()
+
+
+def _event_version(event):
+    """Identity of an event's content: type, sequence number, order versions and transition"""
+    orders = [event['order']] if 'order' in event else event.get('orders', [])
+    return (
+        event['type'],
+        event.get('seq'),
+        tuple((order.get('order_id'), order.get('updated_at')) for order in orders),
+        event.get('old_status'),
+        event.get('new_status'),
+    )
+
+
+def encode_order_event(event):
+    """
+    JSON text frame for an order event
+
+    Every subscriber in the process receives the same event, so the frame is encoded
+    once (keyed by event type, order versions and transition) and reused. The
+    event_id only routes the event and is left out of the frame.
+    """
+    key = _event_version(event)
+    with _frame_lock:
+        frame = _frame_cache.get(key)
+        if frame is not None:
+            _frame_cache.move_to_end(key)
+            return frame
+
+    frame = dumps({key: value for key, value in event.items() if key != 'event_id'})
+
+    with _frame_lock:
+        _frame_cache[key] = frame
+        if len(_frame_cache) > _FRAME_CACHE_SIZE:
+            _frame_cache.popitem(last=False)
+    return frame
@@ -0,0 +1,37 @@
+"""
+Live order tracking for customers
+
+track_order_api checks order number + phone once and hands out a signed
+tracking token. The tracking page opens /ws/track/?token=<token>; the socket
+(OrderTrackingConsumer) joins the order's topic group and forwards the existing
+order events, so a waiting customer costs one connection instead of repeated
+lookups.
+"""
+from django.core import signing
+
+TRACKING_TOKEN_SALT = 'app.order_tracking'
+TRACKING_TOKEN_MAX_AGE = 2 * 24 * 60 * 60  # seconds
+
+# Order fields pushed to the tracking page
+TRACKING_FIELDS = (
+    'order_number', 'status', 'status_display', 'payment_received', 'payment_received_at',
+    'customer_received', 'customer_received_at', 'updated_at',
+)
+
+
+def make_tracking_token(order_number):
+    """Signed token allowing live tracking of one order"""
+    return signing.dumps({'order': order_number}, salt=TRACKING_TOKEN_SALT, compress=True)
+
+
+def read_tracking_token(token):
+    """Order number from a tracking token, or None if it is invalid or expired"""
+    try:
+        return signing.loads(token, salt=TRACKING_TOKEN_SALT, max_age=TRACKING_TOKEN_MAX_AGE)['order']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def tracking_update(snapshot):
+    """Customer-facing subset of an order snapshot"""
+    return {field: snapshot.get(field) for field in TRACKING_FIELDS}
@@ -0,0 +1,334 @@
+"""
+Sales rollups for MADAM DA E-Commerce
+
+DailySales holds order counts and amounts per day (in TIME_ZONE), status,
+payment method and promo code; DailyProductSales holds item quantities and
+revenue per day, order status and product. The admin sales and commission
+reports read these tables, so their cost depends on the number of days
+reported, not on the number of orders.
+
+Order and item changes adjust the rows incrementally, inside the same
+transaction: the old values are subtracted from the old key and the new ones
+added to the new key, one UPDATE ... SET x = x + delta per key (see
+RollupChanges and app/signals.py). Saves that don't touch a rollup field cost
+nothing. Code that changes orders with queryset.update() records the change
+itself (record_orders_status_change).
+
+Whole days are rebuilt from their orders (rebuild_sales_rollups) by
+python manage.py rebuild_rollups, for backfill and repairs, and as a fallback
+after commit when a change can't be applied as a delta.
+
+PromoCode deletion would set the code of its rollup rows to NULL and collide
+with the rows of orders without a code, so those rows are dropped and their
+days rebuilt instead (see clear_promo_code_rollups).
+"""
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import DailyProductSales, DailySales, Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+# Days waiting for a rebuild, per thread (every request thread has its own connection)
+_pending = threading.local()
+
+# Fields that place an order in DailySales (attnames)
+ORDER_STATE_FIELDS = (
+    'created_at', 'status', 'payment_method', 'promo_code_id',
+    'subtotal', 'discount_amount', 'shipping_fee', 'total',
+)
+ITEM_STATE_FIELDS = ('order_id', 'product_name', 'quantity', 'subtotal')
+
+# State of an instance loaded without some of those fields (.only()/.defer())
+UNKNOWN_STATE = object()
+
+
+def day_bounds(start, end):
+    """Aware datetimes covering start..end (dates, inclusive) in the current time zone"""
+    return (
+        timezone.make_aware(datetime.combine(start, datetime.min.time())),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), datetime.min.time())),
+    )
+
+
+def order_day(created_at):
+    """Rollup date of an order"""
+    return timezone.localtime(created_at).date()
+
+
+def rebuild_sales_rollups(start, end, lock=False):
+    """
+    Replace the rollup rows of start..end (dates, inclusive) - four queries plus inserts
+
+    Args:
+        lock: lock the orders of the range first, so concurrent rebuilds of the
+              same days run one after the other (the unique constraints on the
+              rollup keys reject anything that still collides)
+    """
+    range_start, range_end = day_bounds(start, end)
+    orders = Order.objects.filter(created_at__gte=range_start, created_at__lt=range_end)
+
+    with transaction.atomic():
+        if lock:
+            list(orders.select_for_update().values_list('id', flat=True))
+        DailySales.objects.filter(date__gte=start, date__lte=end).delete()
+        DailyProductSales.objects.filter(date__gte=start, date__lte=end).delete()
+
+        DailySales.objects.bulk_create([
+            DailySales(
+                date=row['day'], status=row['status'], payment_method=row['payment_method'],
+                promo_code_id=row['promo_code'], orders=row['orders'], subtotal=row['subtotal'],
+                discount_amount=row['discount_amount'], shipping_fee=row['shipping_fee'], total=row['total'],
+            )
+            for row in orders.annotate(day=TruncDate('created_at')).values(
+                'day', 'status', 'payment_method', 'promo_code'
+            ).annotate(
+                orders=Count('id'),
+                subtotal=Sum('subtotal'),
+                discount_amount=Sum('discount_amount'),
+                shipping_fee=Sum('shipping_fee'),
+                total=Sum('total'),
+            ).order_by()
+        ], batch_size=500)
+
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(
+                date=row['day'], status=row['order__status'], product_name=row['product_name'],
+                quantity=row['quantity'], revenue=row['revenue'],
+            )
+            for row in OrderItem.objects.filter(
+                order__created_at__gte=range_start, order__created_at__lt=range_end
+            ).annotate(day=TruncDate('order__created_at')).values(
+                'day', 'order__status', 'product_name'
+            ).annotate(
+                quantity=Sum('quantity'),
+                revenue=Sum('subtotal'),
+            ).order_by()
+        ], batch_size=500)
+
+
+def _refresh_pending():
+    days = getattr(_pending, 'days', None)
+    if not days:
+        return
+    _pending.days = set()
+    for day in sorted(days):
+        try:
+            rebuild_sales_rollups(day, day, lock=True)
+        except Exception as e:
+            # Stale until the day changes again or rebuild_rollups runs
+            logger.error(f"Sales rollup refresh for {day} failed: {e}", exc_info=True)
+
+
+def schedule_rollup_refresh(*days):
+    """
+    Rebuild the rollups of these days once the current transaction commits
+
+    Every change registers a callback, but the first one to run after a commit
+    rebuilds all pending days and the rest find nothing left. Days scheduled in
+    a transaction that rolled back are rebuilt after the next commit.
+    """
+    if not hasattr(_pending, 'days'):
+        _pending.days = set()
+    _pending.days.update(days)
+    transaction.on_commit(_refresh_pending)
+
+
+def clear_promo_code_rollups(promo_code):
+    """Before a promo code is deleted: drop its rows and rebuild their days once its orders lost the code"""
+    rows = DailySales.objects.filter(promo_code=promo_code)
+    days = set(rows.values_list('date', flat=True))
+    rows.delete()
+    if days:
+        schedule_rollup_refresh(*days)
+
+
+def _state(instance, fields):
+    if instance.pk is None:
+        return None
+    if any(field not in instance.__dict__ for field in fields):
+        return UNKNOWN_STATE
+    return tuple(instance.__dict__[field] for field in fields)
+
+
+def order_state(order):
+    """Rollup values of a saved order (None if unsaved, UNKNOWN_STATE if deferred)"""
+    return _state(order, ORDER_STATE_FIELDS)
+
+
+def item_state(item):
+    """Rollup values of a saved order item (None if unsaved, UNKNOWN_STATE if deferred)"""
+    return _state(item, ITEM_STATE_FIELDS)
+
+
+class RollupChanges:
+    """Deltas for rollup rows, collected per key and applied with one UPDATE (or INSERT) per key"""
+
+    def __init__(self):
+        self.sales = defaultdict(lambda: defaultdict(int))
+        self.products = defaultdict(lambda: defaultdict(int))
+
+    def add_order(self, state, sign):
+        created_at, status, payment_method, promo_code_id, subtotal, discount_amount, shipping_fee, total = state
+        row = self.sales[(order_day(created_at), status, payment_method, promo_code_id)]
+        row['orders'] += sign
+        row['subtotal'] += sign * subtotal
+        row['discount_amount'] += sign * discount_amount
+        row['shipping_fee'] += sign * shipping_fee
+        row['total'] += sign * total
+
+    def add_items(self, day, status, product_name, quantity, revenue, sign):
+        row = self.products[(day, status, product_name)]
+        row['quantity'] += sign * quantity
+        row['revenue'] += sign * revenue
+
+    @property
+    def days(self):
+        return {key[0] for key in self.sales} | {key[0] for key in self.products}
+
+    def apply(self):
+        """Apply the deltas; on failure the affected days are rebuilt after commit instead"""
+        try:
+            # Savepoint - a rollup problem must never fail the order change itself
+            with transaction.atomic():
+                for (day, status, payment_method, promo_code_id), values in self.sales.items():
+                    _add_to_row(DailySales, {
+                        'date': day, 'status': status, 'payment_method': payment_method,
+                        'promo_code_id': promo_code_id,
+                    }, values, 'orders')
+                for (day, status, product_name), values in self.products.items():
+                    _add_to_row(DailyProductSales, {
+                        'date': day, 'status': status, 'product_name': product_name,
+                    }, values, 'quantity')
+        except Exception as e:
+            logger.error(f"Sales rollup update failed, rebuilding instead: {e}", exc_info=True)
+            schedule_rollup_refresh(*self.days)
+
+
+def _add_to_row(model, key, values, count_field):
+    values = {field: value for field, value in values.items() if value}
+    if not values:
+        return
+    rows = model.objects.filter(**key)
+    changes = {field: F(field) + value for field, value in values.items()}
+    if rows.update(**changes):
+        return
+    if values.get(count_field, 0) < 0:
+        # Nothing to subtract from - the day predates the rollups (rebuild_rollups fills it)
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **values)
+    except IntegrityError:
+        # Another transaction created the row meanwhile
+        rows.update(**changes)
+
+
+def _order_keys(order_ids, item=None):
+    """order id -> (day, status), from the item's cached order when possible"""
+    keys = {}
+    if item is not None and OrderItem.order.is_cached(item):
+        order = item.order
+        if order.pk in order_ids and 'status' in order.__dict__ and order.created_at:
+            keys[order.pk] = (order_day(order.created_at), order.status)
+    missing = [order_id for order_id in order_ids if order_id not in keys]
+    if missing:
+        for order_id, created_at, status in Order.objects.filter(pk__in=missing).values_list('id', 'created_at', 'status'):
+            keys[order_id] = (order_day(created_at), status)
+    return keys
+
+
+def _move_items(changes, moves):
+    """Move the items of orders to their new status: moves maps order id -> (day, old status, new status)"""
+    rows = OrderItem.objects.filter(order_id__in=list(moves)).values('order_id', 'product_name').annotate(
+        quantity=Sum('quantity'),
+        revenue=Sum('subtotal'),
+    ).order_by()
+    for row in rows:
+        day, old_status, new_status = moves[row['order_id']]
+        changes.add_items(day, old_status, row['product_name'], row['quantity'], row['revenue'], -1)
+        changes.add_items(day, new_status, row['product_name'], row['quantity'], row['revenue'], 1)
+
+
+def record_order_change(order, old_state, deleted=False):
+    """
+    Adjust the rollups for a saved or deleted order
+
+    Args:
+        old_state: order_state() as loaded (None for a new order)
+    """
+    if deleted:
+        # The items' own post_delete signals take care of the product rows
+        old_state, new_state = order_state(order), None
+    else:
+        new_state = order_state(order)
+    if old_state is UNKNOWN_STATE or new_state is UNKNOWN_STATE:
+        schedule_rollup_refresh(order_day(order.created_at))
+        return
+    if old_state == new_state:
+        return
+
+    changes = RollupChanges()
+    if old_state:
+        changes.add_order(old_state, -1)
+    if new_state:
+        changes.add_order(new_state, 1)
+        if old_state and old_state[1] != new_state[1]:
+            _move_items(changes, {order.pk: (order_day(order.created_at), old_state[1], new_state[1])})
+    changes.apply()
+
+
+def record_orders_status_change(orders, new_status):
+    """Adjust the rollups for orders moved to new_status with queryset.update() (states as loaded)"""
+    changes = RollupChanges()
+    moves = {}
+    for order in orders:
+        state = order_state(order)
+        if state is UNKNOWN_STATE or state is None:
+            schedule_rollup_refresh(order_day(order.created_at))
+            continue
+        if state[1] == new_status:
+            continue
+        changes.add_order(state, -1)
+        changes.add_order((state[0], new_status) + state[2:], 1)
+        moves[order.pk] = (order_day(state[0]), state[1], new_status)
+    if moves:
+        _move_items(changes, moves)
+    changes.apply()
+
+
+def record_item_change(item, old_state, deleted=False):
+    """
+    Adjust the product rollups for a saved or deleted order item
+
+    Args:
+        old_state: item_state() as loaded (None for a new item)
+    """
+    if deleted:
+        old_state, new_state = item_state(item), None
+    else:
+        new_state = item_state(item)
+    if old_state is UNKNOWN_STATE or new_state is UNKNOWN_STATE:
+        keys = _order_keys({item.order_id}, item)
+        if item.order_id in keys:
+            schedule_rollup_refresh(keys[item.order_id][0])
+        return
+    if old_state == new_state:
+        return
+
+    keys = _order_keys({state[0] for state in (old_state, new_state) if state}, item)
+    changes = RollupChanges()
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        # An item whose order is gone was deleted with it - its rows went with the order's day
+        if state and state[0] in keys:
+            day, status = keys[state[0]]
+            order_id, product_name, quantity, subtotal = state
+            changes.add_items(day, status, product_name, quantity, subtotal, sign)
+    changes.apply()
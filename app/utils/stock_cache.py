@@ -0,0 +1,70 @@
+"""
+Short-lived per-product stock cache for MADAM DA E-Commerce
+
+Used by the cart revalidation endpoint so checkout can reject stale carts
+(price changes, out-of-stock or deactivated products) before a KHQR is generated.
+"""
+import logging
+from django.core.cache import cache
+
+from ..models import Product
+
+logger = logging.getLogger(__name__)
+
+# Stock changes often during sales, so keep entries short-lived
+STOCK_CACHE_TIMEOUT = 30  # seconds
+STOCK_CACHE_PREFIX = 'product_stock_'
+
+
+def _stock_cache_key(product_id):
+    return f'{STOCK_CACHE_PREFIX}{product_id}'
+
+
+def get_product_stock(product_ids):
+    """
+    Get current price, stock and active flag for a list of product IDs
+
+    Cached products are read with a single get_many; any misses are loaded
+    with one id__in query and written back with set_many.
+
+    Returns:
+        dict mapping product_id -> {'id', 'name', 'price', 'stock', 'is_active'}
+        (products that don't exist are missing from the dict)
+    """
+    product_ids = [str(pid) for pid in dict.fromkeys(product_ids) if pid]
+    if not product_ids:
+        return {}
+
+    keys = {_stock_cache_key(pid): pid for pid in product_ids}
+    try:
+        cached = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"Stock cache read failed: {e}")
+        cached = {}
+
+    products = {keys[key]: value for key, value in cached.items()}
+    missing = [pid for pid in product_ids if pid not in products]
+
+    if missing:
+        fresh = {}
+        for row in Product.objects.filter(id__in=missing).values('id', 'name', 'price', 'stock', 'is_active'):
+            products[row['id']] = row
+            fresh[_stock_cache_key(row['id'])] = row
+        if fresh:
+            try:
+                cache.set_many(fresh, STOCK_CACHE_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Stock cache write failed: {e}")
+
+    return products
+
+
+def invalidate_product_stock(product_ids):
+    """Drop cached stock entries (call after stock, price or active flag changes)"""
+    keys = [_stock_cache_key(pid) for pid in product_ids if pid]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f"Stock cache invalidation failed: {e}")
@@ -0,0 +1,130 @@
+"""
+Cluster-wide WebSocket connection accounting for MADAM DA E-Commerce
+
+Every accepted OrderConsumer connection holds a lease in a Redis sorted set
+(member = channel name, score = lease expiry). Consumers renew their lease while
+connected and release it on disconnect; leases of crashed Daphne workers simply
+expire, so the count heals itself without a cleanup job.
+
+Admission (purge expired leases, check the limit, add the lease) runs as one Lua
+script, so concurrent connects on different workers can't overshoot the limit.
+
+Without WEBSOCKET_REDIS_URL (development), or while Redis is unreachable, the
+limit is enforced per process like before.
+"""
+import logging
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONNECTIONS_KEY = 'madamda:ws_connections'
+# Customer tracking sockets are counted (and limited) separately from dashboards
+TRACKING_CONNECTIONS_KEY = 'madamda:ws_tracking_connections'
+
+# Leases are renewed every LEASE_RENEW_INTERVAL; a worker that stops renewing loses them after LEASE_TTL
+LEASE_TTL = 60  # seconds
+LEASE_RENEW_INTERVAL = 20  # seconds
+
+# KEYS[1] = sorted set, ARGV = now, lease expiry, limit, member
+ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[4]) == false and redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+return 1
+"""
+
+
+def _redis_url():
+    return getattr(settings, 'WEBSOCKET_REDIS_URL', '')
+
+
+class ConnectionTracker:
+    """Lease-based connection counter shared by every Daphne worker"""
+
+    def __init__(self, key=CONNECTIONS_KEY):
+        self.key = key
+        self._async_client = None
+        self._sync_client = None  # for count(), called from sync views
+        self._acquire_script = None
+        self._local = set()  # fallback: channel names accepted by this process
+
+    def _get_async_client(self):
+        url = _redis_url()
+        if not url:
+            return None
+        if self._async_client is None:
+            import redis.asyncio as aioredis
+            self._async_client = aioredis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+            self._acquire_script = self._async_client.register_script(ACQUIRE_SCRIPT)
+        return self._async_client
+
+    def _get_sync_client(self):
+        url = _redis_url()
+        if not url:
+            return None
+        if self._sync_client is None:
+            import redis
+            # Connections are pooled and reused across calls (the pool reconnects after fork)
+            self._sync_client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        return self._sync_client
+
+    async def acquire(self, channel_name, limit):
+        """Take a lease for a new connection; False if the cluster-wide limit is reached"""
+        client = self._get_async_client()
+        if client is not None:
+            try:
+                now = time.time()
+                accepted = await self._acquire_script(
+                    keys=[self.key], args=[now, now + LEASE_TTL, limit, channel_name]
+                )
+                return bool(accepted)
+            except Exception as e:
+                logger.warning(f"WebSocket lease acquire failed, using per-process limit: {e}")
+
+        if len(self._local) >= limit:
+            return False
+        self._local.add(channel_name)
+        return True
+
+    async def renew(self, channel_name):
+        """Extend the lease of a live connection"""
+        client = self._get_async_client()
+        if client is None:
+            return
+        try:
+            await client.zadd(self.key, {channel_name: time.time() + LEASE_TTL})
+        except Exception as e:
+            logger.warning(f"WebSocket lease renew failed: {e}")
+
+    async def release(self, channel_name):
+        """Give the lease back when a connection closes"""
+        self._local.discard(channel_name)
+        client = self._get_async_client()
+        if client is None:
+            return
+        try:
+            await client.zrem(self.key, channel_name)
+        except Exception as e:
+            logger.warning(f"WebSocket lease release failed: {e}")
+
+    def count(self):
+        """
+        Live connections across all workers (for health checks / metrics)
+
+        Returns:
+            (count, scope) - scope is 'cluster' when read from Redis, 'process' otherwise
+        """
+        try:
+            client = self._get_sync_client()
+            if client is not None:
+                return client.zcount(self.key, time.time(), '+inf'), 'cluster'
+        except Exception as e:
+            logger.warning(f"WebSocket connection count failed: {e}")
+        return len(self._local), 'process'
+
+
+connection_tracker = ConnectionTracker()
+tracking_connection_tracker = ConnectionTracker(TRACKING_CONNECTIONS_KEY)
@@ -0,0 +1,68 @@
+"""
+WebSocket subscription topics for order events
+
+Clients subscribe to the topics they care about and only receive matching events:
+- all                     every order event (default, used by the employee dashboard)
+- status:<column>         orders entering or leaving a dashboard column
+                          (to_prepare, preparing, ready, out, delivered)
+- order:<order_number>    one order
+- payment:<method>        orders paid with a method (cod, khqr, acleda-bank, wing-money)
+
+Each topic maps to a channel layer group, so fan-out only reaches interested sockets.
+A socket subscribed to overlapping topics gets each event once (see OrderConsumer).
+"""
+import re
+from django.utils.text import slugify
+
+from .dashboard_stats import DASHBOARD_COLUMNS
+
+ALL_TOPIC = 'all'
+# Group for 'all' (kept as the original broadcast group name)
+ALL_GROUP = 'orders_updates'
+TOPIC_GROUP_PREFIX = 'orders.'
+
+STATUS_TOPICS = set(DASHBOARD_COLUMNS.values())
+PAYMENT_ALIASES = {'cash-on-delivery': 'cod'}
+
+# Channel layer group names: ASCII letters, digits, hyphens, underscores and periods, < 100 chars
+_TOPIC_VALUE_RE = re.compile(r'^[A-Za-z0-9_-]{1,50}$')
+
+
+def payment_topic_value(payment_method):
+    slug = slugify(payment_method or '')
+    return PAYMENT_ALIASES.get(slug, slug)
+
+
+def topic_group(topic):
+    """
+    Channel layer group for a topic, or None if the topic is invalid
+    """
+    if topic == ALL_TOPIC:
+        return ALL_GROUP
+    kind, _, value = topic.partition(':')
+    if not _TOPIC_VALUE_RE.match(value):
+        return None
+    if kind == 'status' and value in STATUS_TOPICS:
+        return f'{TOPIC_GROUP_PREFIX}status.{value}'
+    if kind == 'order':
+        return f'{TOPIC_GROUP_PREFIX}order.{value.upper()}'
+    if kind == 'payment':
+        return f'{TOPIC_GROUP_PREFIX}payment.{value.lower()}'
+    return None
+
+
+def order_event_groups(order, old_status=None):
+    """
+    Groups that should receive an event about an order snapshot
+
+    Status changes go to the old and the new column, so both can update.
+    """
+    topics = {ALL_TOPIC, f"order:{order['order_number']}"}
+    payment = payment_topic_value(order.get('payment_method'))
+    if payment:
+        topics.add(f'payment:{payment}')
+    for status in (order.get('status'), old_status):
+        column = DASHBOARD_COLUMNS.get(status)
+        if column:
+            topics.add(f'status:{column}')
+    return {group for group in map(topic_group, topics) if group}
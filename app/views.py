@@ -1,7 +1,8 @@
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt, csrf_protect, ensure_csrf_cookie
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+from django.views.decorators.cache import cache_control
 from django.utils.translation import get_language, activate
 from django.utils import timezone
 from django.db.models import Q
@@ -33,6 +34,12 @@ from .exceptions import (
     InvalidPromoCodeError
 )
 from .utils.error_handler import handle_api_error
+from .utils.stock_cache import get_product_stock, invalidate_product_stock
+from .utils.conditional import shop_etag, template_etag, template_last_modified
+from .utils.cache_bus import get_or_set as cache_get_or_set
+from .utils.order_snapshot import send_order_event
+from .utils.order_tracking import make_tracking_token
+from .utils.ws_connections import connection_tracker
 
 logger = logging.getLogger(__name__)
 
@@ -46,68 +53,18 @@ def apply_rate_limit(rate, method='GET'):
 
 # Telegram notification function
 def send_telegram_notification(order):
-    """Send order notification to Telegram with interactive buttons"""
+    """Queue order notification to Telegram with interactive buttons (sent by the telegram_worker command)"""
     try:
         from .telegram_bot import send_new_order_notification
         
-        # Use the new interactive notification system
-        send_new_order_notification(order)
+        # Savepoint: a failed insert must not break the caller's transaction
+        with transaction.atomic():
+            send_new_order_notification(order)
         
-        logger.info(f"Sent interactive Telegram notification for order {order.order_number}")
+        logger.info(f"Queued Telegram notification for order {order.order_number}")
         return True
     except Exception as e:
-        logger.error(f"Error sending Telegram notification: {str(e)}", exc_info=True)
-        
-        # Fallback to simple notification
-        try:
-            bot_token = settings.TELEGRAM_BOT_TOKEN
-            chat_id = settings.TELEGRAM_CHAT_ID
-            
-            if not bot_token or not chat_id:
-                return False
-            
-            message = f"""🛒 NEW ORDER RECEIVED!
-
-📦 Order: {order.order_number}
-👤 Customer: {order.customer_name}
-📱 Phone: {order.customer_phone}
-💵 Total: ${order.total}
-💳 Payment: {order.payment_method}
-"""
-            
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-            response = requests.post(url, json={
-                'chat_id': chat_id,
-                'text': message,
-                'parse_mode': 'HTML'
-            }, timeout=10)
-            
-            response.raise_for_status()  # Raise exception for bad status codes
-            
-            result = response.json()
-            if result.get('ok'):
-                logger.info(f"✅ Telegram notification sent successfully for order {order.order_number}")
-                return True
-            else:
-                error_desc = result.get('description', 'Unknown error')
-                logger.error(f"❌ Telegram API returned error: {error_desc}")
-                return False
-                
-        except requests.exceptions.Timeout:
-            logger.error(f"❌ Telegram API timeout for order {order.order_number}")
-            return False
-        except requests.exceptions.ConnectionError:
-            logger.error(f"❌ Telegram API connection error for order {order.order_number}")
-            return False
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"❌ Telegram API HTTP error {e.response.status_code} for order {order.order_number}: {e}")
-            return False
-        except Exception as fallback_error:
-            logger.error(f"❌ Fallback Telegram notification failed: {str(fallback_error)}", exc_info=True)
-            return False
-            
-    except Exception as e:
-        logger.error(f"❌ Error sending Telegram notification: {str(e)}", exc_info=True)
+        logger.error(f"❌ Error queueing Telegram notification: {str(e)}", exc_info=True)
         return False
 
 
@@ -166,17 +123,24 @@ def health_check(request):
     
     status_code = 200 if overall_status == "ok" else (503 if overall_status == "error" else 200)
     
+    # Live WebSocket connections (cluster-wide when tracked in Redis)
+    websocket_connections, websocket_scope = connection_tracker.count()
+    
     return JsonResponse({
         'status': overall_status,
         'database': db_status,
         'cache': cache_status,
         'cache_type': cache_type,
+        'websocket_connections': websocket_connections,
+        'websocket_connections_scope': websocket_scope,
         'debug_mode': settings.DEBUG,
         'timestamp': timezone.now().isoformat(),
     }, status=status_code)
 
 
 @ensure_csrf_cookie
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=shop_etag)
 def shop_view(request):
     """Shop/homepage view - Optimized with pagination and caching for 1000+ customers"""
     # Get products with pagination - 20 products per page for better performance
@@ -193,15 +157,15 @@ def shop_view(request):
     except EmptyPage:
         products = paginator.page(paginator.num_pages)
     
-    # Cache hero slides for 10 minutes (change less frequently)
+    # Hero slides go through the cache bus (per-process L1 + shared L2), invalidated by
+    # HeroSlide signals, so admin edits show up immediately on every worker
     # Note: Products are not cached because pagination requires fresh queries
     # The database query is already optimized with indexes
-    cache_key_slides = 'active_hero_slides'
-    hero_slides = cache.get(cache_key_slides)
-    
-    if not hero_slides:
-        hero_slides = list(HeroSlide.objects.filter(is_active=True).order_by('order'))
-        cache.set(cache_key_slides, hero_slides, 600)  # 10 minutes
+    hero_slides = cache_get_or_set(
+        'hero_slides', 'active',
+        lambda: list(HeroSlide.objects.filter(is_active=True).order_by('order')),
+        600,  # 10 minutes
+    )
     
     context = {
         'products': products,
@@ -430,21 +394,33 @@ def order_success_view(request):
     return render(request, 'app/shop/order_success.html', context)
 
 
+# Static content pages only change on deploy - let browsers reuse them and revalidate with ETags
+STATIC_PAGE_MAX_AGE = 3600  # 1 hour
+
+
+@cache_control(public=True, max_age=STATIC_PAGE_MAX_AGE)
+@condition(etag_func=template_etag('app/pages/about_us.html'), last_modified_func=template_last_modified('app/pages/about_us.html'))
 def about_us_view(request):
     """About us page view"""
     return render(request, 'app/pages/about_us.html')
 
 
+@cache_control(public=True, max_age=STATIC_PAGE_MAX_AGE)
+@condition(etag_func=template_etag('app/pages/contact.html'), last_modified_func=template_last_modified('app/pages/contact.html'))
 def contact_view(request):
     """Contact page view"""
     return render(request, 'app/pages/contact.html')
 
 
+@cache_control(public=True, max_age=STATIC_PAGE_MAX_AGE)
+@condition(etag_func=template_etag('app/pages/shipping_policy.html'), last_modified_func=template_last_modified('app/pages/shipping_policy.html'))
 def shipping_policy_view(request):
     """Shipping policy page view"""
     return render(request, 'app/pages/shipping_policy.html')
 
 
+@cache_control(public=True, max_age=STATIC_PAGE_MAX_AGE)
+@condition(etag_func=template_etag('app/pages/privacy_policy.html'), last_modified_func=template_last_modified('app/pages/privacy_policy.html'))
 def privacy_policy_view(request):
     """Privacy policy page view"""
     return render(request, 'app/pages/privacy_policy.html')
@@ -517,7 +493,12 @@ def validate_promo_code(request):
             }, status=400)
         
         try:
-            promo = PromoCode.objects.get(code=code, is_active=True)
+            promo = cache_get_or_set(
+                'promo_codes', code,
+                lambda: PromoCode.objects.filter(code=code, is_active=True).first(),
+            )
+            if promo is None:
+                raise PromoCode.DoesNotExist
             
             # Check if promo code is valid
             now = timezone.now()
@@ -896,6 +877,98 @@ def check_payment(request):
         return handle_api_error(e, context=context)
 
 
+@apply_rate_limit('30/m', 'POST')
+@require_http_methods(["POST"])
+@csrf_exempt
+def validate_cart(request):
+    """Revalidate the whole cart (price, stock, active flag) before payment is generated"""
+    try:
+        data = json.loads(request.body)
+        items = data.get('items', [])
+
+        if not isinstance(items, list) or not items:
+            return JsonResponse({
+                'success': False,
+                'message': 'No items in cart'
+            }, status=400)
+
+        # One cached lookup for every line in the cart (single id__in query on cache miss)
+        products = get_product_stock([item.get('id') for item in items if isinstance(item, dict)])
+
+        lines = []
+        is_valid = True
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            product_id = str(item.get('id', ''))
+            try:
+                quantity = int(item.get('qty', 1))
+            except (ValueError, TypeError):
+                quantity = 1
+            try:
+                cart_price = Decimal(str(item.get('price', 0)))
+            except Exception:
+                cart_price = None
+
+            product = products.get(product_id)
+            if not product:
+                lines.append({
+                    'id': product_id,
+                    'name': item.get('name', 'Unknown Product'),
+                    'requested': quantity,
+                    'available': 0,
+                    'is_active': False,
+                    'valid': False,
+                    'reason': 'not_found'
+                })
+                is_valid = False
+                continue
+
+            reason = None
+            if not product['is_active']:
+                reason = 'inactive'
+            elif quantity < 1:
+                reason = 'invalid_quantity'
+            elif product['stock'] < quantity:
+                reason = 'out_of_stock' if product['stock'] <= 0 else 'insufficient_stock'
+            elif cart_price is None or cart_price != product['price']:
+                reason = 'price_changed'
+
+            if reason:
+                is_valid = False
+
+            lines.append({
+                'id': product_id,
+                'name': product['name'],
+                'price': str(product['price']),
+                'cart_price': str(cart_price) if cart_price is not None else None,
+                'stock': product['stock'],
+                'requested': quantity,
+                'available': product['stock'] if product['is_active'] else 0,
+                'is_active': product['is_active'],
+                'valid': reason is None,
+                'reason': reason
+            })
+
+        return JsonResponse({
+            'success': True,
+            'valid': is_valid,
+            'items': lines
+        })
+
+    except json.JSONDecodeError:
+        error = ValidationError('Invalid JSON data')
+        context = {'endpoint': 'validate_cart'}
+        return handle_api_error(error, context=context)
+    except DatabaseError as e:
+        logger.error(f"Database error in validate_cart: {e}", exc_info=True)
+        context = {'endpoint': 'validate_cart'}
+        return handle_api_error(e, context=context)
+    except Exception as e:
+        context = {'endpoint': 'validate_cart'}
+        return handle_api_error(e, context=context)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 @transaction.atomic
@@ -1059,55 +1132,6 @@ def create_order_on_payment(request):
             error = OrderCreationError('Failed to create order')
             return handle_api_error(error, context=context)
         
-        # Send WebSocket message for new order
-        try:
-            from channels.layers import get_channel_layer
-            from asgiref.sync import async_to_sync
-            
-            channel_layer = get_channel_layer()
-            if channel_layer:
-                # Get order items
-                items_data = []
-                for item_data in items:
-                    product_name = item_data.get('name', 'Unknown Product')
-                    quantity = item_data.get('qty', 1)
-                    price = Decimal(str(item_data.get('price', 0)))
-                    subtotal = price * quantity
-                    
-                    items_data.append({
-                        'product_name': product_name,
-                        'quantity': quantity,
-                        'price': str(price),
-                        'subtotal': str(subtotal)
-                    })
-                
-                order.refresh_from_db()  # Refresh to get notes field
-                order_data = {
-                    'order_id': order.id,
-                    'order_number': order.order_number,
-                    'status': order.status,
-                    'status_display': order.get_status_display(),
-                    'customer_name': order.customer_name,
-                    'customer_phone': order.customer_phone,
-                    'customer_address': order.customer_address,
-                    'customer_province': order.customer_province,
-                    'total_amount': str(order.total),
-                    'payment_method': order.payment_method,
-                    'created_at': order.created_at.isoformat(),
-                    'items': items_data,
-                    'notes': order.notes or ''  # Include delivery notes for real-time updates
-                }
-                
-                async_to_sync(channel_layer.group_send)(
-                    'orders_updates',
-                    {
-                        'type': 'new_order',
-                        'order': order_data
-                    }
-                )
-        except Exception as e:
-            logger.error(f"Error sending WebSocket message for new order: {str(e)}", exc_info=True)
-        
         # Check if order is suspicious
         order.check_suspicious()
         order.save()
@@ -1128,7 +1152,8 @@ def create_order_on_payment(request):
                         # Decrement stock
                         if product.stock >= quantity:
                             product.stock -= quantity
-                            product.save(update_fields=['stock'])
+                            # Include updated_at so catalog versions (ETags) see the stock change
+                            product.save(update_fields=['stock', 'updated_at'])
                         else:
                             # Stock changed between validation and order creation
                             raise InsufficientStockError(f'{product.name} is now out of stock')
@@ -1153,55 +1178,13 @@ def create_order_on_payment(request):
                 return handle_api_error(e, context=context)
             error = OrderCreationError('Failed to create order items')
             return handle_api_error(error, context=context)
-        
-        # Send WebSocket message for new order
-        try:
-            from channels.layers import get_channel_layer
-            from asgiref.sync import async_to_sync
-            
-            channel_layer = get_channel_layer()
-            if channel_layer:
-                # Get order items
-                items_data = []
-                for item in items:
-                    product_name = item.get('name', 'Unknown Product')
-                    quantity = int(item.get('qty', 1))
-                    price = Decimal(str(item.get('price', 0)))
-                    subtotal = price * quantity
-                    
-                    items_data.append({
-                        'product_name': product_name,
-                        'quantity': quantity,
-                        'price': str(price),
-                        'subtotal': str(subtotal)
-                    })
-                
-                order.refresh_from_db()  # Refresh to get notes field
-                order_data = {
-                    'order_id': order.id,
-                    'order_number': order.order_number,
-                    'status': order.status,
-                    'status_display': order.get_status_display(),
-                    'customer_name': order.customer_name,
-                    'customer_phone': order.customer_phone,
-                    'customer_address': order.customer_address,
-                    'customer_province': order.customer_province,
-                    'total_amount': str(order.total),
-                    'payment_method': order.payment_method,
-                    'created_at': order.created_at.isoformat(),
-                    'items': items_data,
-                    'notes': order.notes or ''  # Include delivery notes for real-time updates
-                }
-                
-                async_to_sync(channel_layer.group_send)(
-                    'orders_updates',
-                    {
-                        'type': 'new_order',
-                        'order': order_data
-                    }
-                )
-        except Exception as e:
-            logger.error(f"Error sending WebSocket message for new order: {str(e)}", exc_info=True)
+
+        # Stock changed - drop cached stock so cart validation sees it after commit
+        purchased_ids = [item.get('id') for item in items if item.get('id')]
+        transaction.on_commit(lambda: invalidate_product_stock(purchased_ids))
+
+        # Send WebSocket message for new order (once, with its items, after commit)
+        send_order_event('new_order', order)
         
         # Send Telegram notification immediately when payment is confirmed (if enabled)
         order.refresh_from_db()
@@ -1269,50 +1252,7 @@ def cod_confirmation_view(request, order_number=None):
                         order.save()
                         
                         # Send WebSocket message
-                        try:
-                            from channels.layers import get_channel_layer
-                            from asgiref.sync import async_to_sync
-                            
-                            channel_layer = get_channel_layer()
-                            if channel_layer:
-                                items = order.items.all()
-                                items_data = [{
-                                    'product_name': item.product_name,
-                                    'quantity': item.quantity,
-                                    'price': str(item.product_price),
-                                    'subtotal': str(item.subtotal)
-                                } for item in items]
-                                
-                                order.refresh_from_db()  # Refresh to get notes field
-                                order_data = {
-                                    'order_id': order.id,
-                                    'order_number': order.order_number,
-                                    'status': order.status,
-                                    'status_display': order.get_status_display(),
-                                    'customer_name': order.customer_name,
-                                    'customer_phone': order.customer_phone,
-                                    'customer_address': order.customer_address,
-                                    'customer_province': order.customer_province,
-                                    'total_amount': str(order.total),
-                                    'payment_method': order.payment_method,
-                                    'created_at': order.created_at.isoformat(),
-                                    'items': items_data,
-                                    'notes': order.notes or '',  # Include delivery notes for real-time updates
-                                    'payment_received': order.payment_received,
-                                    'payment_received_at': order.payment_received_at.isoformat() if order.payment_received_at else None,
-                                    'customer_received': order.customer_received,
-                                    'customer_received_at': order.customer_received_at.isoformat() if order.customer_received_at else None,
-                                }
-                                
-                                async_to_sync(channel_layer.group_send)(
-                                    'orders_updates',
-                                    {
-                                        'type': 'payment_confirmed',
-                                        'order': order_data
-                                    }
-                                )
-                        except Exception:
-                            pass
+                        send_order_event('payment_confirmed', order)
                         
                         # Refresh order from database
                         order.refresh_from_db()
@@ -1369,52 +1309,7 @@ def cod_confirmation_view(request, order_number=None):
             order.save()
             
             # Send WebSocket message for payment confirmation
-            try:
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    # Get order items for the message
-                    items = order.items.all()
-                    items_data = [{
-                        'product_name': item.product_name,
-                        'quantity': item.quantity,
-                        'price': str(item.product_price),
-                        'subtotal': str(item.subtotal)
-                    } for item in items]
-                    
-                    order.refresh_from_db()  # Refresh to get notes field
-                    order_data = {
-                        'order_id': order.id,
-                        'order_number': order.order_number,
-                        'status': order.status,
-                        'status_display': order.get_status_display(),
-                        'customer_name': order.customer_name,
-                        'customer_phone': order.customer_phone,
-                        'total_amount': str(order.total),
-                        'payment_method': order.payment_method,
-                        'created_at': order.created_at.isoformat(),
-                        'items': items_data,
-                        'notes': order.notes or '',  # Include delivery notes for real-time updates
-                        'payment_received': order.payment_received,
-                        'payment_received_at': order.payment_received_at.isoformat() if order.payment_received_at else None,
-                        'customer_received': order.customer_received,
-                        'customer_received_at': order.customer_received_at.isoformat() if order.customer_received_at else None,
-                    }
-                    
-                    async_to_sync(channel_layer.group_send)(
-                        'orders_updates',
-                        {
-                            'type': 'payment_confirmed',
-                            'order': order_data
-                        }
-                    )
-            except Exception as e:
-                # WebSocket failure shouldn't break payment confirmation
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f'Error sending WebSocket message: {e}')
+            send_order_event('payment_confirmed', order)
             
             # Send Telegram notification
             try:
@@ -1479,54 +1374,7 @@ def cod_confirm_api(request):
             order.save()
             
             # Send WebSocket message for payment confirmation
-            try:
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    # Get order items for the message
-                    items = order.items.all()
-                    items_data = [{
-                        'product_name': item.product_name,
-                        'quantity': item.quantity,
-                        'price': str(item.product_price),
-                        'subtotal': str(item.subtotal)
-                    } for item in items]
-                    
-                    order.refresh_from_db()  # Refresh to get notes field
-                    order_data = {
-                        'order_id': order.id,
-                        'order_number': order.order_number,
-                        'status': order.status,
-                        'status_display': order.get_status_display(),
-                        'customer_name': order.customer_name,
-                        'customer_phone': order.customer_phone,
-                        'customer_address': order.customer_address,
-                        'customer_province': order.customer_province,
-                        'total_amount': str(order.total),
-                        'payment_method': order.payment_method,
-                        'created_at': order.created_at.isoformat(),
-                        'items': items_data,
-                        'notes': order.notes or '',  # Include delivery notes for real-time updates
-                        'payment_received': order.payment_received,
-                        'payment_received_at': order.payment_received_at.isoformat() if order.payment_received_at else None,
-                        'customer_received': order.customer_received,
-                        'customer_received_at': order.customer_received_at.isoformat() if order.customer_received_at else None,
-                    }
-                    
-                    async_to_sync(channel_layer.group_send)(
-                        'orders_updates',
-                        {
-                            'type': 'payment_confirmed',
-                            'order': order_data
-                        }
-                    )
-            except Exception as e:
-                # WebSocket failure shouldn't break payment confirmation
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f'Error sending WebSocket message: {e}')
+            send_order_event('payment_confirmed', order)
             
             return JsonResponse({
                 'success': True,
@@ -1767,7 +1615,9 @@ def track_order_api(request):
                     'created_at': order.created_at.isoformat(),
                     'updated_at': order.updated_at.isoformat(),
                     'items': items_data
-                }
+                },
+                # Live status updates over /ws/track/ (no further lookups needed)
+                'tracking_token': make_tracking_token(order.order_number),
             })
             
         except Order.DoesNotExist:
@@ -273,6 +273,26 @@ else:
             }
         }
 
+# Cache invalidation bus (app/utils/cache_bus.py)
+# Per-process L1 caches are invalidated over Redis pub/sub. Leave the URL empty to run
+# in local mode (development): versions are then kept in the Django cache.
+CACHE_BUS_REDIS_URL = os.environ.get('CACHE_BUS_REDIS_URL', '' if DEBUG else os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'))
+CACHE_BUS_CHANNEL = 'madamda:cache_invalidation'
+CACHE_BUS_L1_TIMEOUT = int(os.environ.get('CACHE_BUS_L1_TIMEOUT', 60))  # seconds
+CACHE_BUS_L1_MAX_ENTRIES = int(os.environ.get('CACHE_BUS_L1_MAX_ENTRIES', 1000))  # keys per namespace
+
+# WebSocket connection accounting (app/utils/ws_connections.py)
+# Connection leases are shared through Redis so the limit holds across all Daphne workers.
+# Leave the URL empty to enforce the limit per process (development).
+WEBSOCKET_REDIS_URL = os.environ.get('WEBSOCKET_REDIS_URL', '' if DEBUG else os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'))
+WEBSOCKET_MAX_CONNECTIONS = int(os.environ.get('WEBSOCKET_MAX_CONNECTIONS', 100))
+# Customer order-tracking sockets (/ws/track/), limited separately
+WEBSOCKET_MAX_TRACKING_CONNECTIONS = int(os.environ.get('WEBSOCKET_MAX_TRACKING_CONNECTIONS', 1000))
+# Order events per connection are held this long and sent as one batch frame (0 = send immediately)
+WEBSOCKET_COALESCE_WINDOW = float(os.environ.get('WEBSOCKET_COALESCE_WINDOW', 0.075))  # seconds
+# Order events kept for replay on reconnect (Redis stream on WEBSOCKET_REDIS_URL, app/utils/event_log.py)
+EVENT_LOG_MAXLEN = int(os.environ.get('EVENT_LOG_MAXLEN', 10000))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -480,6 +500,11 @@ BAKONG_MERCHANT_NAME = os.environ.get('BAKONG_MERCHANT_NAME', 'MADAM DA')  # Mus
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')  # Set in .env file
 TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID', '')  # Set in .env file
 TELEGRAM_ENABLED = bool(TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID)
+# Delivery worker limits (python manage.py telegram_worker, app/telegram_delivery.py)
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', 30))  # messages/s for the bot
+TELEGRAM_CHAT_RATE = float(os.environ.get('TELEGRAM_CHAT_RATE', 1))  # messages/s per chat
+# Sent by Telegram in X-Telegram-Bot-Api-Secret-Token when set (registered by set_telegram_webhook)
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
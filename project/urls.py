@@ -56,6 +56,7 @@ urlpatterns += i18n_patterns(
     path('api/promo/validate/', views.validate_promo_code, name='validate_promo_code'),
     path('api/referral/check/', views.check_referral_code, name='check_referral_code'),
     path('api/loyalty/calculate/', views.calculate_loyalty_points, name='calculate_loyalty_points'),
+    path('api/cart/validate/', views.validate_cart, name='validate_cart'),
     path('api/khqr/create/', views.create_khqr, name='create_khqr'),
     path('api/khqr/check/', views.check_payment, name='check_payment'),
     path('api/order/create-on-payment/', views.create_order_on_payment, name='create_order_on_payment'),
@@ -77,9 +78,12 @@ urlpatterns += i18n_patterns(
     # Employee Dashboard
     path('employee/', employee_views.employee_dashboard, name='employee_dashboard'),
     path('employee/api/', employee_views.employee_dashboard_api, name='employee_dashboard_api'),
+    path('employee/api/column/<str:column>/', employee_views.employee_dashboard_column_api, name='employee_dashboard_column_api'),
+    path('employee/api/order/<str:order_number>/items/', employee_views.employee_order_items_api, name='employee_order_items_api'),
     path('employee/order/<str:order_number>/', employee_views.employee_order_detail, name='employee_order_detail'),
     path('employee/order/<str:order_number>/print/', employee_views.employee_print_qr, name='employee_print_qr'),
     path('api/employee/order/<str:order_number>/status/', employee_views.employee_update_status, name='employee_update_status'),
+    path('api/employee/orders/status/', employee_views.employee_bulk_update_status, name='employee_bulk_update_status'),
     path('api/employee/order/<str:order_number>/confirm-payment/', employee_views.employee_confirm_payment, name='employee_confirm_payment'),
     
     # Telegram Bot Webhook
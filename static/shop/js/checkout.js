@@ -556,6 +556,61 @@
         // Run cleanup on page load
         cleanupCartOnLoad();
         
+        // Revalidate the whole cart against current price/stock before generating payment
+        // Returns true if the cart can be paid for; otherwise syncs the cart and tells the customer why
+        async function revalidateCart() {
+            try {
+                const response = await fetch(API_URLS.validateCart, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRFToken': getCookie('csrftoken')
+                    },
+                    body: JSON.stringify({
+                        items: cart.map(item => ({ id: item.id, qty: item.qty, price: item.price, name: item.name }))
+                    })
+                });
+                
+                const data = await response.json();
+                if (!data.success) {
+                    // Don't block checkout if validation itself failed - order creation validates again
+                    return true;
+                }
+                if (data.valid) {
+                    return true;
+                }
+                
+                // Sync cart with current server values
+                const problems = [];
+                data.items.forEach(line => {
+                    if (line.valid) return;
+                    const cartItem = cart.find(item => String(item.id) === String(line.id));
+                    if (!cartItem) return;
+                    if (line.reason === 'price_changed') {
+                        cartItem.price = parseFloat(line.price);
+                        problems.push(`${line.name}: price is now $${parseFloat(line.price).toFixed(2)}`);
+                    } else if (line.reason === 'insufficient_stock') {
+                        cartItem.stock = line.available;
+                        problems.push(`${line.name}: only ${line.available} left`);
+                    } else if (line.reason === 'invalid_quantity') {
+                        cart.splice(cart.indexOf(cartItem), 1);
+                        problems.push(`${line.name}: removed (invalid quantity)`);
+                    } else {
+                        cartItem.stock = 0;
+                        problems.push(`${line.name}: no longer available`);
+                    }
+                });
+                
+                saveCart();
+                removeOutOfStockItems();
+                showToast(`⚠️ Your cart was updated. ${problems.join('; ')}`, 'warning', 6000);
+                return false;
+            } catch (error) {
+                console.warn('Cart validation failed, continuing to payment:', error);
+                return true;
+            }
+        }
+        
         function toggleTelegram(button) {
             const isChecked = button.getAttribute('data-state') === 'checked';
             button.setAttribute('data-state', isChecked ? 'unchecked' : 'checked');
@@ -598,6 +653,11 @@
                 return;
             }
             
+            // Reject stale carts before creating an order or a KHQR
+            if (!(await revalidateCart())) {
+                return;
+            }
+            
             const subtotal = cart.reduce((sum, item) => sum + (item.price * item.qty), 0);
             const discountAmount = window.promoDiscount || 0;
             // Round to 2 decimal places to avoid floating-point precision issues
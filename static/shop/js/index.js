@@ -472,18 +472,50 @@ function setHeroSlide(index) {
     const activeSlide = slides[heroSlideIndex];
     const activeVideo = activeSlide.querySelector('.hero-video');
     if (activeVideo) {
-        activeVideo.play().catch(e => console.log('Video autoplay prevented:', e));
+        playHeroVideo(activeVideo);
     }
 }
 
+// Hero videos ship with only a poster; sources are attached the first time the slide is shown
+function loadHeroVideo(video) {
+    if (video.dataset.loaded) return true;
+    
+    // Keep the poster on data-saver connections
+    const connection = navigator.connection || navigator.mozConnection || navigator.webkitConnection;
+    if (connection && (connection.saveData || /(^|-)2g$/.test(connection.effectiveType || ''))) {
+        return false;
+    }
+    
+    video.querySelectorAll('source[data-src]').forEach(source => {
+        source.src = source.dataset.src;
+        source.removeAttribute('data-src');
+    });
+    video.dataset.loaded = 'true';
+    video.load();
+    return true;
+}
+
+function playHeroVideo(video) {
+    if (!loadHeroVideo(video)) return;
+    video.play().catch(e => console.log('Video autoplay prevented:', e));
+}
+
 function startHeroCarousel() {
-    // Play video in active slide on page load
-    const activeSlide = document.querySelector('.hero-slide.active');
-    if (activeSlide) {
-        const activeVideo = activeSlide.querySelector('.hero-video');
-        if (activeVideo) {
-            activeVideo.play().catch(e => console.log('Video autoplay prevented:', e));
+    // Play video in active slide once the page has loaded (don't compete with critical resources)
+    const start = () => {
+        const activeSlide = document.querySelector('.hero-slide.active');
+        if (activeSlide) {
+            const activeVideo = activeSlide.querySelector('.hero-video');
+            if (activeVideo) {
+                playHeroVideo(activeVideo);
+            }
         }
+    };
+    
+    if (document.readyState === 'complete') {
+        start();
+    } else {
+        window.addEventListener('load', start, { once: true });
     }
 }
 